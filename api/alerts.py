@@ -0,0 +1,137 @@
+# alerts.py
+# Moteur d'alertes de stock (seuils min_threshold / max_threshold des produits)
+from datetime import datetime
+from models import db, Product, Inventory, ProductStock, Alert
+from events import queue_event
+
+ALERT_LOW_STOCK = 'low_stock'
+ALERT_OVERSTOCK = 'overstock'
+STOCK_ALERT_TYPES = (ALERT_LOW_STOCK, ALERT_OVERSTOCK)
+
+STATUS_OPEN = 'open'
+STATUS_RESOLVED = 'resolved'
+
+def evaluate_products(product_ids):
+    # Réévalue uniquement les produits touchés par une écriture d'inventaire, à partir des
+    # totaux de product_stock (à rafraîchir avant l'appel, voir stock.refresh_products).
+    # Ne fait pas de commit : l'appelant valide dans la même transaction.
+    # Lectures verrouillantes (FOR UPDATE, ignoré par SQLite) : deux écritures concurrentes sur un
+    # même produit évaluent ses alertes l'une après l'autre, et la seconde voit l'alerte ouverte par
+    # la première même sous REPEATABLE READ (MySQL)
+    product_ids = set(product_ids)
+    if not product_ids:
+        return [], []
+
+    products = lock_products(product_ids)
+    totals = dict(db.session.execute(
+        db.select(ProductStock.product_id, ProductStock.total_quantity)
+        .where(ProductStock.product_id.in_(product_ids))
+        .order_by(ProductStock.product_id)
+        .with_for_update()
+    ).all())
+
+    wanted = set()
+    for row in products:
+        total = totals.get(row.id, 0)
+        if total < row.min_threshold:
+            wanted.add((row.id, ALERT_LOW_STOCK))
+        elif total > row.max_threshold:
+            wanted.add((row.id, ALERT_OVERSTOCK))
+
+    open_alerts = Alert.query.filter(
+        Alert.product_id.in_(product_ids),
+        Alert.type.in_(STOCK_ALERT_TYPES),
+        Alert.status == STATUS_OPEN
+    ).order_by(Alert.id).with_for_update().all()
+
+    # Une seule alerte ouverte par produit et par type
+    opened = []
+    existing = {(alert.product_id, alert.type) for alert in open_alerts}
+    for product_id, alert_type in sorted(wanted - existing):
+        alert = Alert(product_id=product_id, type=alert_type, status=STATUS_OPEN)
+        db.session.add(alert)
+        opened.append(alert)
+
+    resolved = []
+    for alert in open_alerts:
+        if (alert.product_id, alert.type) not in wanted:
+            alert.status = STATUS_RESOLVED
+            resolved.append(alert)
+
+    db.session.flush()
+    for alert in opened + resolved:
+        queue_event('alert', alert_data(alert))
+    return opened, resolved
+
+def lock_products(product_ids):
+    # Verrou par produit, pris dans l'ordre de l'identifiant et avant product_stock, comme le fait
+    # déjà la mise à jour des seuils (UPDATE products) : pas d'interblocage entre les deux chemins
+    return db.session.execute(
+        db.select(Product.id, Product.min_threshold, Product.max_threshold)
+        .where(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+    ).all()
+
+def alert_data(alert):
+    return {
+        'id': alert.id,
+        'product_id': alert.product_id,
+        'sensor_id': alert.sensor_id,
+        'type': alert.type,
+        'message': alert.message,
+        'status': alert.status,
+        'created_at': alert.created_at
+    }
+
+def reconcile():
+    # Réconciliation complète en SQL ensembliste (quelques requêtes, quel que soit le catalogue)
+    totals = db.select(
+        Inventory.product_id,
+        db.func.sum(Inventory.quantity).label('total')
+    ).group_by(Inventory.product_id).subquery()
+    total = db.func.coalesce(totals.c.total, 0)
+    alerts = Alert.__table__
+    now = datetime.utcnow()
+
+    conditions = {
+        ALERT_LOW_STOCK: total < Product.min_threshold,
+        ALERT_OVERSTOCK: total > Product.max_threshold
+    }
+
+    opened = resolved = 0
+    for alert_type, condition in conditions.items():
+        breached = db.select(Product.id) \
+            .outerjoin(totals, totals.c.product_id == Product.id) \
+            .where(condition)
+
+        # Fermer les alertes dont le produit est revenu dans les seuils
+        result = db.session.execute(
+            db.update(alerts)
+            .where(alerts.c.type == alert_type,
+                   alerts.c.status == STATUS_OPEN,
+                   alerts.c.product_id.not_in(breached))
+            .values(status=STATUS_RESOLVED)
+        )
+        resolved += result.rowcount
+
+        # Ouvrir les alertes manquantes
+        already_open = db.select(alerts.c.id).where(
+            alerts.c.product_id == Product.id,
+            alerts.c.type == alert_type,
+            alerts.c.status == STATUS_OPEN
+        ).exists()
+        result = db.session.execute(
+            db.insert(alerts).from_select(
+                ['product_id', 'type', 'status', 'created_at'],
+                db.select(Product.id, db.literal(alert_type), db.literal(STATUS_OPEN), db.literal(now))
+                .outerjoin(totals, totals.c.product_id == Product.id)
+                .where(condition, ~already_open)
+            )
+        )
+        opened += result.rowcount
+
+    # Pas de détail par alerte : les clients rechargent la liste
+    queue_event('alerts.reconciled', {'opened': opened, 'resolved': resolved})
+    db.session.commit()
+    return {'opened': opened, 'resolved': resolved}
@@ -0,0 +1,340 @@
+# anomalies.py
+# Détection d'anomalies au fil de l'eau sur les mesures des capteurs : pour chaque capteur, une
+# moyenne et une variance exponentielles (EWMA), la dernière valeur et la vitesse de variation,
+# rangées dans des tableaux NumPy (un indice par capteur). Chaque lot de mesures met l'état à jour
+# en O(1) par mesure ; une alerte est ouverte au franchissement d'un seuil du type de capteur,
+# d'une vitesse maximale ou d'un écart anormal (z-score), et résolue au retour à la normale.
+# L'état est sauvegardé périodiquement dans un fichier .npz pour éviter de relire l'historique.
+import atexit
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Sensor, Alert
+from events import queue_event
+
+ALPHA = 0.05                # Poids d'une nouvelle mesure dans la moyenne et la variance
+WARMUP = 30                 # Mesures avant que le z-score soit pris en compte
+DEFAULT_Z_THRESHOLD = 4.0
+CHECKPOINT_INTERVAL = 60.0  # secondes
+CAPACITY_STEP = 1024
+
+ALERT_THRESHOLD = 'sensor_threshold'
+ALERT_RATE = 'sensor_rate'
+ALERT_ANOMALY = 'sensor_anomaly'
+# Bits de l'état "alerte ouverte" de chaque capteur
+KINDS = ((1, ALERT_THRESHOLD), (2, ALERT_RATE), (4, ALERT_ANOMALY))
+
+STATUS_OPEN = 'open'
+STATUS_RESOLVED = 'resolved'
+
+STATE_FIELDS = ('mean', 'var', 'last_value', 'last_ts', 'rate', 'count', 'open')
+LIMIT_FIELDS = ('low', 'high', 'max_rate')
+
+class AnomalyDetector:
+    # L'état est propre à chaque processus : avec plusieurs workers, un capteur dont les lots
+    # arrivent sur des workers différents a un état par worker (les alertes restent uniques,
+    # leur ouverture étant vérifiée en base)
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._stale_alerts = False  # Transaction annulée : alertes ouvertes à relire en base
+        self._slots = {}  # sensor_id -> indice dans les tableaux
+        self._saved_at = time.monotonic()
+        self._path = None
+        self._allocate(0)
+
+    def _allocate(self, capacity):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.last_value = np.zeros(capacity)
+        self.last_ts = np.zeros(capacity)
+        self.rate = np.zeros(capacity)           # Unités par minute
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.open = np.zeros(capacity, dtype=np.int8)
+        self.low = np.full(capacity, np.nan)     # Seuils du type de capteur (NaN = aucun)
+        self.high = np.full(capacity, np.nan)
+        self.max_rate = np.full(capacity, np.nan)
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity + CAPACITY_STEP)
+        for name in ('ids',) + STATE_FIELDS + LIMIT_FIELDS:
+            old = getattr(self, name)
+            fill = np.nan if name in LIMIT_FIELDS else 0
+            new = np.full(new_capacity, fill, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    def _set_limits(self, slots_by_type):
+        thresholds = current_app.config.get('SENSOR_THRESHOLDS') or {}
+        for sensor_type, slots in slots_by_type.items():
+            limits = thresholds.get(sensor_type, {})
+            self.low[slots] = limits.get('min', np.nan)
+            self.high[slots] = limits.get('max', np.nan)
+            self.max_rate[slots] = limits.get('max_rate', np.nan)
+
+    def _slots_for(self, sensor_ids):
+        # Indices des capteurs, avec allocation et seuils pour les nouveaux (une requête)
+        missing = [sensor_id for sensor_id in set(sensor_ids) if sensor_id not in self._slots]
+        if missing:
+            first = len(self._slots)
+            self._grow(first + len(missing))
+            types = dict(db.session.execute(
+                db.select(Sensor.id, Sensor.type).where(Sensor.id.in_(missing))
+            ).all())
+            slots_by_type = {}
+            for offset, sensor_id in enumerate(sorted(missing)):
+                slot = first + offset
+                self._slots[sensor_id] = slot
+                self.ids[slot] = sensor_id
+                slots_by_type.setdefault(types.get(sensor_id), []).append(slot)
+            self._set_limits(slots_by_type)
+        return np.fromiter((self._slots[sensor_id] for sensor_id in sensor_ids), dtype=np.int64,
+                           count=len(sensor_ids))
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._path = current_app.config.get('ANOMALY_CHECKPOINT')
+            if self._path and os.path.exists(self._path):
+                self._restore(self._path)
+            self._sync_open_alerts()
+            self._loaded = True
+            if self._path:
+                atexit.register(self.save)
+
+    def _restore(self, path):
+        try:
+            with np.load(path) as data:
+                ids = data['ids']
+                self._allocate(len(ids))
+                self.ids[:] = ids
+                for name in STATE_FIELDS:
+                    getattr(self, name)[:] = data[name]
+        except (OSError, KeyError, ValueError):
+            current_app.logger.warning("Sauvegarde des anomalies illisible : %s", path, exc_info=True)
+            self._allocate(0)
+            ids = []
+        self._slots = {int(sensor_id): slot for slot, sensor_id in enumerate(ids)}
+        # Seuils relus depuis la configuration (elle a pu changer)
+        types = dict(db.session.execute(
+            db.select(Sensor.id, Sensor.type).where(Sensor.id.in_(list(self._slots)))
+        ).all()) if self._slots else {}
+        slots_by_type = {}
+        for sensor_id, slot in self._slots.items():
+            slots_by_type.setdefault(types.get(sensor_id), []).append(slot)
+        self._set_limits(slots_by_type)
+
+    def _sync_open_alerts(self):
+        # Les alertes ouvertes en base font foi (résolues à la main, autre worker...)
+        self.open[:] = 0
+        rows = db.session.execute(
+            db.select(Alert.sensor_id, Alert.type)
+            .where(Alert.sensor_id.isnot(None), Alert.status == STATUS_OPEN)
+        ).all()
+        bits = {alert_type: bit for bit, alert_type in KINDS}
+        sensor_ids = [sensor_id for sensor_id, _ in rows]
+        if not sensor_ids:
+            return
+        slots = self._slots_for(sensor_ids)
+        for slot, (_, alert_type) in zip(slots, rows):
+            self.open[slot] |= bits.get(alert_type, 0)
+
+    def save(self, path=None):
+        path = path or self._path
+        if not path or not self._slots:
+            return
+        with self._lock:
+            size = len(self._slots)
+            arrays = {'ids': self.ids[:size]}
+            arrays.update({name: getattr(self, name)[:size] for name in STATE_FIELDS})
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            partial = path + '.partial'
+            with open(partial, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(partial, path)
+            self._saved_at = time.monotonic()
+
+    def observe(self, rows):
+        # rows : mesures insérées (sensor_id, numeric_value, saved_at) ; appelé dans la transaction
+        # de l'insertion, les alertes sont donc validées avec les mesures. Valeurs non finies ignorées
+        rows = [row for row in rows if row['numeric_value'] is not None and math.isfinite(row['numeric_value'])]
+        if not rows:
+            return []
+        self.ensure_loaded()
+        with self._lock:
+            if self._stale_alerts:
+                self._stale_alerts = False
+                self._sync_open_alerts()
+            slots = self._slots_for([row['sensor_id'] for row in rows])
+            values = np.fromiter((row['numeric_value'] for row in rows), dtype=np.float64, count=len(rows))
+            stamps = np.fromiter((row['saved_at'].replace(tzinfo=timezone.utc).timestamp() for row in rows), dtype=np.float64,
+                                 count=len(rows))
+            touched = np.unique(slots)
+            saved = db.session.info.setdefault('anomalies_saved', {})
+            for slot in touched.tolist():
+                if slot not in saved:
+                    saved[slot] = [tuple(getattr(self, name)[slot] for name in STATE_FIELDS), None]
+            transitions = self._update(slots, values, stamps)
+            for slot in touched.tolist():
+                saved[slot][1] = self.count[slot]
+            changes = self._apply_alerts(transitions)
+        return changes
+
+    def checkpoint(self):
+        # Après le commit seulement : la sauvegarde ne contient jamais de mesures annulées
+        if self._path and time.monotonic() - self._saved_at > CHECKPOINT_INTERVAL:
+            self.save()
+
+    def _update(self, slots, values, stamps):
+        # Les mesures d'un même capteur doivent être appliquées dans l'ordre : elles sont traitées
+        # par tours, chaque tour prenant au plus une mesure par capteur (calcul vectoriel)
+        order = np.lexsort((stamps, slots))
+        slots, values, stamps = slots[order], values[order], stamps[order]
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+        rank = np.arange(len(slots)) - np.repeat(starts, np.diff(np.r_[starts, len(slots)]))
+        z_threshold = current_app.config.get('ANOMALY_Z_THRESHOLD', DEFAULT_Z_THRESHOLD)
+
+        transitions = []
+        for r in range(int(rank.max()) + 1):
+            mask = rank == r
+            s, x, ts = slots[mask], values[mask], stamps[mask]
+            count, mean, var = self.count[s], self.mean[s], self.var[s]
+
+            # Indicateurs calculés avec l'état précédent
+            seen = count > 0
+            dt = ts - self.last_ts[s]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rate = np.where(seen & (dt > 0), (x - self.last_value[s]) / dt * 60.0, 0.0)
+                std = np.sqrt(var)
+                z = np.where((count >= WARMUP) & (std > 0), np.abs(x - mean) / std, 0.0)
+            state = (np.where((x < self.low[s]) | (x > self.high[s]), 1, 0)
+                     | np.where(np.abs(rate) > self.max_rate[s], 2, 0)
+                     | np.where(z > z_threshold, 4, 0)).astype(np.int8)
+
+            # Mise à jour EWMA (moyenne et variance) ; première mesure : initialisation
+            diff = x - mean
+            increment = ALPHA * diff
+            self.mean[s] = np.where(seen, mean + increment, x)
+            self.var[s] = np.where(seen, (1 - ALPHA) * (var + diff * increment), 0.0)
+            self.last_value[s] = x
+            self.last_ts[s] = ts
+            self.rate[s] = rate
+            self.count[s] = count + 1
+
+            changed = np.flatnonzero(state != self.open[s])
+            for i in changed:
+                transitions.append((int(self.ids[s[i]]), int(self.open[s[i]]), int(state[i]),
+                                    float(x[i]), float(rate[i]), float(z[i]), float(mean[i])))
+            self.open[s] = state
+        return transitions
+
+    def _apply_alerts(self, transitions):
+        if not transitions:
+            return []
+        # État final par capteur et par type sur le lot, puis comparaison avec les alertes ouvertes
+        wanted, details = {}, {}
+        for sensor_id, before, after, value, rate, z, mean in transitions:
+            for bit, alert_type in KINDS:
+                if (before ^ after) & bit:
+                    wanted[(sensor_id, alert_type)] = bool(after & bit)
+                    if after & bit:
+                        details[(sensor_id, alert_type)] = describe(alert_type, value, rate, z, mean)
+
+        sensor_ids = {sensor_id for sensor_id, _ in wanted}
+        open_alerts = {(alert.sensor_id, alert.type): alert for alert in Alert.query.filter(
+            Alert.sensor_id.in_(sensor_ids),
+            Alert.type.in_([alert_type for _, alert_type in KINDS]),
+            Alert.status == STATUS_OPEN
+        )}
+        changes = []
+        for key, should_be_open in sorted(wanted.items()):
+            alert = open_alerts.get(key)
+            if should_be_open and alert is None:
+                alert = Alert(sensor_id=key[0], type=key[1], status=STATUS_OPEN, message=details[key])
+                db.session.add(alert)
+                changes.append(alert)
+            elif not should_be_open and alert is not None:
+                alert.status = STATUS_RESOLVED
+                changes.append(alert)
+        db.session.flush()
+        for alert in changes:
+            queue_event('alert', {
+                'id': alert.id,
+                'sensor_id': alert.sensor_id,
+                'type': alert.type,
+                'status': alert.status,
+                'message': alert.message,
+                'created_at': alert.created_at
+            })
+        return changes
+
+    def stats(self, sensor_id):
+        slot = self._slots.get(sensor_id)
+        if slot is None or not self.count[slot]:
+            return None
+        return {
+            'count': int(self.count[slot]),
+            'mean': float(self.mean[slot]),
+            'std': float(np.sqrt(self.var[slot])),
+            'last_value': float(self.last_value[slot]),
+            'last_at': datetime.utcfromtimestamp(self.last_ts[slot]).isoformat(),
+            'rate_per_minute': float(self.rate[slot]),
+            'open_alerts': [alert_type for bit, alert_type in KINDS if self.open[slot] & bit]
+        }
+
+    def undo(self, saved):
+        # Transaction annulée : état des capteurs remis à sa valeur d'avant la transaction (un lot
+        # rejoué n'est pas compté deux fois). Un capteur mis à jour depuis par une autre transaction
+        # (compteur différent) garde son état, faute de pouvoir retirer les seules mesures annulées
+        with self._lock:
+            for slot, (values, count) in saved.items():
+                if self.count[slot] != count:
+                    continue
+                for name, value in zip(STATE_FIELDS, values):
+                    getattr(self, name)[slot] = value
+            self._stale_alerts = True
+
+    def forget(self, sensor_id):
+        # Capteur supprimé : l'indice est conservé mais son état est remis à zéro
+        slot = self._slots.get(sensor_id)
+        if slot is not None:
+            with self._lock:
+                for name in STATE_FIELDS:
+                    getattr(self, name)[slot] = 0
+
+def describe(alert_type, value, rate, z, mean):
+    if alert_type == ALERT_THRESHOLD:
+        return f'Valeur {value:g} hors des seuils'
+    if alert_type == ALERT_RATE:
+        return f'Variation de {rate:+.3g} par minute'
+    return f'Valeur {value:g} à {z:.1f} écarts-types de la moyenne ({mean:.3g})'
+
+detector = AnomalyDetector()
+
+@event.listens_for(Session, 'after_commit')
+def forget_observed(session):
+    if session.info.pop('anomalies_saved', None):
+        detector.checkpoint()
+
+@event.listens_for(Session, 'after_transaction_end')
+def resync_after_rollback(session, transaction):
+    # Transaction terminée sans commit : rollback, ou session fermée après une erreur (teardown de
+    # la requête, sans événement after_rollback). Alertes ouvertes relues en base au lot suivant
+    if transaction.parent is not None:
+        return
+    saved = session.info.pop('anomalies_saved', None)
+    if saved:
+        detector.undo(saved)
@@ -1,45 +1,83 @@
 # app.py
 #Alertes
 #Alertes 2
-from flask import Flask, jsonify, request
-from flask_sqlalchemy import SQLAlchemy
-from models import db, User, Product, Category, Zone, Inventory, Sensor, SensorData, Alert, Order, OrderPrediction
+from flask import Blueprint, jsonify, request, Response, stream_with_context, send_file
+from models import db, User, Product, Category, Zone, Inventory, ProductStock, Sensor, SensorData, Alert, Order, OrderPrediction, Job
+from alerts import evaluate_products, reconcile as reconcile_alerts
+from inventory import parse_lines, apply_lines, after_inventory_write
+import stock
+from events import bus, queue_event, format_event, parse_event_id
+import orders
+import migrations
+import export
+import retention
+import jobs
+import ledger
+from rfid import tag_index, parse_scans, process_scans
+from search import search_index, DEFAULT_LIMIT as SEARCH_LIMIT, MAX_LIMIT as MAX_SEARCH_LIMIT
+from cache import reference_cache, cached_response
+from principals import current_principal
+from passwords import HashingPoolBusy, hash_password_pooled, verify_password_pooled, needs_rehash
+from sensors import parse_readings, parse_timestamp, ingest_readings, get_series
+import json
 from datetime import datetime
 from functools import wraps
 from flask_jwt_extended import verify_jwt_in_request, get_jwt 
-from flask_cors import CORS
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy.exc import OperationalError, ProgrammingError
 
 # login
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from datetime import timedelta
-from werkzeug.security import generate_password_hash
-from flask_jwt_extended import verify_jwt_in_request, get_jwt
 
-# Initialisation de l'application
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "http://localhost:4200"}})  # Remplacez par l'URL de votre frontend
+# Routes de l'API, enregistrées par create_app
+api = Blueprint('api', __name__)
 
+def create_app(config=None):
+    # config : dictionnaire ou objet de configuration surchargeant factory.Config
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+    from factory import create_base_app
+    from metrics import init_metrics
+    from jobs import init_jobs
+    from writebehind import init_write_behind
 
-# Configuration JWT après l'initialisation de l'application
-app.config['JWT_SECRET_KEY'] = 'KEY00155'  # Changez ceci en production!
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)  # Token valide pour 24 heures
-jwt = JWTManager(app)
+    app = create_base_app(config)
+    CORS(app, resources={r"/api/*": {"origins": app.config['CORS_ORIGINS']}})
+    JWTManager(app)
+    # Métriques par route exposées sur /metrics
+    init_metrics(app)
+    # Exécution des tâches longues en arrière-plan
+    init_jobs(app)
+    # Colonnes très sollicitées écrites par lots (writebehind.py)
+    init_write_behind(app)
+    app.register_blueprint(api)
+    warm_up(app)
+    return app
 
-# Configuration de la base de données MySQL
-app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql+pymysql://root@localhost/stock_genius'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'KEY00155'  # Important pour la sécurité
-
-# Initialisation de la base de données avec l'application
-db.init_app(app)
+def warm_up(app):
+    # Index en mémoire chargés au démarrage (partagés en copie sur écriture avec gunicorn --preload) ;
+    # si la base n'est pas prête, ils seront chargés à la première lecture
+    with app.app_context():
+        for index in (tag_index, search_index):
+            try:
+                index.load()
+            except (OperationalError, ProgrammingError) as exc:
+                # Base neuve ou migrations en attente (table absente) : cas normal avant /init-db
+                app.logger.warning("Index %s non chargé au démarrage (schéma absent ou incomplet : %s)",
+                                   type(index).__name__, exc.orig)
+            except Exception:
+                app.logger.warning("Index %s non chargé au démarrage", type(index).__name__, exc_info=True)
+            finally:
+                db.session.remove()
 
 # Route pour créer les tables dans la base de données 
-@app.route('/init-db')
+@api.route('/init-db')
 def init_db():
-    with app.app_context():
-        db.drop_all()
-        db.create_all()
-    return jsonify({"message": "Base de données initialisée avec succès!"})
+    # Applique les migrations en attente sans toucher aux données existantes
+    applied = migrations.upgrade()
+    return jsonify({"message": "Base de données initialisée avec succès!", "migrations": applied})
 
 # Verification role
 def role_required(roles):
@@ -55,8 +93,50 @@ def role_required(roles):
         return decorator
     return wrapper
 
+def current_user_id():
+    # Utilisateur du jeton s'il y en a un (routes ouvertes), pour le journal d'inventaire ;
+    # un jeton expiré ou invalide ne bloque pas la route, le mouvement reste anonyme
+    try:
+        verify_jwt_in_request(optional=True)
+    except (JWTExtendedException, PyJWTError):
+        return None
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
+
+# Pagination
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+def is_true(value):
+    return value is not None and value.lower() in ('1', 'true', 'yes', 'on')
+
+def parse_limit(default=DEFAULT_PAGE_SIZE):
+    # Lit le paramètre limit et le borne à MAX_PAGE_SIZE
+    raw = request.args.get('limit')
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('Paramètre limit invalide')
+    if limit < 1:
+        raise ValueError('Paramètre limit invalide')
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_cursor(raw, size):
+    # Curseur de la forme "12" ou "12:3" (valeurs de la dernière ligne reçue)
+    if not raw:
+        return None
+    try:
+        values = tuple(int(part) for part in raw.split(':'))
+    except ValueError:
+        raise ValueError('Curseur invalide')
+    if len(values) != size:
+        raise ValueError('Curseur invalide')
+    return values
+
 # Route d'authentification - login
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
 def login():
     if not request.is_json:
         return jsonify({"error": "Missing JSON in request"}), 400
@@ -69,8 +149,16 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     
-    if not user or not user.verify_password(password):
-        return jsonify({"error": "Invalid username or password"}), 401
+    try:
+        if not user or not verify_password_pooled(user.password_hash, password):
+            return jsonify({"error": "Invalid username or password"}), 401
+        
+        # Paramètres de hachage modifiés : on re-hache de façon transparente
+        if needs_rehash(user.password_hash):
+            user.password_hash = hash_password_pooled(password)
+            db.session.commit()
+    except HashingPoolBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503
     
     # Création du token avec les informations utiles
     access_token = create_access_token(
@@ -94,7 +182,7 @@ def login():
     }), 200
 
 # Route pour s'enregistrer - register
-@app.route('/api/auth/register', methods=['POST'])
+@api.route('/api/auth/register', methods=['POST'])
 def register():
     if not request.is_json:
         return jsonify({"error": "Missing JSON in request"}), 400
@@ -121,7 +209,10 @@ def register():
         role=role,
         rfid_card=request.json.get('rfid_card')
     )
-    new_user.password = password  # Utilise le setter pour hasher le mot de passe
+    try:
+        new_user.password_hash = hash_password_pooled(password)
+    except HashingPoolBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503
     
     db.session.add(new_user)
     db.session.commit()
@@ -148,21 +239,22 @@ def register():
     }), 201
 
 # Route protégée d'exemple
-@app.route('/api/protected', methods=['GET'])
+@api.route('/api/protected', methods=['GET'])
 @jwt_required()
 def protected():
-    # Récupérer l'identité de l'utilisateur à partir du token JWT
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    # Utilisateur courant servi par le cache des principaux (pas de requête SQL en régime établi)
+    user = current_principal()
+    if user is None:
+        return jsonify({"error": "User not found"}), 404
     
     return jsonify({
         'message': f'Hello {user.username}! This is a protected route.',
-        'user_id': current_user_id,
+        'user_id': get_jwt_identity(),
         'role': user.role
     }), 200
 
 # Routes pour les utilisateurs
-@app.route('/api/users', methods=['GET'])
+@api.route('/api/users', methods=['GET'])
 def get_users():
     users = User.query.all()
     result = []
@@ -177,7 +269,7 @@ def get_users():
     return jsonify(result)
 
 # Modifier la route de création d'utilisateur pour utiliser le hash de mot de passe
-@app.route('/api/users', methods=['POST'])
+@api.route('/api/users', methods=['POST'])
 def create_user():
     data = request.get_json()
     
@@ -194,7 +286,10 @@ def create_user():
         role=data['role'],
         rfid_card=data.get('rfid_card')
     )
-    new_user.password = data['password']  # Utilise le setter pour hasher le mot de passe
+    try:
+        new_user.password_hash = hash_password_pooled(data['password'])
+    except HashingPoolBusy:
+        return jsonify({'error': 'Serveur occupé, veuillez réessayer'}), 503
     
     db.session.add(new_user)
     db.session.commit()
@@ -211,24 +306,108 @@ def create_user():
 
 
 # Routes pour les produits
-@app.route('/api/products', methods=['GET'])
+# Champs exposés par le catalogue (utilisables dans ?fields=)
+PRODUCT_FIELDS = {
+    'id': Product.id,
+    'designation': Product.designation,
+    'description': Product.description,
+    'category_id': Product.category_id,
+    'category': Category.name,
+    'min_threshold': Product.min_threshold,
+    'max_threshold': Product.max_threshold,
+    'rfid_tag': Product.rfid_tag
+}
+DEFAULT_PRODUCT_FIELDS = ['id', 'designation', 'description', 'category',
+                          'min_threshold', 'max_threshold', 'rfid_tag']
+STREAM_CHUNK_SIZE = 1000
+
+@api.route('/api/products', methods=['GET'])
 def get_products():
-    products = Product.query.all()
-    result = []
-    for product in products:
-        product_data = {
-            'id': product.id,
-            'designation': product.designation,
-            'description': product.description,
-            'category': product.category.name,
-            'min_threshold': product.min_threshold,
-            'max_threshold': product.max_threshold,
-            'rfid_tag': product.rfid_tag
-        }
-        result.append(product_data)
-    return jsonify(result)
+    # Projection des champs demandés
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Champs inconnus : {', '.join(unknown)}"}), 400
+    else:
+        fields = DEFAULT_PRODUCT_FIELDS
+
+    stream = request.args.get('stream')
+    if stream not in (None, 'json', 'ndjson'):
+        return jsonify({'error': 'Paramètre stream invalide (json ou ndjson)'}), 400
+
+    try:
+        limit = parse_limit(default=None)
+        after = parse_cursor(request.args.get('after'), 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # La jointure sur la catégorie est faite en SQL ; l'id sert de curseur
+    columns = [Product.id.label('_cursor')] + [PRODUCT_FIELDS[f].label(f) for f in fields]
+    query = db.select(*columns).join(Category, Product.category_id == Category.id)
+    if after:
+        query = query.where(Product.id > after[0])
+    query = query.order_by(Product.id)
+
+    if stream:
+        if limit:
+            query = query.limit(limit)
+        return Response(stream_with_context(stream_products(query, fields, stream)),
+                        mimetype='application/x-ndjson' if stream == 'ndjson' else 'application/json')
+
+    if limit:
+        query = query.limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1]._cursor)
+
+    result = [{f: getattr(row, f) for f in fields} for row in rows]
+    response = jsonify(result)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def stream_products(query, fields, fmt):
+    # Curseur côté serveur : les lignes sont lues et envoyées par paquets
+    result = db.session.execute(
+        query.execution_options(stream_results=True, yield_per=STREAM_CHUNK_SIZE)
+    )
+    try:
+        if fmt == 'json':
+            yield '['
+        first = True
+        for partition in result.partitions():
+            lines = [json.dumps({f: getattr(row, f) for f in fields}, default=str)
+                     for row in partition]
+            if fmt == 'ndjson':
+                yield '\n'.join(lines) + '\n'
+            else:
+                yield ('' if first else ',') + ','.join(lines)
+            first = False
+        if fmt == 'json':
+            yield ']'
+    finally:
+        result.close()
+
+@api.route('/api/products/search', methods=['GET'])
+def search_products():
+    # Recherche par mots ou débuts de mots dans la désignation, la catégorie et la description
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Paramètre q requis'}), 400
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'Paramètre limit invalide'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Paramètre limit invalide'}), 400
+    search_index.ensure_current()
+    return jsonify(search_index.search(query, limit))
 
-@app.route('/api/products', methods=['POST'])
+@api.route('/api/products', methods=['POST'])
 def create_product():
     data = request.get_json()
     
@@ -247,7 +426,10 @@ def create_product():
     )
     
     db.session.add(new_product)
+    reference_cache.invalidate('products')
     db.session.commit()
+    tag_index.update(new_product.id, new_product.rfid_tag)
+    search_index.update(new_product.id, new_product.designation, category.name, new_product.description)
     
     return jsonify({
         'message': 'Produit créé avec succès',
@@ -260,8 +442,11 @@ def create_product():
     }), 201
 
 # Routes pour les catégories
-@app.route('/api/categories', methods=['GET'])
+@api.route('/api/categories', methods=['GET'])
 def get_categories():
+    return cached_response('categories', load_categories)
+
+def load_categories():
     categories = Category.query.all()
     result = []
     for category in categories:
@@ -271,9 +456,9 @@ def get_categories():
             'description': category.description
         }
         result.append(category_data)
-    return jsonify(result)
+    return result
 
-@app.route('/api/categories', methods=['POST'])
+@api.route('/api/categories', methods=['POST'])
 def create_category():
     data = request.get_json()
     
@@ -283,6 +468,7 @@ def create_category():
     )
     
     db.session.add(new_category)
+    reference_cache.invalidate('categories')
     db.session.commit()
     
     return jsonify({
@@ -294,7 +480,7 @@ def create_category():
         }
     }), 201
 #Supprimer un produit
-@app.route('/api/products/<int:product_id>', methods=['DELETE'])
+@api.route('/api/products/<int:product_id>', methods=['DELETE'])
 @jwt_required()
 def delete_product(product_id):
     # Vérifier si le produit existe
@@ -302,13 +488,18 @@ def delete_product(product_id):
     if not product:
         return jsonify({'error': 'Produit non trouvé'}), 404
     
-    # Supprimer le produit
+    # Supprimer le produit, ses alertes et son total de stock
+    Alert.query.filter_by(product_id=product_id).delete()
+    ProductStock.query.filter_by(product_id=product_id).delete()
     db.session.delete(product)
+    reference_cache.invalidate('products')
     db.session.commit()
+    tag_index.remove(product_id)
+    search_index.remove(product_id)
     
     return jsonify({'message': 'Produit supprimé avec succès'}), 200
 #Modifier un Produit
-@app.route('/api/products/<int:product_id>', methods=['PUT'])
+@api.route('/api/products/<int:product_id>', methods=['PUT'])
 @jwt_required()
 def update_product(product_id):
     # Vérifier si le produit existe
@@ -333,8 +524,16 @@ def update_product(product_id):
         if not category:
             return jsonify({'error': 'Catégorie non trouvée'}), 404
     
+    # Les seuils ont changé : réévaluer les alertes de stock du produit
+    if 'min_threshold' in data or 'max_threshold' in data:
+        evaluate_products([product.id])
+    
     # Sauvegarder les modifications dans la base de données
+    reference_cache.invalidate('products')
     db.session.commit()
+    tag_index.update(product.id, product.rfid_tag)
+    category_name = Category.query.get(product.category_id).name
+    search_index.update(product.id, product.designation, category_name, product.description)
     
     return jsonify({
         'message': 'Produit mis à jour avec succès',
@@ -342,15 +541,23 @@ def update_product(product_id):
             'id': product.id,
             'designation': product.designation,
             'description': product.description,
-            'category': Category.query.get(product.category_id).name,
+            'category': category_name,
             'min_threshold': product.min_threshold,
             'max_threshold': product.max_threshold,
             'rfid_tag': product.rfid_tag
         }
     }), 200
+# Versions des données de référence (détection d'un cache périmé entre workers)
+@api.route('/api/cache/versions', methods=['GET'])
+def get_cache_versions():
+    return jsonify(reference_cache.versions())
+
 # Routes pour les zones
-@app.route('/api/zones', methods=['GET'])
+@api.route('/api/zones', methods=['GET'])
 def get_zones():
+    return cached_response('zones', load_zones)
+
+def load_zones():
     zones = Zone.query.all()
     result = []
     for zone in zones:
@@ -360,9 +567,9 @@ def get_zones():
             'description': zone.description
         }
         result.append(zone_data)
-    return jsonify(result)
+    return result
 
-@app.route('/api/zones', methods=['POST'])
+@api.route('/api/zones', methods=['POST'])
 def create_zone():
     data = request.get_json()
     
@@ -372,6 +579,7 @@ def create_zone():
     )
     
     db.session.add(new_zone)
+    reference_cache.invalidate('zones')
     db.session.commit()
     
     return jsonify({
@@ -384,23 +592,94 @@ def create_zone():
     }), 201
 
 # Routes pour l'inventaire
-@app.route('/api/inventory', methods=['GET'])
+@api.route('/api/inventory', methods=['GET'])
 def get_inventory():
-    inventory_items = Inventory.query.all()
+    zone_id = request.args.get('zone_id', type=int)
+    product_id = request.args.get('product_id', type=int)
+
+    # as_of : état passé reconstruit depuis le journal des mouvements (instantané le plus proche
+    # + mouvements suivants), sinon la table inventory
+    as_of = None
+    if request.args.get('as_of'):
+        try:
+            as_of = parse_timestamp(request.args['as_of'])
+        except ValueError:
+            return jsonify({'error': 'Paramètre as_of invalide'}), 400
+        try:
+            state, replayed = ledger.state_as_of(as_of, product_id, zone_id)
+        except ledger.LedgerError as e:
+            return jsonify({'error': e.message}), e.status_code
+        source = state.subquery()
+        last_update_at = db.literal(None)
+    else:
+        source = Inventory.__table__
+        last_update_at = source.c.last_update_at
+
+    # Une seule requête avec jointures (pas de chargement paresseux par ligne)
+    query = db.session.query(
+        source.c.product_id,
+        Product.designation,
+        source.c.zone_id,
+        Zone.name,
+        source.c.quantity,
+        last_update_at.label('last_update_at')
+    ).join(Product, source.c.product_id == Product.id) \
+     .join(Zone, source.c.zone_id == Zone.id)
+
+    # Filtres optionnels
+    if zone_id is not None:
+        query = query.filter(source.c.zone_id == zone_id)
+    if product_id is not None:
+        query = query.filter(source.c.product_id == product_id)
+    if is_true(request.args.get('below_min')):
+        query = query.filter(source.c.quantity < Product.min_threshold)
+
+    # Pagination par curseur sur (product_id, zone_id), activée par limit ou after
+    paginate = 'limit' in request.args or 'after' in request.args
+    if paginate:
+        try:
+            limit = parse_limit()
+            after = parse_cursor(request.args.get('after'), 2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if after:
+            query = query.filter(db.or_(
+                source.c.product_id > after[0],
+                db.and_(source.c.product_id == after[0], source.c.zone_id > after[1])
+            ))
+
+    query = query.order_by(source.c.product_id, source.c.zone_id)
+    if paginate:
+        query = query.limit(limit + 1)
+    rows = query.all()
+
+    next_cursor = None
+    if paginate and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f'{rows[-1].product_id}:{rows[-1].zone_id}'
+
     result = []
-    for item in inventory_items:
+    for row in rows:
         item_data = {
-            'product_id': item.product_id,
-            'product_name': item.product.designation,
-            'zone_id': item.zone_id,
-            'zone_name': item.zone.name,
-            'quantity': item.quantity,
-            'last_update_at': item.last_update_at
+            'product_id': row.product_id,
+            'product_name': row.designation,
+            'zone_id': row.zone_id,
+            'zone_name': row.name,
+            'quantity': row.quantity,
+            'last_update_at': row.last_update_at
         }
+        if as_of is not None:
+            del item_data['last_update_at']
         result.append(item_data)
-    return jsonify(result)
 
-@app.route('/api/inventory', methods=['POST'])
+    response = jsonify(result)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if as_of is not None:
+        response.headers['X-Movements-Replayed'] = str(replayed)
+    return response
+
+@api.route('/api/inventory', methods=['POST'])
 def create_inventory():
     data = request.get_json()
     
@@ -412,16 +691,24 @@ def create_inventory():
     if not zone:
         return jsonify({'error': 'Zone non trouvée'}), 404
     
-    # Vérifier si l'entrée d'inventaire existe déjà
+    # Vérifier si l'entrée d'inventaire existe déjà (ligne verrouillée : variation exacte dans le journal)
     existing_inventory = Inventory.query.filter_by(
         product_id=data['product_id'],
         zone_id=data['zone_id']
-    ).first()
+    ).with_for_update().first()
+    user_id = current_user_id()
     
     if existing_inventory:
         # Mettre à jour l'inventaire existant
+        previous = existing_inventory.quantity
         existing_inventory.quantity = data['quantity']
         existing_inventory.last_update_at = datetime.utcnow()
+        db.session.flush()
+        ledger.record([ledger.movement(existing_inventory.product_id, existing_inventory.zone_id,
+                                       existing_inventory.quantity - previous, 'adjustment', user_id)])
+        after_inventory_write({(existing_inventory.product_id, existing_inventory.zone_id):
+                               existing_inventory.quantity - previous})
+        queue_event('inventory', {'lines': [inventory_line(existing_inventory)]})
         db.session.commit()
         return jsonify({
             'message': 'Inventaire mis à jour avec succès',
@@ -440,6 +727,11 @@ def create_inventory():
         )
         
         db.session.add(new_inventory)
+        db.session.flush()
+        ledger.record([ledger.movement(new_inventory.product_id, new_inventory.zone_id,
+                                       new_inventory.quantity, 'adjustment', user_id)])
+        after_inventory_write({(new_inventory.product_id, new_inventory.zone_id): new_inventory.quantity})
+        queue_event('inventory', {'lines': [inventory_line(new_inventory)]})
         db.session.commit()
         
         return jsonify({
@@ -451,7 +743,425 @@ def create_inventory():
             }
         }), 201
 
+def inventory_line(item):
+    return {
+        'product_id': item.product_id,
+        'zone_id': item.zone_id,
+        'quantity': item.quantity,
+        'last_update_at': item.last_update_at
+    }
+
+@api.route('/api/inventory/batch', methods=['POST'])
+def create_inventory_batch():
+    try:
+        lines = parse_lines(request.get_json())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Tout le lot est appliqué dans une seule transaction
+    result = apply_lines(lines, current_user_id())
+    return jsonify(result), 200
+
+# Routes pour les totaux de stock
+@api.route('/api/stock/summary', methods=['GET'])
+def get_stock_summary():
+    # Lecture directe de product_stock, sans agrégation sur l'inventaire
+    query = db.select(
+        Product.id,
+        Product.designation,
+        Product.min_threshold,
+        Product.max_threshold,
+        db.func.coalesce(ProductStock.total_quantity, 0).label('total_quantity'),
+        db.func.coalesce(ProductStock.zone_count, 0).label('zone_count'),
+        ProductStock.last_update_at
+    ).outerjoin(ProductStock, ProductStock.product_id == Product.id)
+
+    product_id = request.args.get('product_id', type=int)
+    if product_id is not None:
+        query = query.where(Product.id == product_id)
+    try:
+        limit = parse_limit(default=None)
+        after = parse_cursor(request.args.get('after'), 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if after:
+        query = query.where(Product.id > after[0])
+    query = query.order_by(Product.id)
+    if limit:
+        query = query.limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
+
+    result = []
+    for row in rows:
+        stock_data = {
+            'product_id': row.id,
+            'designation': row.designation,
+            'total_quantity': row.total_quantity,
+            'zone_count': row.zone_count,
+            'min_threshold': row.min_threshold,
+            'max_threshold': row.max_threshold,
+            'last_update_at': row.last_update_at
+        }
+        result.append(stock_data)
+
+    response = jsonify(result)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@api.route('/api/stock/check', methods=['POST'])
+@role_required(['admin'])
+def check_stock_summary():
+    # Vérifie product_stock contre l'inventaire ; ?repair=1 reconstruit la table si besoin
+    repair = is_true(request.args.get('repair'))
+    mismatches = stock.check(repair=repair)
+    return jsonify({
+        'consistent': not mismatches,
+        'repaired': repair and bool(mismatches),
+        'mismatches': mismatches[:MAX_PAGE_SIZE]
+    }), 200
+
+# Routes pour les commandes
+@api.route('/api/orders', methods=['GET'])
+def get_orders():
+    query = Order.query
+    if request.args.get('status'):
+        query = query.filter(Order.status == request.args['status'])
+    product_id = request.args.get('product_id', type=int)
+    if product_id is not None:
+        query = query.filter(Order.product_id == product_id)
+    result = [orders.order_data(order)
+              for order in query.order_by(Order.id.desc()).limit(MAX_PAGE_SIZE)]
+    return jsonify(result)
+
+@api.route('/api/orders', methods=['POST'])
+@jwt_required()
+def create_order():
+    data = request.get_json()
+    try:
+        product_id = int(data['product_id'])
+        quantity = int(data['quantity'])
+        zone_id = int(data['zone_id']) if data.get('zone_id') is not None else None
+    except (TypeError, KeyError, ValueError):
+        return jsonify({'error': 'product_id et quantity (entiers) sont requis'}), 400
+    if quantity <= 0:
+        return jsonify({'error': 'La quantité doit être positive'}), 400
+    if not Product.query.get(product_id):
+        return jsonify({'error': 'Produit non trouvé'}), 404
+
+    try:
+        order = orders.create_order(product_id, quantity, int(get_jwt_identity()), zone_id)
+    except orders.OrderError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+    return jsonify({
+        'message': 'Commande créée avec succès',
+        'order': orders.order_data(order)
+    }), 201
+
+@api.route('/api/orders/<int:order_id>/<action>', methods=['POST'])
+@jwt_required()
+def transition_order(order_id, action):
+    status = {'deliver': orders.STATUS_DELIVERED,
+              'return': orders.STATUS_RETURNED,
+              'cancel': orders.STATUS_CANCELLED}.get(action)
+    if status is None:
+        return jsonify({'error': 'Action inconnue'}), 404
+
+    result = orders.transition([order_id], status, int(get_jwt_identity()))[0]
+    if result['status'] == 'error':
+        return jsonify({'error': result['error']}), orders.ERROR_STATUS[result['code']]
+    return jsonify({
+        'message': 'Commande mise à jour avec succès',
+        'order': orders.order_data(Order.query.get(order_id))
+    }), 200
+
+@api.route('/api/orders/transition', methods=['POST'])
+@jwt_required()
+def transition_orders():
+    # Transition en lot : {"order_ids": [...], "status": "delivered" | "returned" | "cancelled"}
+    data = request.get_json() or {}
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or not all(isinstance(i, int) for i in order_ids):
+        return jsonify({'error': 'order_ids (liste d\'entiers) est requis'}), 400
+    try:
+        results = orders.transition(order_ids, data.get('status'), int(get_jwt_identity()))
+    except orders.OrderError as e:
+        return jsonify({'error': e.message}), e.status_code
+    return jsonify({'results': results}), 200
+
+# Routes pour les alertes
+@api.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    query = Alert.query
+    if request.args.get('status'):
+        query = query.filter(Alert.status == request.args['status'])
+    if request.args.get('type'):
+        query = query.filter(Alert.type == request.args['type'])
+    product_id = request.args.get('product_id', type=int)
+    if product_id is not None:
+        query = query.filter(Alert.product_id == product_id)
+    sensor_id = request.args.get('sensor_id', type=int)
+    if sensor_id is not None:
+        query = query.filter(Alert.sensor_id == sensor_id)
+
+    result = []
+    for alert in query.order_by(Alert.created_at.desc(), Alert.id.desc()).limit(MAX_PAGE_SIZE):
+        alert_data = {
+            'id': alert.id,
+            'product_id': alert.product_id,
+            'sensor_id': alert.sensor_id,
+            'type': alert.type,
+            'message': alert.message,
+            'status': alert.status,
+            'created_at': alert.created_at,
+            'user_id': alert.user_id
+        }
+        result.append(alert_data)
+    return jsonify(result)
+
+@api.route('/api/alerts/reconcile', methods=['POST'])
+@role_required(['admin'])
+def reconcile_stock_alerts():
+    result = reconcile_alerts()
+    return jsonify({
+        'message': 'Alertes réconciliées avec succès',
+        'opened': result['opened'],
+        'resolved': result['resolved']
+    }), 200
+
+# Routes pour les prévisions
+@api.route('/api/predictions', methods=['GET'])
+def get_predictions():
+    # Import local : NumPy n'est chargé que si les prévisions sont utilisées
+    from forecast import PERIODS, latest_predictions
+
+    period = request.args.get('period', 'daily')
+    if period not in PERIODS:
+        return jsonify({'error': 'Période inconnue'}), 400
+
+    result = []
+    for prediction in latest_predictions(period, request.args.get('product_id', type=int)):
+        prediction_data = {
+            'id': prediction.id,
+            'product_id': prediction.product_id,
+            'predicted_quantity': prediction.predicted_quantity,
+            'prediction_period': prediction.prediction_period,
+            'created_at': prediction.created_at,
+            'start_prediction': prediction.start_prediction,
+            'finish_prediction': prediction.finish_prediction
+        }
+        result.append(prediction_data)
+    return jsonify(result)
+
+# Flux d'événements (Server-Sent Events) : inventaire, alertes, lectures de capteurs
+STREAM_HEARTBEAT = 15  # secondes
+
+@api.route('/api/stream', methods=['GET'])
+def stream_events():
+    # EventSource renvoie Last-Event-ID à la reconnexion ; last_event_id pour la première connexion
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = parse_event_id(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID invalide'}), 400
+    types = set(request.args['types'].split(',')) if request.args.get('types') else None
+
+    subscription = bus.subscribe(types, last_event_id)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.closed:
+                event = subscription.get(STREAM_HEARTBEAT)
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield format_event(event, bus.boot_id)
+        finally:
+            bus.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Pas de mise en tampon côté nginx
+    return response
+
+# Routes pour les lectures RFID
+@api.route('/api/rfid/scans', methods=['POST'])
+def create_rfid_scans():
+    try:
+        defaults, scans = parse_scans(request.get_json())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(process_scans(defaults, scans, current_user_id())), 200
+
+# Routes pour les capteurs
+@api.route('/api/sensors/readings', methods=['POST'])
+def create_sensor_readings():
+    try:
+        readings = parse_readings(request.get_data(), request.mimetype)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = ingest_readings(readings)
+    status = 400 if result['rejected'] and not result['inserted'] else 201
+    return jsonify(result), status
+
+@api.route('/api/sensors/<int:sensor_id>/series', methods=['GET'])
+def get_sensor_series(sensor_id):
+    sensor = Sensor.query.get(sensor_id)
+    if not sensor:
+        return jsonify({'error': 'Capteur non trouvé'}), 404
+
+    # Fenêtre par défaut : les dernières 24 heures
+    try:
+        end = parse_timestamp(request.args['end']) if 'end' in request.args else datetime.utcnow()
+        start = parse_timestamp(request.args['start']) if 'start' in request.args else end - timedelta(days=1)
+        points = min(int(request.args.get('points', 500)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Paramètres start, end ou points invalides'}), 400
+    if start >= end or points < 1:
+        return jsonify({'error': 'Paramètres start, end ou points invalides'}), 400
+
+    resolution, series = get_series(sensor_id, start, end, points)
+    return jsonify({
+        'sensor_id': sensor_id,
+        'type': sensor.type,
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': series
+    })
+
+@api.route('/api/sensors/<int:sensor_id>/stats', methods=['GET'])
+def get_sensor_stats(sensor_id):
+    # Statistiques glissantes du détecteur d'anomalies (état de ce worker)
+    from anomalies import detector
+    if not db.session.get(Sensor, sensor_id):
+        return jsonify({'error': 'Capteur non trouvé'}), 404
+    detector.ensure_loaded()
+    return jsonify({'sensor_id': sensor_id, 'stats': detector.stats(sensor_id)})
+
+@api.route('/api/sensors/<int:sensor_id>', methods=['DELETE'])
+@role_required(['admin'])
+def delete_sensor(sensor_id):
+    if not db.session.get(Sensor, sensor_id):
+        return jsonify({'error': 'Capteur non trouvé'}), 404
+    # Historique de plus d'un paquet : suppression en tâche de fond (paquets et pauses hors requête)
+    if not retention.fits_in_chunk(sensor_id):
+        return job_response(jobs.submit('sensor.purge', {'sensor_id': sensor_id}, int(get_jwt_identity())))
+    deleted = retention.purge_sensor(sensor_id)
+    return jsonify({'message': 'Capteur supprimé avec succès', 'readings_deleted': deleted}), 200
+
+# Conservation des mesures : archivage puis suppression des lignes expirées, en tâche de fond
+@api.route('/api/retention/run', methods=['POST'])
+@role_required(['admin'])
+def run_retention():
+    archive = request.args.get('archive', '1').lower() not in ('0', 'false', 'no', 'off')
+    job = jobs.submit('retention', {'archive': archive, 'dry_run': is_true(request.args.get('dry_run'))},
+                      int(get_jwt_identity()))
+    return job_response(job)
+
+# Tâches en arrière-plan
+def job_response(job):
+    response = jsonify(jobs.job_data(job))
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+@api.route('/api/jobs', methods=['POST'])
+@role_required(['admin'])
+def submit_job():
+    data = request.get_json() or {}
+    try:
+        job = jobs.submit(data.get('type'), data.get('params'), int(get_jwt_identity()))
+    except jobs.JobError as e:
+        return jsonify({'error': e.message}), e.status_code
+    return job_response(job)
+
+# Lecture des tâches et de leurs résultats (fichiers d'export) réservée aux administrateurs,
+# comme leur création
+@api.route('/api/jobs', methods=['GET'])
+@role_required(['admin'])
+def get_jobs():
+    try:
+        limit = parse_limit()
+        after = parse_cursor(request.args.get('after'), 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Les plus récentes d'abord ; X-Next-Cursor pour la page suivante
+    query = Job.query
+    if 'status' in request.args:
+        query = query.filter(Job.status == request.args['status'])
+    if 'type' in request.args:
+        query = query.filter(Job.type == request.args['type'])
+    if after:
+        query = query.filter(Job.id < after[0])
+    rows = query.order_by(Job.id.desc()).limit(limit + 1).all()
+
+    response = jsonify([jobs.job_data(job) for job in rows[:limit]])
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = str(rows[limit - 1].id)
+    return response
+
+@api.route('/api/jobs/<int:job_id>', methods=['GET'])
+@role_required(['admin'])
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    return jsonify(jobs.job_data(job))
+
+@api.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@role_required(['admin'])
+def cancel_job(job_id):
+    if not db.session.get(Job, job_id):
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    job = jobs.cancel(job_id)
+    return jsonify(jobs.job_data(job)), 200
+
+@api.route('/api/jobs/<int:job_id>/result', methods=['GET'])
+@role_required(['admin'])
+def get_job_result(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    if job.status != jobs.STATUS_SUCCEEDED:
+        return jsonify({'error': f'Tâche {job.status}', 'job': jobs.job_data(job)}), 409
+    result = json.loads(job.result) if job.result else None
+    # Fichier produit par la tâche (export) : ?download=1 pour le récupérer
+    if is_true(request.args.get('download')) and isinstance(result, dict) and result.get('file'):
+        return send_file(result['file'], as_attachment=True)
+    return jsonify(result)
+
+# Export des tables volumineuses (CSV, Parquet, Arrow) en flux
+@api.route('/api/export/<dataset>', methods=['GET'])
+@role_required(['admin'])
+def export_dataset(dataset):
+    fmt = request.args.get('format', 'csv')
+    try:
+        start = parse_timestamp(request.args['start']) if 'start' in request.args else None
+        end = parse_timestamp(request.args['end']) if 'end' in request.args else None
+        filters = {name: int(request.args[name])
+                   for name in ('zone_id', 'product_id', 'sensor_id') if name in request.args}
+    except ValueError:
+        return jsonify({'error': 'Paramètres start, end ou filtres invalides'}), 400
+    try:
+        chunks = export.export_chunks(export.build_query(dataset, start, end, **filters), fmt)
+    except export.ExportError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+    mimetype, extension = export.FORMATS[fmt]
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={dataset}.{extension}'
+    return response
+
 # Lancement de l'application
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
 
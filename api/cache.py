@@ -0,0 +1,161 @@
+# cache.py
+# Cache en mémoire des données de référence (catégories, zones) avec ETag
+import hashlib
+import json
+import threading
+import time
+from flask import current_app, request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, CacheVersion
+from upsert import upsert
+
+# Délai (secondes) entre deux vérifications de la version en base
+DEFAULT_CHECK_INTERVAL = 5.0
+
+class CacheEntry:
+    def __init__(self, version, body, etag):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.checked_at = time.monotonic()
+
+class ReferenceCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, loader):
+        interval = current_app.config.get('REFERENCE_CACHE_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        entry = self._entries.get(name)
+        if entry and time.monotonic() - entry.checked_at < interval:
+            return entry
+
+        # Les autres workers signalent leurs modifications via cache_versions
+        version = self.version(name)
+        if entry and entry.version == version:
+            entry.checked_at = time.monotonic()
+            return entry
+
+        body = json.dumps(loader(), separators=(',', ':'), sort_keys=True, default=str).encode('utf-8')
+        entry = CacheEntry(version, body, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            self._entries[name] = entry
+        return entry
+
+    def version(self, name):
+        return db.session.execute(
+            db.select(CacheVersion.version).where(CacheVersion.name == name)
+        ).scalar() or 0
+
+    def versions(self):
+        return dict(db.session.execute(db.select(CacheVersion.name, CacheVersion.version)).all())
+
+    def invalidate(self, name):
+        # Incrémente la version dans la transaction en cours ; la copie locale
+        # n'est supprimée qu'après le commit (voir drop_invalidated)
+        upsert(CacheVersion.__table__, [{'name': name, 'version': 1}], ['name'],
+               lambda table, new: {'version': table.c.version + 1})
+        db.session.info.setdefault('invalidated_caches', set()).add(name)
+
+    def drop(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+reference_cache = ReferenceCache()
+
+# Reconstructions successives au plus, si des écritures sont validées pendant la construction
+MAX_REFRESH_ATTEMPTS = 3
+
+class VersionedIndex:
+    # Structure en mémoire construite depuis la base (build) et rechargée quand la version `name`
+    # de cache_versions change, c'est-à-dire quand un autre worker a modifié les données.
+    # background_refresh : reconstruction hors de la requête en servant l'ancienne version (index
+    # coûteux à construire) plutôt que rechargement immédiat (index qui doit être exact)
+    background_refresh = False
+
+    def __init__(self, name, interval_setting):
+        self.name = name
+        self.interval_setting = interval_setting
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # Une seule reconstruction en arrière-plan à la fois
+        self._version = None
+        self._checked_at = 0.0
+
+    def build(self):
+        raise NotImplementedError
+
+    def load(self):
+        version = reference_cache.version(self.name)
+        self.build()
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    def ensure_current(self):
+        interval = current_app.config.get(self.interval_setting, DEFAULT_CHECK_INTERVAL)
+        if self._version is not None and time.monotonic() - self._checked_at < interval:
+            return
+        if self._version is None:
+            self.load()
+        elif reference_cache.version(self.name) != self._version:
+            if self.background_refresh:
+                self.refresh()
+            else:
+                self.load()
+        else:
+            self._checked_at = time.monotonic()
+
+    def refresh(self):
+        # Reconstruction hors du thread de la requête (plusieurs secondes sur un gros catalogue) :
+        # l'index courant reste servi jusqu'à l'échange fait par build
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        self._checked_at = time.monotonic()
+        app = current_app._get_current_object()
+        try:
+            threading.Thread(target=self._refresh, args=(app,), name=f'{self.name}-index', daemon=True).start()
+        except Exception:
+            self._refresh_lock.release()
+            raise
+
+    def _refresh(self, app):
+        try:
+            with app.app_context():
+                for _ in range(MAX_REFRESH_ATTEMPTS):
+                    self.load()
+                    # Transaction terminée pour relire la version courante : une écriture de ce
+                    # worker validée pendant la construction a pu être écrasée par l'échange
+                    db.session.rollback()
+                    if reference_cache.version(self.name) == self._version:
+                        break
+        except Exception:
+            app.logger.exception("Reconstruction de l'index %s en échec", self.name)
+        finally:
+            self._refresh_lock.release()
+
+    def adopt_version(self):
+        # Appelé après le commit d'une écriture de ce worker, déjà reportée dans l'index :
+        # si elle est la seule depuis le dernier chargement, inutile de recharger
+        if self._version is None:
+            return
+        version = reference_cache.version(self.name)
+        if version == self._version + 1:
+            self._version = version
+
+@event.listens_for(Session, 'after_commit')
+def drop_invalidated(session):
+    for name in session.info.pop('invalidated_caches', ()):
+        reference_cache.drop(name)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_invalidated(session):
+    session.info.pop('invalidated_caches', None)
+
+def cached_response(name, loader):
+    # Réponse servie depuis le cache, avec ETag fort et 304 si If-None-Match correspond
+    entry = reference_cache.get(name, loader)
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['X-Cache-Version'] = str(entry.version)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,137 @@
+# events.py
+# Bus de publication/abonnement en mémoire alimentant le flux SSE /api/stream
+import itertools
+import json
+import os
+import queue
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db
+
+HISTORY_SIZE = 2000      # Événements conservés pour la reprise via Last-Event-ID
+QUEUE_SIZE = 256         # File par abonné ; au-delà l'abonné est déconnecté et doit reprendre
+
+class Subscription:
+    def __init__(self, types, size):
+        self.types = types
+        self.queue = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+    def offer(self, event):
+        if self.types and event[0] is not None and event[1] not in self.types:
+            return True
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    @property
+    def closed(self):
+        # Abonné décroché pour lenteur : il vide sa file puis doit se reconnecter
+        return self.overflowed and self.queue.empty()
+
+    def get(self, timeout):
+        # Renvoie None si rien n'est arrivé pendant timeout (battement de cœur)
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+def parse_event_id(value):
+    # "<boot_id>-<numéro>" tel qu'envoyé dans le champ id du flux ; un numéro seul (clients
+    # antérieurs) n'appartient à aucun processus et entraîne un resync
+    boot_id, _, number = value.rpartition('-')
+    return boot_id or None, int(number)
+
+class EventBus:
+    def __init__(self, history_size=HISTORY_SIZE, queue_size=QUEUE_SIZE):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.boot_id = None
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self.queue_size = queue_size
+
+    def _ensure_process(self):
+        # Numérotation propre à chaque processus (workers forkés, redémarrages) : les identifiants
+        # sont préfixés par boot_id, un identifiant venu d'un autre processus entraîne un resync
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.boot_id = uuid.uuid4().hex[:12]
+            self._ids = itertools.count(1)
+            self._last_id = 0
+            self._history.clear()
+            self._subscribers = set()
+
+    def publish(self, event_type, data):
+        with self._lock:
+            self._ensure_process()
+            event = (next(self._ids), event_type, data)
+            self._last_id = event[0]
+            self._history.append(event)
+            for subscription in list(self._subscribers):
+                if not subscription.offer(event):
+                    # Client trop lent : on le libère plutôt que de bloquer les écrivains
+                    subscription.overflowed = True
+                    self._subscribers.discard(subscription)
+
+    def subscribe(self, types=None, last_event_id=None):
+        # last_event_id : (boot_id, numéro), voir parse_event_id
+        with self._lock:
+            self._ensure_process()
+            # Reprise : rejouer ce qui a été publié depuis le dernier événement reçu
+            replay = []
+            complete = True
+            if last_event_id is not None:
+                boot_id, number = last_event_id
+                if boot_id == self.boot_id:
+                    replay = [event for event in self._history if event[0] > number]
+                # Événements sortis de l'historique, ou identifiant d'un autre processus (autre
+                # worker, redémarrage) : le client doit recharger l'état complet
+                complete = boot_id == self.boot_id and number <= self._last_id and \
+                    (not replay or replay[0][0] == number + 1)
+            subscription = Subscription(types, self.queue_size + len(replay) + 1)
+            if not complete:
+                subscription.offer((None, 'resync', {}))
+            for event in replay:
+                subscription.offer(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+bus = EventBus()
+
+def queue_event(event_type, data):
+    # Publié seulement après le commit de la transaction en cours
+    db.session.info.setdefault('pending_events', []).append((event_type, data))
+
+@event.listens_for(Session, 'after_commit')
+def publish_pending(session):
+    for event_type, data in session.info.pop('pending_events', ()):
+        bus.publish(event_type, data)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending(session):
+    session.info.pop('pending_events', None)
+
+def to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def format_event(event, boot_id):
+    number, event_type, data = event
+    text = f'event: {event_type}\ndata: {json.dumps(data, default=to_json)}\n\n'
+    return text if number is None else f'id: {boot_id}-{number}\n' + text
@@ -0,0 +1,205 @@
+# export.py
+# Export complet des tables volumineuses (sensor_data, orders, inventory) en CSV, Parquet ou
+# flux Arrow : les lignes sont lues par paquets via un curseur côté serveur et chaque paquet
+# est encodé puis envoyé aussitôt, la mémoire ne dépend donc pas de la taille de la table
+import argparse
+import csv
+import io
+import sys
+from models import db, SensorData, Sensor, Order, Inventory
+
+CHUNK_SIZE = 10000  # Lignes par paquet (et par row group Parquet)
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+DATASETS = {
+    'sensor_data': {
+        'columns': [SensorData.id, SensorData.sensor_id, Sensor.type.label('sensor_type'), Sensor.zone_id,
+                    SensorData.value, SensorData.numeric_value, SensorData.saved_at],
+        'join': (Sensor, SensorData.sensor_id == Sensor.id),
+        'time': SensorData.saved_at,
+        'filters': {'zone_id': Sensor.zone_id, 'sensor_id': SensorData.sensor_id},
+        'order_by': [SensorData.id]
+    },
+    'orders': {
+        'columns': [Order.id, Order.product_id, Order.zone_id, Order.user_id, Order.quantity, Order.status,
+                    Order.created_at, Order.delivered_at, Order.returned_at],
+        'time': Order.created_at,
+        'filters': {'zone_id': Order.zone_id, 'product_id': Order.product_id},
+        'order_by': [Order.id]
+    },
+    'inventory': {
+        'columns': [Inventory.product_id, Inventory.zone_id, Inventory.quantity, Inventory.last_update_at],
+        'time': Inventory.last_update_at,
+        'filters': {'zone_id': Inventory.zone_id, 'product_id': Inventory.product_id},
+        'order_by': [Inventory.product_id, Inventory.zone_id]
+    }
+}
+
+class ExportError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def build_query(dataset, start=None, end=None, **filters):
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        raise ExportError(f'Jeu de données inconnu : {dataset}', 404)
+    query = db.select(*spec['columns'])
+    if 'join' in spec:
+        query = query.join(*spec['join'])
+    if start is not None:
+        query = query.where(spec['time'] >= start)
+    if end is not None:
+        query = query.where(spec['time'] < end)
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in spec['filters']:
+            raise ExportError(f'Filtre {name} non disponible pour {dataset}')
+        query = query.where(spec['filters'][name] == value)
+    return query.order_by(*spec['order_by'])
+
+def count_rows(query):
+    return db.session.execute(db.select(db.func.count()).select_from(query.subquery())).scalar()
+
+def stream_rows(query, on_rows=None):
+    # Curseur côté serveur (SSCursor avec PyMySQL) : paquets de CHUNK_SIZE lignes ;
+    # on_rows(n) appelé après chaque paquet (progression des tâches d'export)
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=CHUNK_SIZE))
+    try:
+        for partition in result.partitions():
+            yield partition
+            if on_rows:
+                on_rows(len(partition))
+    finally:
+        result.close()
+
+def csv_chunks(query, on_rows=None):
+    names = [column.name for column in query.selected_columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for partition in stream_rows(query, on_rows):
+        writer.writerows(partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+class ChunkSink:
+    # Fichier en écriture seule pour pyarrow : les octets écrits sont récupérés à chaque paquet
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def load_pyarrow():
+    # Dépendance optionnelle, importée seulement pour les exports Parquet/Arrow
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError('pyarrow est requis pour les exports Parquet et Arrow', 501)
+    return pyarrow
+
+def arrow_schema(pa, query):
+    fields = []
+    for column in query.selected_columns:
+        if isinstance(column.type, db.Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, db.Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, db.DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=getattr(column, 'nullable', True)))
+    return pa.schema(fields)
+
+def arrow_chunks(query, fmt, on_rows=None):
+    pa = load_pyarrow()
+    schema = arrow_schema(pa, query)
+    sink = ChunkSink()
+    if fmt == 'parquet':
+        writer = pa.parquet.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for partition in stream_rows(query, on_rows):
+            columns = list(zip(*partition))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def export_chunks(query, fmt, on_rows=None):
+    # Générateur paresseux : les erreurs de format sont levées ici, avant toute lecture
+    if fmt not in FORMATS:
+        raise ExportError(f"Format inconnu : {fmt} (csv, parquet ou arrow)")
+    if fmt == 'csv':
+        return csv_chunks(query, on_rows)
+    load_pyarrow()  # Erreur levée avant le début de la réponse
+    return arrow_chunks(query, fmt, on_rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export de sensor_data, orders ou inventory')
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--output', help='Fichier de sortie (sortie standard par défaut)')
+    parser.add_argument('--start', help='Début de la période (ISO 8601)')
+    parser.add_argument('--end', help='Fin de la période, exclue (ISO 8601)')
+    parser.add_argument('--zone-id', type=int)
+    parser.add_argument('--product-id', type=int)
+    parser.add_argument('--sensor-id', type=int)
+    args = parser.parse_args()
+
+    from factory import create_base_app
+    from sensors import parse_timestamp
+    filters = {name: value for name, value in
+               (('zone_id', args.zone_id), ('product_id', args.product_id), ('sensor_id', args.sensor_id))
+               if value is not None}
+    with create_base_app().app_context():
+        try:
+            query = build_query(args.dataset,
+                                parse_timestamp(args.start) if args.start else None,
+                                parse_timestamp(args.end) if args.end else None, **filters)
+            chunks = export_chunks(query, args.format)
+        except ExportError as e:
+            sys.exit(e.message)
+        output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        finally:
+            if args.output:
+                output.close()
@@ -0,0 +1,128 @@
+# factory.py
+# Configuration et construction de l'application Flask
+import os
+import weakref
+from datetime import timedelta
+from flask import Flask
+from models import db
+
+def env_float(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+def env_days(name, default):
+    # "temperature=30,humidity=90,default=365" -> {'temperature': 30, ...}
+    value = os.environ.get(name)
+    if not value:
+        return default
+    policies = {}
+    for item in value.split(','):
+        key, _, days = item.partition('=')
+        policies[key.strip()] = int(days)
+    return policies
+
+class Config:
+    # Base de données MySQL (DATABASE_URL pour en changer)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'mysql+pymysql://root@localhost/stock_genius')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = 'KEY00155'  # Important pour la sécurité
+
+    # JWT
+    JWT_SECRET_KEY = 'KEY00155'  # Changez ceci en production!
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)  # Token valide pour 24 heures
+
+    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:4200')  # URL du frontend
+
+    # Pool de connexions, par worker (N workers => N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connexions au plus)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # Sous wait_timeout de MySQL
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'no')
+
+    # Hachage des mots de passe (None = méthode par défaut de werkzeug, ex. "pbkdf2:sha256:600000")
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD')
+    PASSWORD_HASH_WORKERS = os.cpu_count()
+
+    # Journal des requêtes lentes (ms), désactivé si None
+    SLOW_REQUEST_MS = env_float('SLOW_REQUEST_MS')
+
+    # Conservation des mesures par type de capteur (jours), "default" pour les autres types ;
+    # les lignes expirées sont archivées dans SENSOR_ARCHIVE_DIR avant suppression
+    # (fichiers produits : dans le dossier instance de l'application par défaut, voir instance_paths)
+    SENSOR_RETENTION_DAYS = env_days('SENSOR_RETENTION_DAYS', {'default': 365})
+    SENSOR_ARCHIVE_DIR = os.environ.get('SENSOR_ARCHIVE_DIR')
+
+    # Détection d'anomalies : seuils par type de capteur, ex. {'temperature': {'min': -25, 'max': 8,
+    # 'max_rate': 0.5}} (max_rate en unités par minute), écart anormal en écarts-types
+    SENSOR_THRESHOLDS = {}
+    ANOMALY_Z_THRESHOLD = 4.0
+    ANOMALY_CHECKPOINT = os.environ.get('ANOMALY_CHECKPOINT')
+
+    # Tâches en arrière-plan (jobs.py) : threads par worker, limites par type dans JOB_LIMITS
+    JOBS_ENABLED = os.environ.get('JOBS_ENABLED', '1') not in ('0', 'false', 'no')
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+    EXPORT_DIR = os.environ.get('EXPORT_DIR')
+
+    # Écriture différée de sensors.last_reading / status et inventory.last_update_at :
+    # retard maximal en secondes (0 : écriture dans la transaction de la requête)
+    WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1.0))
+
+    # Journal d'inventaire : instantanés pris par le répartiteur de tâches tous les
+    # INVENTORY_SNAPSHOT_EVERY mouvements, ou après INVENTORY_SNAPSHOT_INTERVAL secondes
+    INVENTORY_SNAPSHOT_EVERY = int(os.environ.get('INVENTORY_SNAPSHOT_EVERY', 50000))
+    INVENTORY_SNAPSHOT_INTERVAL = int(os.environ.get('INVENTORY_SNAPSHOT_INTERVAL', 3600))
+
+# Fichiers produits par l'application, rangés par défaut dans app.instance_path (api/instance,
+# ignoré par git) plutôt que dans le répertoire courant, qui est souvent celui des sources
+INSTANCE_PATHS = {
+    'SENSOR_ARCHIVE_DIR': 'archives',
+    'ANOMALY_CHECKPOINT': 'anomaly_state.npz',
+    'EXPORT_DIR': 'exports'
+}
+
+def instance_paths(app):
+    for name, default in INSTANCE_PATHS.items():
+        if app.config.get(name) is None:
+            app.config[name] = os.path.join(app.instance_path, default)
+
+def engine_options(config):
+    # SQLite utilise son propre pool (fichier local ou mémoire) : pas de réglages de taille
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+
+# Applications créées dans ce processus, pour libérer leurs connexions après un fork
+_apps = weakref.WeakSet()
+
+def dispose_engines_after_fork():
+    # Les connexions héritées du processus maître (gunicorn --preload, uWSGI) appartiennent
+    # au parent : le worker les abandonne sans les fermer et ouvre les siennes
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_engines_after_fork)
+
+def create_base_app(config=None):
+    # Application minimale (configuration + base de données), suffisante pour les scripts
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    instance_paths(app)
+
+    db.init_app(app)
+    _apps.add(app)
+    return app
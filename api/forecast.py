@@ -0,0 +1,160 @@
+# forecast.py
+# Prévision de la demande pour tous les produits à la fois (calcul vectorisé NumPy)
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from models import db, Product, Order, OrderPrediction, prediction_orders
+
+# Durée d'un intervalle en jours, longueur d'historique et saisonnalité (en intervalles)
+PERIODS = {
+    'daily': {'days': 1, 'history': 90, 'season': 7},
+    'weekly': {'days': 7, 'history': 52, 'season': None},
+    'monthly': {'days': 30, 'history': 24, 'season': 12}
+}
+# Statuts de commande exclus de l'historique de demande
+EXCLUDED_STATUSES = ('cancelled', 'returned')
+ALPHA = 0.3  # Coefficient du lissage exponentiel
+
+def load_history(period, history, end):
+    # Une seule requête : quantités commandées par produit et par jour
+    days = PERIODS[period]['days']
+    start = end - timedelta(days=days * history)
+    day = db.func.date(Order.created_at)
+    rows = db.session.execute(
+        db.select(Order.product_id, day, db.func.sum(Order.quantity))
+        .where(Order.created_at >= start,
+               Order.created_at < end,
+               Order.status.not_in(EXCLUDED_STATUSES))
+        .group_by(Order.product_id, day)
+    ).all()
+
+    product_ids = np.array(db.session.execute(
+        db.select(Product.id).order_by(Product.id)
+    ).scalars().all(), dtype=np.int64)
+
+    # Matrice produits x intervalles
+    matrix = np.zeros((len(product_ids), history))
+    if rows and len(product_ids):
+        ids, dates, quantities = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        dates = np.array([str(d) for d in dates], dtype='datetime64[D]')
+        quantities = np.array(quantities, dtype=float)
+
+        row_index = np.searchsorted(product_ids, ids)
+        known = (row_index < len(product_ids)) & (product_ids[np.minimum(row_index, len(product_ids) - 1)] == ids)
+        col_index = (dates - np.datetime64(start.date(), 'D')).astype(np.int64) // days
+        valid = known & (col_index >= 0) & (col_index < history)
+        np.add.at(matrix, (row_index[valid], col_index[valid]), quantities[valid])
+
+    return product_ids, matrix
+
+def forecast_matrix(matrix, horizon, season=None, alpha=ALPHA):
+    # Lissage exponentiel simple + composante saisonnière additive, pour toutes les lignes à la fois
+    n_products, n_buckets = matrix.shape
+    if n_buckets == 0:
+        return np.zeros((n_products, horizon))
+
+    seasonal = None
+    if season and n_buckets >= 2 * season:
+        # Moyenne de chaque position de la saison moins la moyenne globale du produit
+        usable = n_buckets - n_buckets % season
+        cycles = matrix[:, n_buckets - usable:].reshape(n_products, -1, season)
+        seasonal = cycles.mean(axis=1) - cycles.mean(axis=(1, 2))[:, None]
+        offset = n_buckets - usable
+        positions = (np.arange(n_buckets) - offset) % season
+        matrix = matrix - seasonal[:, positions]
+
+    level = matrix[:, 0].copy()
+    for t in range(1, n_buckets):
+        level = alpha * matrix[:, t] + (1 - alpha) * level
+
+    forecast = np.repeat(level[:, None], horizon, axis=1)
+    if seasonal is not None:
+        future = (np.arange(n_buckets, n_buckets + horizon) - offset) % season
+        forecast = forecast + seasonal[:, future]
+    return np.clip(forecast, 0, None)
+
+def run_forecast(period='daily', history=None, horizon=1, now=None):
+    if period not in PERIODS:
+        raise ValueError(f'Période inconnue : {period}')
+    config = PERIODS[period]
+    history = history or config['history']
+    now = now or datetime.utcnow()
+    # Les intervalles s'arrêtent au début de la journée en cours (journée incomplète exclue)
+    end = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    product_ids, matrix = load_history(period, history, end)
+    forecast = forecast_matrix(matrix, horizon, config['season'])
+
+    # Écriture en masse des prédictions
+    step = timedelta(days=config['days'])
+    rows = []
+    for h in range(horizon):
+        start = end + h * step
+        finish = start + step
+        quantities = forecast[:, h].tolist()
+        for product_id, quantity in zip(product_ids.tolist(), quantities):
+            rows.append({
+                'product_id': product_id,
+                'predicted_quantity': quantity,
+                'prediction_period': period,
+                'created_at': now,
+                'start_prediction': start,
+                'finish_prediction': finish
+            })
+    if rows:
+        db.session.execute(db.insert(OrderPrediction.__table__), rows)
+
+    linked = link_orders(period, now - timedelta(days=config['days'] * history), now)
+    db.session.commit()
+    return {'period': period, 'products': len(product_ids), 'predictions': len(rows), 'linked_orders': linked}
+
+def link_orders(period, since, now):
+    # Rattache aux prédictions les commandes passées pendant la période prédite
+    predictions = OrderPrediction.__table__
+    orders = Order.__table__
+    already_linked = db.select(prediction_orders.c.order_id).where(
+        prediction_orders.c.prediction_id == predictions.c.id,
+        prediction_orders.c.order_id == orders.c.id
+    ).exists()
+    result = db.session.execute(
+        db.insert(prediction_orders).from_select(
+            ['prediction_id', 'order_id'],
+            db.select(predictions.c.id, orders.c.id)
+            .join(orders, orders.c.product_id == predictions.c.product_id)
+            .where(predictions.c.prediction_period == period,
+                   predictions.c.start_prediction >= since,
+                   predictions.c.start_prediction <= now,
+                   orders.c.created_at >= predictions.c.start_prediction,
+                   orders.c.created_at < predictions.c.finish_prediction,
+                   ~already_linked)
+        )
+    )
+    return result.rowcount
+
+def latest_predictions(period, product_id=None):
+    # Prédictions du dernier calcul effectué pour la période
+    latest = db.session.execute(
+        db.select(db.func.max(OrderPrediction.created_at))
+        .where(OrderPrediction.prediction_period == period)
+    ).scalar()
+    if latest is None:
+        return []
+    query = OrderPrediction.query.filter(
+        OrderPrediction.prediction_period == period,
+        OrderPrediction.created_at == latest
+    )
+    if product_id is not None:
+        query = query.filter(OrderPrediction.product_id == product_id)
+    return query.order_by(OrderPrediction.product_id, OrderPrediction.start_prediction).all()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcule les prévisions de commandes de tous les produits')
+    parser.add_argument('--period', choices=sorted(PERIODS), default='daily')
+    parser.add_argument('--history', type=int, help="Nombre d'intervalles d'historique")
+    parser.add_argument('--horizon', type=int, default=1, help="Nombre d'intervalles à prédire")
+    args = parser.parse_args()
+
+    from factory import create_base_app
+    with create_base_app().app_context():
+        print(run_forecast(args.period, args.history, args.horizon))
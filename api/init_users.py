@@ -1,9 +1,10 @@
 # create_users.py
-from app import app, db
-from models import User
-from werkzeug.security import generate_password_hash
+# Application minimale (base de données seule) : les routes de l'API ne sont pas importées
+from factory import create_base_app
+from models import db, User
 
 def create_initial_users():
+    app = create_base_app()
     with app.app_context():
         # Vérifier si des utilisateurs existent déjà
         if User.query.count() > 0:
@@ -36,4 +37,4 @@ def create_initial_users():
         print("Utilisateurs créés avec succès!")
 
 if __name__ == "__main__":
-    create_initial_users()
\ No newline at end of file
+    create_initial_users()
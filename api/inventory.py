@@ -0,0 +1,180 @@
+# inventory.py
+# Écritures d'inventaire en masse
+from datetime import datetime
+from models import db, Product, Zone, Inventory
+from upsert import upsert, greatest
+from alerts import evaluate_products, lock_products
+from stock import refresh_products
+from events import queue_event
+from writebehind import buffer
+from ledger import movement, record
+
+LINE_CHUNK = 500  # Lignes par filtre IN (limite de variables de SQLite)
+
+def after_inventory_write(changes):
+    # À appeler avant le commit de toute écriture d'inventaire, avec les variations réellement
+    # appliquées {(product_id, zone_id): variation} : totaux puis alertes. Les lignes, verrouillées
+    # par l'écriture, sont relues pour connaître les quantités avant et après
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    inventory = Inventory.__table__
+    lines = {}
+    for chunk in key_chunks(changes):
+        for product_id, zone_id, quantity in db.session.execute(
+            db.select(inventory.c.product_id, inventory.c.zone_id, inventory.c.quantity)
+            .where(line_filter(chunk))
+        ).tuples():
+            lines[(product_id, zone_id)] = (quantity - changes[(product_id, zone_id)], quantity)
+    product_ids = {product_id for product_id, _ in changes}
+    lock_products(product_ids)
+    refresh_products(lines)
+    evaluate_products(product_ids)
+
+def add_quantities(deltas):
+    # deltas : {(product_id, zone_id): variation}, appliquées en un seul upsert dans l'ordre
+    # de la clé ; une quantité ne descend jamais sous zéro. Renvoie les variations réellement
+    # appliquées (lignes verrouillées d'abord, pour le journal des mouvements)
+    if not deltas:
+        return {}
+    current = locked_quantities(deltas)
+    applied = {key: max(current.get(key, 0) + delta, 0) - current.get(key, 0)
+               for key, delta in deltas.items()}
+    now = datetime.utcnow()
+    upsert(Inventory.__table__, [
+        {'product_id': product_id, 'zone_id': zone_id, 'quantity': delta, 'last_update_at': now}
+        for (product_id, zone_id), delta in sorted(deltas.items())
+    ], ['product_id', 'zone_id'], lambda table, new: {
+        'quantity': greatest(table.c.quantity + new.quantity, 0),
+        'last_update_at': new.last_update_at
+    })
+    # Lignes nouvelles créées avec une variation négative
+    negative = [key for key, delta in deltas.items() if delta < 0 and key not in current]
+    inventory = Inventory.__table__
+    for chunk in key_chunks(negative):
+        db.session.execute(
+            db.update(inventory)
+            .where(inventory.c.quantity < 0, line_filter(chunk))
+            .values(quantity=0)
+        )
+    return applied
+
+def key_chunks(keys):
+    # Clés (product_id, zone_id) triées, par paquets de LINE_CHUNK pour les filtres IN
+    keys = sorted(keys)
+    for start in range(0, len(keys), LINE_CHUNK):
+        yield keys[start:start + LINE_CHUNK]
+
+def locked_quantities(keys):
+    # Quantités actuelles, lignes verrouillées dans l'ordre de la clé (FOR UPDATE, ignoré par SQLite) ;
+    # (product_id, zone_id) IN (...) par paquets, les paquets étant pris dans l'ordre de la clé
+    inventory = Inventory.__table__
+    quantities = {}
+    for chunk in key_chunks(keys):
+        quantities.update(((product_id, zone_id), quantity) for product_id, zone_id, quantity in db.session.execute(
+            db.select(inventory.c.product_id, inventory.c.zone_id, inventory.c.quantity)
+            .where(line_filter(chunk))
+            .order_by(inventory.c.product_id, inventory.c.zone_id)
+            .with_for_update()
+        ).tuples())
+    return quantities
+
+def line_filter(keys):
+    # (product_id, zone_id) IN (...) ; au plus LINE_CHUNK clés, voir key_chunks
+    inventory = Inventory.__table__
+    return db.tuple_(inventory.c.product_id, inventory.c.zone_id).in_(keys)
+
+def queue_inventory_lines(keys):
+    # Publie l'état courant des lignes touchées sur le flux SSE (après commit)
+    rows = []
+    for chunk in key_chunks(keys):
+        rows.extend(db.session.execute(
+            db.select(Inventory.__table__).where(line_filter(chunk))
+        ).mappings())
+    if rows:
+        queue_event('inventory', {'lines': [dict(row) for row in rows]})
+
+def parse_lines(data):
+    # Accepte un tableau de lignes ou un objet {"lines": [...]}
+    if isinstance(data, dict):
+        data = data.get('lines')
+    if not isinstance(data, list):
+        raise ValueError('Un tableau de lignes est attendu')
+    return data
+
+def apply_lines(lines, user_id=None):
+    results = []
+    candidates = []
+    for index, line in enumerate(lines):
+        try:
+            product_id = int(line['product_id'])
+            zone_id = int(line['zone_id'])
+            quantity = int(line['quantity'])
+        except (TypeError, KeyError, ValueError):
+            results.append({'index': index, 'status': 'error',
+                            'error': 'product_id, zone_id et quantity (entiers) sont requis'})
+            continue
+        result = {'index': index, 'product_id': product_id, 'zone_id': zone_id, 'quantity': quantity}
+        results.append(result)
+        candidates.append(result)
+
+    # Deux requêtes ensemblistes pour valider tous les produits et toutes les zones
+    product_ids = {r['product_id'] for r in candidates}
+    zone_ids = {r['zone_id'] for r in candidates}
+    known_products = set(db.session.execute(
+        db.select(Product.id).where(Product.id.in_(product_ids))
+    ).scalars()) if product_ids else set()
+    known_zones = set(db.session.execute(
+        db.select(Zone.id).where(Zone.id.in_(zone_ids))
+    ).scalars()) if zone_ids else set()
+
+    valid = []
+    for result in candidates:
+        if result['product_id'] not in known_products:
+            result.update(status='error', error='Produit non trouvé')
+        elif result['zone_id'] not in known_zones:
+            result.update(status='error', error='Zone non trouvée')
+        else:
+            valid.append(result)
+
+    # Lignes déjà présentes, pour distinguer création et mise à jour et calculer les variations
+    existing = locked_quantities({(r['product_id'], r['zone_id']) for r in valid}) if valid else {}
+
+    # En cas de doublon dans le lot, la dernière ligne l'emporte
+    now = datetime.utcnow()
+    rows = {}
+    for result in valid:
+        key = (result['product_id'], result['zone_id'])
+        result['status'] = 'updated' if key in existing or key in rows else 'created'
+        rows[key] = {
+            'product_id': key[0],
+            'zone_id': key[1],
+            'quantity': result['quantity'],
+            'last_update_at': now
+        }
+
+    # Lignes écrites dans l'ordre de la clé : deux lots concurrents verrouillent
+    # les mêmes lignes dans le même ordre (pas d'interblocage)
+    rows = dict(sorted(rows.items()))
+    # Comptage qui confirme la quantité en base : seule la date change, écrite en différé
+    # sans verrouiller la ligne
+    changed = {key: row for key, row in rows.items() if existing.get(key) != row['quantity']}
+    for key in rows.keys() - changed.keys():
+        buffer.touch_inventory(key[0], key[1], now)
+    upsert(Inventory.__table__, list(changed.values()), ['product_id', 'zone_id'],
+           lambda table, new: {
+               'quantity': new.quantity,
+               'last_update_at': new.last_update_at
+           })
+    record([movement(key[0], key[1], row['quantity'] - existing.get(key, 0), 'count', user_id)
+            for key, row in changed.items()])
+    after_inventory_write({key: row['quantity'] - existing.get(key, 0) for key, row in changed.items()})
+    if rows:
+        queue_event('inventory', {'lines': list(rows.values())})
+    db.session.commit()
+
+    return {
+        'applied': len(valid),
+        'rejected': len(results) - len(valid),
+        'results': results
+    }
@@ -0,0 +1,456 @@
+# jobs.py
+# Tâches longues en arrière-plan (prévisions, réconciliation, exports, conservation, migrations) :
+# file persistante dans la table jobs, exécutée par un pool de threads dans chaque worker.
+# Chaque worker prend les tâches en attente par une mise à jour conditionnelle, si bien qu'une
+# tâche n'est exécutée qu'une fois même avec plusieurs processus.
+import inspect
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models import db, Job
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+FINISHED = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_INTERVAL = 1.0   # secondes entre deux lectures de la file
+DEFAULT_STALE_AFTER = 300     # secondes sans signe de vie avant qu'une tâche soit déclarée perdue
+PROGRESS_INTERVAL = 1.0       # secondes entre deux écritures de la progression
+CLAIM_LOCK_TIMEOUT = 10       # secondes d'attente du verrou de prise d'un type de tâche
+SCHEDULE_INTERVAL = 60        # secondes entre deux vérifications des tâches planifiées
+
+class JobCancelled(Exception):
+    pass
+
+class JobError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class JobType:
+    def __init__(self, name, fn, limit, validate=None):
+        self.name = name
+        self.fn = fn
+        self.limit = limit  # Tâches de ce type exécutées en même temps, tous workers confondus
+        self.signature = inspect.signature(fn)
+        self.validate = validate  # validate(**params), lève JobError : paramètres refusés dès submit
+
+JOB_TYPES = {}
+
+def job_type(name, limit=1, validate=None):
+    def register(fn):
+        JOB_TYPES[name] = JobType(name, fn, limit, validate)
+        return fn
+    return register
+
+# Tâches planifiées : type -> fonction indiquant si une exécution est due, vérifiée par le répartiteur
+SCHEDULES = {}
+
+def scheduled(name):
+    def register(fn):
+        SCHEDULES[name] = fn
+        return fn
+    return register
+
+class JobContext:
+    # Passé à la fonction de la tâche : progression et annulation coopérative
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._written_at = 0.0
+        self._checked_at = 0.0
+        self._progress_blocked = False
+
+    def progress(self, fraction, message=None, force=False):
+        # Écrit hors de la session de la tâche pour ne pas valider son travail en cours. Indicatif :
+        # un échec n'interrompt pas la tâche (SQLite refuse toute écriture tant que la tâche garde
+        # un curseur de lecture ouvert), la progression n'est alors plus écrite pour cette tâche
+        now = time.monotonic()
+        if self._progress_blocked or (not force and now - self._written_at < PROGRESS_INTERVAL):
+            return
+        self._written_at = now
+        values = {'progress': max(0.0, min(1.0, fraction)), 'heartbeat_at': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:255]
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.update(Job.__table__).where(Job.id == self.job_id).values(**values))
+        except OperationalError:
+            self._progress_blocked = True
+            current_app.logger.warning('Progression de la tâche %s non enregistrée', self.job_id, exc_info=True)
+
+    def check(self):
+        # Lève JobCancelled si une annulation a été demandée
+        now = time.monotonic()
+        if now - self._checked_at < PROGRESS_INTERVAL:
+            return
+        self._checked_at = now
+        with db.engine.connect() as conn:
+            if conn.execute(db.select(Job.cancel_requested).where(Job.id == self.job_id)).scalar():
+                raise JobCancelled()
+
+def to_json(value):
+    return json.dumps(value, default=str) if value is not None else None
+
+def job_data(job):
+    return {
+        'id': job.id,
+        'type': job.type,
+        'status': job.status,
+        'params': json.loads(job.params) if job.params else {},
+        'progress': job.progress,
+        'message': job.message,
+        'error': job.error,
+        'cancel_requested': job.cancel_requested,
+        'user_id': job.user_id,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def submit(type_name, params=None, user_id=None):
+    job_type_ = JOB_TYPES.get(type_name)
+    if job_type_ is None:
+        raise JobError(f'Type de tâche inconnu : {type_name}')
+    params = params or {}
+    if not isinstance(params, dict):
+        raise JobError('params doit être un objet')
+    try:
+        job_type_.signature.bind(None, **params)
+    except TypeError as e:
+        raise JobError(f'Paramètres invalides : {e}')
+    if job_type_.validate is not None:
+        job_type_.validate(**params)
+
+    job = Job(type=type_name, status=STATUS_QUEUED, params=to_json(params), user_id=user_id, progress=0)
+    db.session.add(job)
+    db.session.commit()
+    runner.wake()
+    return job
+
+def cancel(job_id):
+    # En attente : annulée tout de suite ; en cours : la tâche s'arrête à son prochain check()
+    table = Job.__table__
+    cancelled = db.session.execute(
+        db.update(table).where(table.c.id == job_id, table.c.status == STATUS_QUEUED)
+        .values(status=STATUS_CANCELLED, cancel_requested=True, finished_at=datetime.utcnow())
+    ).rowcount
+    if not cancelled:
+        db.session.execute(
+            db.update(table).where(table.c.id == job_id, table.c.status == STATUS_RUNNING)
+            .values(cancel_requested=True)
+        )
+    db.session.commit()
+    return db.session.get(Job, job_id, populate_existing=True)
+
+class JobRunner:
+    # Un répartiteur (thread) par processus lit la file et confie les tâches au pool ;
+    # démarré à la première requête du processus, donc après le fork des workers
+    def __init__(self):
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = None
+        self._running = {}  # job_id -> type
+        self._scheduled_at = 0.0
+        self.worker = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or self.app is None or not self.app.config.get('JOBS_ENABLED', True):
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._running = {}
+            self.worker = f'{socket.gethostname()}:{self._pid}'
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.app.config.get('JOBS_WORKERS', DEFAULT_WORKERS), thread_name_prefix='job')
+            threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def limit(self, job_type_):
+        return self.app.config.get('JOB_LIMITS', {}).get(job_type_.name, job_type_.limit)
+
+    def _dispatch_loop(self):
+        interval = self.app.config.get('JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    self._fail_stale()
+                    self._schedule()
+                    self._dispatch()
+                    db.session.remove()
+            except Exception:
+                self.app.logger.exception('Erreur du répartiteur de tâches')
+
+    def _heartbeat(self):
+        running = list(self._running)
+        if running:
+            with db.engine.begin() as conn:
+                conn.execute(db.update(Job.__table__).where(Job.id.in_(running))
+                             .values(heartbeat_at=datetime.utcnow()))
+
+    def _fail_stale(self):
+        # Tâches dont le processus a disparu (redémarrage, crash)
+        stale_after = self.app.config.get('JOBS_STALE_AFTER', DEFAULT_STALE_AFTER)
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(Job.__table__)
+                .where(Job.status == STATUS_RUNNING,
+                       Job.heartbeat_at < datetime.utcnow() - timedelta(seconds=stale_after))
+                .values(status=STATUS_FAILED, error='Tâche interrompue (processus arrêté)',
+                        finished_at=datetime.utcnow())
+            )
+
+    def _schedule(self):
+        # Soumet les tâches planifiées dues, sauf si une est déjà en attente ou en cours ; deux workers
+        # peuvent en soumettre une chacun, la limite du type les exécute l'une après l'autre
+        now = time.monotonic()
+        if now - self._scheduled_at < self.app.config.get('JOBS_SCHEDULE_INTERVAL', SCHEDULE_INTERVAL):
+            return
+        self._scheduled_at = now
+        for type_name, due in SCHEDULES.items():
+            pending = db.session.execute(
+                db.select(Job.id).where(Job.type == type_name,
+                                        Job.status.in_([STATUS_QUEUED, STATUS_RUNNING])).limit(1)
+            ).scalar()
+            if pending is None and due():
+                submit(type_name)
+
+    def _dispatch(self):
+        capacity = self.app.config.get('JOBS_WORKERS', DEFAULT_WORKERS) - len(self._running)
+        if capacity <= 0:
+            return
+        queued = db.session.execute(
+            db.select(Job.id, Job.type).where(Job.status == STATUS_QUEUED)
+            .order_by(Job.id).limit(capacity * 4)
+        ).all()
+        if not queued:
+            return
+        running = dict(db.session.execute(
+            db.select(Job.type, db.func.count()).where(Job.status == STATUS_RUNNING).group_by(Job.type)
+        ).all())
+        for job_id, type_name in queued:
+            if capacity <= 0:
+                break
+            job_type_ = JOB_TYPES.get(type_name)
+            if job_type_ is None:
+                self._finish(job_id, STATUS_FAILED, error=f'Type de tâche inconnu : {type_name}')
+                continue
+            if running.get(type_name, 0) >= self.limit(job_type_):
+                continue
+            if not self._claim(job_id, job_type_):
+                continue  # Prise par un autre worker, ou limite du type atteinte entre-temps
+            running[type_name] = running.get(type_name, 0) + 1
+            capacity -= 1
+            self._running[job_id] = type_name
+            self._executor.submit(self._execute, job_id, job_type_)
+
+    def _claim(self, job_id, job_type_):
+        # Prise et limite du type vérifiées dans la même transaction. Les prises d'un même type sont
+        # sérialisées par un verrou nommé (MySQL, PostgreSQL) ; SQLite sérialise déjà les écritures,
+        # d'où la mise à jour avant le comptage
+        now = datetime.utcnow()
+        dialect = db.engine.dialect.name
+        lock_name = f'stock_genius_job_{job_type_.name}'[:64]
+        with db.engine.connect() as conn:
+            if dialect in ('mysql', 'mariadb'):
+                if not conn.execute(text('SELECT GET_LOCK(:name, :timeout)'),
+                                    {'name': lock_name, 'timeout': CLAIM_LOCK_TIMEOUT}).scalar():
+                    return False
+            elif dialect == 'postgresql':
+                conn.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                             {'key': zlib.crc32(lock_name.encode())})
+            try:
+                claimed = conn.execute(
+                    db.update(Job.__table__).where(Job.id == job_id, Job.status == STATUS_QUEUED)
+                    .values(status=STATUS_RUNNING, worker=self.worker, started_at=now, heartbeat_at=now)
+                ).rowcount == 1
+                if claimed:
+                    running = conn.execute(
+                        db.select(db.func.count()).select_from(Job.__table__)
+                        .where(Job.type == job_type_.name, Job.status == STATUS_RUNNING)
+                    ).scalar()
+                    claimed = running <= self.limit(job_type_)
+                if claimed:
+                    conn.commit()
+                else:
+                    conn.rollback()
+                return claimed
+            finally:
+                if dialect in ('mysql', 'mariadb'):
+                    conn.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': lock_name})
+                    conn.commit()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        values = {'status': status, 'finished_at': datetime.utcnow(), 'result': to_json(result), 'error': error}
+        if status == STATUS_SUCCEEDED:
+            values['progress'] = 1.0
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Job.__table__).where(Job.id == job_id).values(**values))
+
+    def _execute(self, job_id, job_type_):
+        with self.app.app_context():
+            try:
+                params = json.loads(db.session.get(Job, job_id).params or '{}')
+                db.session.rollback()
+                result = job_type_.fn(JobContext(job_id), **params)
+                self._finish(job_id, STATUS_SUCCEEDED, result=result)
+            except JobCancelled:
+                db.session.rollback()
+                self._finish(job_id, STATUS_CANCELLED)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.exception('Tâche %s (%s) en échec', job_id, job_type_.name)
+                self._finish(job_id, STATUS_FAILED, error=f'{type(e).__name__}: {e}')
+            finally:
+                db.session.remove()
+                self._running.pop(job_id, None)
+                self.wake()
+
+runner = JobRunner()
+
+def init_jobs(app):
+    runner.init_app(app)
+    app.before_request(runner.ensure_started)
+
+# Types de tâches ; les modules lourds sont importés à l'exécution
+
+def validate_forecast(period='daily', history=None, horizon=1):
+    from forecast import PERIODS
+    if period not in PERIODS:
+        raise JobError(f"Période inconnue : {period} ({', '.join(PERIODS)})")
+    for name, value in (('history', history), ('horizon', horizon)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            raise JobError(f'{name} doit être un entier positif')
+
+@job_type('forecast', validate=validate_forecast)
+def forecast_job(context, period='daily', history=None, horizon=1):
+    from forecast import run_forecast
+    context.progress(0.0, 'Calcul des prévisions', force=True)
+    return run_forecast(period, history, horizon)
+
+@job_type('alerts.reconcile')
+def reconcile_alerts_job(context):
+    from alerts import reconcile
+    return reconcile()
+
+@job_type('stock.check')
+def stock_check_job(context, repair=False):
+    import stock
+    mismatches = stock.check(repair=repair)
+    return {'consistent': not mismatches, 'repaired': repair and bool(mismatches), 'mismatches': mismatches}
+
+@job_type('retention')
+def retention_job(context, archive=True, dry_run=False):
+    import retention
+    policies = sorted((t, days) for t, days in retention.policies().items() if days is not None)
+    results = []
+    for i, (sensor_type, days) in enumerate(policies):
+        context.check()
+        context.progress(i / len(policies), f'Type {sensor_type}', force=True)
+        results.append(retention.expire_type(
+            sensor_type, days, archive=archive, dry_run=dry_run,
+            on_chunk=lambda stats: (context.check(), context.progress(
+                i / len(policies), f"Type {sensor_type} : {stats['rows']} lignes"))))
+    return results
+
+def validate_sensor_purge(sensor_id):
+    if not isinstance(sensor_id, int) or isinstance(sensor_id, bool):
+        raise JobError('sensor_id doit être un entier')
+
+@job_type('sensor.purge', validate=validate_sensor_purge)
+def sensor_purge_job(context, sensor_id):
+    import retention
+    total = retention.count_readings(sensor_id)
+    context.progress(0.0, f'0 / {total} mesures', force=True)
+
+    def on_chunk(deleted):
+        context.check()
+        context.progress(deleted / total if total else 1.0, f'{deleted} / {total} mesures')
+
+    return {'sensor_id': sensor_id, 'readings_deleted': retention.purge_sensor(sensor_id, on_chunk=on_chunk)}
+
+def export_query(dataset, start=None, end=None, **filters):
+    import export
+    from sensors import parse_timestamp
+    try:
+        start = parse_timestamp(start) if start else None
+        end = parse_timestamp(end) if end else None
+    except (TypeError, ValueError, OverflowError):
+        raise JobError('Paramètres start ou end invalides')
+    return export.build_query(dataset, start, end, **filters)
+
+def validate_export(dataset, format='csv', start=None, end=None, **filters):
+    # Mêmes contrôles que GET /api/export (jeu de données, filtres, format, pyarrow), sans lecture
+    import export
+    try:
+        export.export_chunks(export_query(dataset, start, end, **filters), format)
+    except export.ExportError as e:
+        raise JobError(e.message, 501 if e.status_code == 501 else 400)
+
+@job_type('export', limit=2, validate=validate_export)
+def export_job(context, dataset, format='csv', start=None, end=None, **filters):
+    import export
+    query = export_query(dataset, start, end, **filters)
+    total = export.count_rows(query)
+    rows = 0
+
+    def on_rows(count):
+        nonlocal rows
+        rows += count
+        context.progress(rows / total if total else 1.0, f'{rows} / {total} lignes')
+
+    chunks = export.export_chunks(query, format, on_rows)
+    directory = current_app.config['EXPORT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'job-{context.job_id}-{dataset}.{export.FORMATS[format][1]}')
+    written = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            context.check()
+            data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            f.write(data)
+            written += len(data)
+    return {'file': os.path.abspath(path), 'rows': rows, 'bytes': written, 'format': format}
+
+@scheduled('inventory.snapshot')
+def inventory_snapshot_due():
+    import ledger
+    return ledger.snapshot_due()
+
+@job_type('inventory.snapshot')
+def inventory_snapshot_job(context):
+    import ledger
+    snapshot = ledger.take_snapshot()
+    if snapshot is None:
+        return {'snapshot': None}
+    return {'snapshot': snapshot.id, 'lines': snapshot.line_count,
+            'last_movement_id': snapshot.last_movement_id, 'taken_at': snapshot.taken_at}
+
+@job_type('migrations.upgrade')
+def migrations_job(context):
+    import migrations
+    return {'applied': migrations.upgrade()}
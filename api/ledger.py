@@ -0,0 +1,186 @@
+# ledger.py
+# Journal des mouvements d'inventaire (table inventory_movements, ajout seul) et instantanés
+# compacts : l'état à une date est reconstruit à partir de l'instantané le plus proche et des
+# seuls mouvements situés entre lui et l'instantané suivant, sans rejouer tout l'historique
+import argparse
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, Inventory, InventoryMovement, InventorySnapshot, InventorySnapshotLine
+
+# Mouvements plus récents que SNAPSHOT_LAG secondes laissés hors des instantanés : les identifiants
+# sont attribués à l'insertion, une transaction encore ouverte peut valider un identifiant plus petit
+SNAPSHOT_LAG = 60
+DEFAULT_SNAPSHOT_EVERY = 50000    # Mouvements au plus entre deux instantanés
+DEFAULT_SNAPSHOT_INTERVAL = 3600  # Secondes au plus entre deux instantanés, s'il y a eu des mouvements
+
+class LedgerError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def movement(product_id, zone_id, delta, reason, user_id=None, order_id=None, source=None):
+    return {'product_id': product_id, 'zone_id': zone_id, 'delta': delta, 'reason': reason,
+            'user_id': user_id, 'order_id': order_id, 'source': source}
+
+def record(movements):
+    # Dans la transaction de l'écriture d'inventaire, en un seul executemany ; variations nulles ignorées
+    now = datetime.utcnow()
+    rows = [dict(m, created_at=now) for m in movements if m['delta']]
+    if rows:
+        db.session.execute(db.insert(InventoryMovement.__table__), rows)
+
+def movements_between(after, until, product_id=None, zone_id=None, as_of=None):
+    # Plage de clés primaires bornée par deux instantanés
+    query = db.select(InventoryMovement.product_id, InventoryMovement.zone_id,
+                      InventoryMovement.delta.label('quantity')).where(InventoryMovement.id > after)
+    if until is not None:
+        query = query.where(InventoryMovement.id <= until)
+    if as_of is not None:
+        query = query.where(InventoryMovement.created_at <= as_of)
+    if product_id is not None:
+        query = query.where(InventoryMovement.product_id == product_id)
+    if zone_id is not None:
+        query = query.where(InventoryMovement.zone_id == zone_id)
+    return query
+
+def snapshot_lines(snapshot_id, product_id=None, zone_id=None):
+    query = db.select(InventorySnapshotLine.product_id, InventorySnapshotLine.zone_id,
+                      InventorySnapshotLine.quantity).where(InventorySnapshotLine.snapshot_id == snapshot_id)
+    if product_id is not None:
+        query = query.where(InventorySnapshotLine.product_id == product_id)
+    if zone_id is not None:
+        query = query.where(InventorySnapshotLine.zone_id == zone_id)
+    return query
+
+def combine(parts):
+    # Somme par ligne de l'instantané et des mouvements ; lignes à zéro écartées
+    union = db.union_all(*parts).subquery()
+    return db.select(union.c.product_id, union.c.zone_id,
+                     db.func.sum(union.c.quantity).label('quantity')) \
+        .group_by(union.c.product_id, union.c.zone_id) \
+        .having(db.func.sum(union.c.quantity) != 0)
+
+def baseline_snapshot(conn):
+    # Premier instantané, copie de la table inventory : point de départ de l'historique
+    now = datetime.utcnow()
+    last = conn.execute(db.select(db.func.coalesce(db.func.max(InventoryMovement.id), 0))).scalar()
+    snapshot_id = conn.execute(db.insert(InventorySnapshot.__table__).values(
+        last_movement_id=last, taken_at=now, line_count=0, created_at=now)).inserted_primary_key[0]
+    count = conn.execute(db.insert(InventorySnapshotLine.__table__).from_select(
+        ['snapshot_id', 'product_id', 'zone_id', 'quantity'],
+        db.select(db.literal(snapshot_id), Inventory.product_id, Inventory.zone_id, Inventory.quantity)
+        .where(Inventory.quantity != 0)
+    )).rowcount
+    conn.execute(db.update(InventorySnapshot.__table__).where(InventorySnapshot.id == snapshot_id)
+                 .values(line_count=count))
+    return snapshot_id
+
+def snapshot_every():
+    return current_app.config.get('INVENTORY_SNAPSHOT_EVERY', DEFAULT_SNAPSHOT_EVERY)
+
+def latest_snapshot():
+    return db.session.execute(
+        db.select(InventorySnapshot).order_by(InventorySnapshot.last_movement_id.desc()).limit(1)
+    ).scalar()
+
+def snapshot_due(now=None):
+    # Vérifié périodiquement par le répartiteur de tâches (jobs.py) : au moins
+    # INVENTORY_SNAPSHOT_EVERY mouvements depuis le dernier instantané, ou des mouvements et un
+    # instantané plus ancien que INVENTORY_SNAPSHOT_INTERVAL
+    now = now or datetime.utcnow()
+    latest = latest_snapshot()
+    after = latest.last_movement_id if latest else 0
+    newest = db.session.execute(db.select(db.func.max(InventoryMovement.id))).scalar()
+    if newest is None or newest <= after:
+        return False
+    if newest - after >= snapshot_every():
+        return True
+    interval = current_app.config.get('INVENTORY_SNAPSHOT_INTERVAL', DEFAULT_SNAPSHOT_INTERVAL)
+    return latest is None or latest.created_at <= now - timedelta(seconds=interval)
+
+def take_snapshot(now=None):
+    # Instantanés espacés d'au plus INVENTORY_SNAPSHOT_EVERY mouvements : après une longue période
+    # sans instantané, plusieurs sont créés d'affilée (une lecture as_of ne rejoue jamais plus
+    # d'un intervalle). Renvoie le dernier créé, ou None s'il n'y a rien de nouveau
+    now = now or datetime.utcnow()
+    eligible = db.session.execute(
+        db.select(db.func.max(InventoryMovement.id))
+        .where(InventoryMovement.created_at <= now - timedelta(seconds=SNAPSHOT_LAG))
+    ).scalar()
+    previous = latest_snapshot()
+    snapshot = None
+    while eligible is not None and eligible > (previous.last_movement_id if previous else 0):
+        previous = snapshot = build_snapshot(previous, eligible, now)
+    return snapshot
+
+def build_snapshot(previous, eligible, now):
+    # Instantané précédent + mouvements suivants (au plus INVENTORY_SNAPSHOT_EVERY), en une
+    # requête ensembliste
+    after = previous.last_movement_id if previous else 0
+    last = db.session.execute(
+        db.select(InventoryMovement.id).where(InventoryMovement.id > after, InventoryMovement.id <= eligible)
+        .order_by(InventoryMovement.id).offset(snapshot_every() - 1).limit(1)
+    ).scalar() or eligible
+    taken_at = db.session.execute(
+        db.select(db.func.max(InventoryMovement.created_at))
+        .where(InventoryMovement.id > after, InventoryMovement.id <= last)
+    ).scalar() or (previous.taken_at if previous else now)
+
+    snapshot = InventorySnapshot(last_movement_id=last, taken_at=taken_at, created_at=now)
+    db.session.add(snapshot)
+    db.session.flush()
+    parts = [movements_between(after, last)]
+    if previous:
+        parts.insert(0, snapshot_lines(previous.id))
+    state = combine(parts).subquery()
+    db.session.execute(db.insert(InventorySnapshotLine.__table__).from_select(
+        ['snapshot_id', 'product_id', 'zone_id', 'quantity'],
+        db.select(db.literal(snapshot.id), state.c.product_id, state.c.zone_id, state.c.quantity)
+    ))
+    snapshot.line_count = db.session.execute(
+        db.select(db.func.count()).where(InventorySnapshotLine.snapshot_id == snapshot.id)
+    ).scalar()
+    db.session.commit()
+    return snapshot
+
+def state_as_of(as_of, product_id=None, zone_id=None):
+    # Requête (product_id, zone_id, quantity) de l'inventaire à la date as_of, et nombre de
+    # mouvements à rejouer depuis l'instantané retenu
+    base = db.session.execute(
+        db.select(InventorySnapshot).where(InventorySnapshot.taken_at <= as_of)
+        .order_by(InventorySnapshot.last_movement_id.desc()).limit(1)
+    ).scalar()
+    if base is None:
+        first = db.session.execute(db.select(db.func.min(InventorySnapshot.taken_at))).scalar()
+        if first is not None:
+            raise LedgerError(f'Historique disponible à partir du {first.isoformat()}')
+    after = base.last_movement_id if base else 0
+    # Les mouvements antérieurs à as_of sont tous couverts par l'instantané suivant
+    until = db.session.execute(
+        db.select(db.func.min(InventorySnapshot.last_movement_id))
+        .where(InventorySnapshot.last_movement_id > after, InventorySnapshot.taken_at > as_of)
+    ).scalar()
+
+    movements = movements_between(after, until, product_id, zone_id, as_of)
+    replayed = db.session.execute(
+        db.select(db.func.count()).select_from(movements.subquery())
+    ).scalar()
+    parts = [movements]
+    if base:
+        parts.insert(0, snapshot_lines(base.id, product_id, zone_id))
+    return combine(parts), replayed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Instantanés du journal d'inventaire")
+    parser.add_argument('command', choices=['snapshot'])
+    args = parser.parse_args()
+
+    from factory import create_base_app
+    with create_base_app().app_context():
+        snapshot = take_snapshot()
+        if snapshot is None:
+            print('Aucun nouveau mouvement')
+        else:
+            print(f'Instantané {snapshot.id} : {snapshot.line_count} lignes, '
+                  f'mouvements jusqu\'à {snapshot.last_movement_id} ({snapshot.taken_at.isoformat()})')
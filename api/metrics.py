@@ -0,0 +1,131 @@
+# metrics.py
+# Instrumentation par route : latence, statut, taille de réponse, nombre et durée des requêtes SQL.
+# Exposition au format Prometheus sur /metrics et journal optionnel des requêtes lentes.
+import bisect
+import logging
+import threading
+import time
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('stockgenius.slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}      # (method, route, status) -> nombre
+        self.latency = {}       # (method, route) -> Histogram
+        self.size = {}
+        self.queries = {}
+        self.db_time = {}       # (method, route) -> secondes
+
+    def record(self, method, route, status, duration, size, queries, db_time):
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.size[key] = Histogram(SIZE_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.db_time[key] = 0.0
+            self.latency[key].observe(duration)
+            if size is not None:
+                self.size[key].observe(size)
+            self.queries[key].observe(queries)
+            self.db_time[key] += db_time
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# HELP http_requests_total Requêtes HTTP traitées')
+            lines.append('# TYPE http_requests_total counter')
+            for (method, route, status), n in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+            render_histograms(lines, 'http_request_duration_seconds', 'Latence des requêtes HTTP', self.latency)
+            render_histograms(lines, 'http_response_size_bytes', 'Taille des réponses HTTP', self.size)
+            render_histograms(lines, 'db_queries_per_request', 'Requêtes SQL par requête HTTP', self.queries)
+            lines.append('# HELP db_query_duration_seconds_total Temps passé en base par route')
+            lines.append('# TYPE db_query_duration_seconds_total counter')
+            for (method, route), seconds in sorted(self.db_time.items()):
+                lines.append(f'db_query_duration_seconds_total{{method="{method}",route="{route}"}} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+def render_histograms(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (method, route), h in sorted(histograms.items()):
+        labels = f'method="{method}",route="{route}"'
+        cumulative = 0
+        for bound, n in zip(h.buckets, h.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+        lines.append(f'{name}_sum{{{labels}}} {h.total}')
+        lines.append(f'{name}_count{{{labels}}} {h.count}')
+
+registry = Registry()
+
+def init_metrics(app):
+    # SLOW_REQUEST_MS : seuil (ms) au-delà duquel la requête et son SQL sont journalisés
+    slow_ms = app.config.get('SLOW_REQUEST_MS')
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.sql_statements = [] if slow_ms else None
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        # Réponses en flux : latence jusqu'au premier octet, taille inconnue
+        size = None if response.is_streamed else response.calculate_content_length()
+        registry.record(request.method, route, response.status_code, duration,
+                        size, g.sql_count, g.sql_time)
+        if slow_ms and duration * 1000 >= slow_ms:
+            logger.warning('Requête lente %s %s : %.1f ms, %d requêtes SQL (%.1f ms)\n%s',
+                           request.method, request.full_path, duration * 1000, g.sql_count,
+                           g.sql_time * 1000, '\n'.join(g.sql_statements or []))
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(
+        registry.render(), mimetype='text/plain; version=0.0.4'))
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Début porté par le contexte d'exécution, qui disparaît avec la requête, même en erreur
+    # (une pile dans conn.info grossirait à chaque requête échouée)
+    context._query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+        if g.sql_statements is not None:
+            g.sql_statements.append(f'[{elapsed * 1000:.1f} ms] {statement}')
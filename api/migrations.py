@@ -0,0 +1,275 @@
+# migrations.py
+# Évolution du schéma sans perte de données : migrations numérotées, appliquées une seule fois
+# et enregistrées dans schema_migrations. Chaque étape vérifie l'état réel de la base avant
+# d'agir, si bien qu'une migration interrompue (DDL non transactionnel sous MySQL) peut être relancée.
+import argparse
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import db, SchemaMigration, SensorData, Order, ProductStock, Alert, Product, User, Job, \
+    InventoryMovement, InventorySnapshot, InventorySnapshotLine
+import stock
+import ledger
+
+LOCK_NAME = 'stock_genius_migrations'
+LOCK_TIMEOUT = 60      # secondes
+PG_LOCK_KEY = 7413     # Clé de pg_advisory_lock
+
+MIGRATIONS = []
+
+def migration(version, name, transactional=True):
+    # transactional=False : la migration reçoit une connexion en autocommit
+    # (CREATE INDEX CONCURRENTLY sous PostgreSQL)
+    def register(fn):
+        MIGRATIONS.append((version, name, transactional, fn))
+        return fn
+    return register
+
+def add_column(conn, column):
+    # ALTER TABLE ... ADD COLUMN, avec la clé étrangère éventuelle du modèle
+    dialect = conn.dialect
+    table = column.table.name
+    ddl = f'ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}'
+    for fk in column.foreign_keys:
+        target = f'{fk.column.table.name}({fk.column.name})'
+        if dialect.name == 'mysql':
+            ddl += f', ADD FOREIGN KEY ({column.name}) REFERENCES {target}'
+        else:
+            ddl += f' REFERENCES {target}'
+    if dialect.name == 'mysql' and not column.foreign_keys:
+        # L'ajout d'une clé étrangère n'est en ligne qu'avec foreign_key_checks=0 : MySQL choisit alors
+        ddl += ', ALGORITHM=INPLACE, LOCK=NONE'
+    conn.execute(text(ddl))
+
+def add_missing_columns(conn, columns):
+    inspector = inspect(conn)
+    existing = {}
+    for column in columns:
+        table = column.table.name
+        if table not in existing:
+            existing[table] = {c['name'] for c in inspector.get_columns(table)}
+        if column.name not in existing[table]:
+            add_column(conn, column)
+
+def drop_not_null(conn, column):
+    # Rend une colonne facultative ; SQLite ne sait pas modifier une colonne : la table est recréée
+    table = column.table
+    current = {c['name']: c for c in inspect(conn).get_columns(table.name)}
+    if current[column.name]['nullable']:
+        return
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        conn.execute(text(f'ALTER TABLE {table.name} MODIFY {column.name} '
+                          f'{column.type.compile(dialect=conn.dialect)} NULL, ALGORITHM=INPLACE, LOCK=NONE'))
+    elif dialect == 'postgresql':
+        conn.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL'))
+    else:
+        rebuild_sqlite_table(conn, table, current)
+
+def rebuild_sqlite_table(conn, table, current):
+    # Les noms d'index sont globaux sous SQLite : ceux de l'ancienne table sont supprimés d'abord
+    for index in inspect(conn).get_indexes(table.name):
+        conn.execute(text(f'DROP INDEX {index["name"]}'))
+    conn.execute(text(f'ALTER TABLE {table.name} RENAME TO {table.name}_old'))
+    table.create(conn)
+    columns = ', '.join(c.name for c in table.columns if c.name in current)
+    conn.execute(text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old'))
+    conn.execute(text(f'DROP TABLE {table.name}_old'))
+
+def find_index(conn, table, columns):
+    # Index existant couvrant les mêmes colonnes en tête (ex. index implicite d'une clé étrangère MySQL)
+    for index in inspect(conn).get_indexes(table):
+        if index['column_names'][:len(columns)] == columns:
+            return index['name']
+    return None
+
+def create_index_online(conn, index):
+    # Création sans bloquer les écritures : ALGORITHM=INPLACE, LOCK=NONE sous MySQL (InnoDB),
+    # CONCURRENTLY sous PostgreSQL ; SQLite n'a pas de mode en ligne
+    table = index.table.name
+    columns = [c.name for c in index.columns]
+    if find_index(conn, table, columns):
+        return False
+    ddl = f'CREATE INDEX {index.name} ON {table} ({", ".join(columns)})'
+    if conn.dialect.name == 'mysql':
+        ddl += ' ALGORITHM=INPLACE LOCK=NONE'
+    elif conn.dialect.name == 'postgresql':
+        ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1)
+    conn.execute(text(ddl))
+    return True
+
+@migration(1, 'initial_schema')
+def initial_schema(conn):
+    # Tables absentes (base neuve ou antérieure aux tables de synthèse) ; les tables existantes
+    # ne sont pas modifiées ici
+    missing = set(db.metadata.tables) - set(inspect(conn).get_table_names())
+    db.metadata.create_all(conn, checkfirst=True)
+    if 'product_stock' in missing and 'inventory' not in missing:
+        summary = stock.aggregate().subquery()
+        conn.execute(
+            db.insert(ProductStock.__table__).from_select(
+                ['product_id', 'total_quantity', 'zone_count', 'last_update_at'],
+                db.select(summary.c.product_id, summary.c.total_quantity,
+                          summary.c.zone_count, summary.c.last_update_at)
+            )
+        )
+
+@migration(2, 'sensor_numeric_value_order_zone')
+def sensor_numeric_value_order_zone(conn):
+    add_missing_columns(conn, [SensorData.__table__.c.numeric_value, Order.__table__.c.zone_id])
+
+def model_index(name):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+@migration(3, 'secondary_indexes', transactional=False)
+def secondary_indexes(conn):
+    # Liste figée : les index ajoutés plus tard aux modèles ont leur propre migration
+    for name in ('ix_alerts_status_created_at', 'ix_orders_product_id_created_at', 'ix_products_category_id',
+                 'ix_products_rfid_tag', 'ix_sensor_data_sensor_id_saved_at', 'ix_users_rfid_card'):
+        create_index_online(conn, model_index(name))
+
+@migration(4, 'jobs')
+def jobs(conn):
+    Job.__table__.create(conn, checkfirst=True)
+
+@migration(5, 'sensor_alerts')
+def sensor_alerts(conn):
+    # Alertes de capteurs : product_id devient facultatif, sensor_id et message sont ajoutés
+    alerts = Alert.__table__
+    add_missing_columns(conn, [alerts.c.sensor_id, alerts.c.message])
+    drop_not_null(conn, alerts.c.product_id)
+    create_index_online(conn, model_index('ix_alerts_sensor_id_status'))
+
+@migration(6, 'inventory_ledger')
+def inventory_ledger(conn):
+    # Journal des mouvements et instantanés ; l'inventaire actuel sert d'instantané de départ
+    for table in (InventoryMovement.__table__, InventorySnapshot.__table__, InventorySnapshotLine.__table__):
+        table.create(conn, checkfirst=True)
+    if conn.execute(db.select(db.func.count()).select_from(InventorySnapshot.__table__)).scalar() == 0:
+        ledger.baseline_snapshot(conn)
+
+@contextmanager
+def migration_lock(engine):
+    # Un seul processus migre à la fois (plusieurs workers démarrés ensemble)
+    with engine.connect() as conn:
+        if engine.dialect.name == 'mysql':
+            if not conn.execute(text('SELECT GET_LOCK(:name, :timeout)'),
+                                {'name': LOCK_NAME, 'timeout': LOCK_TIMEOUT}).scalar():
+                raise RuntimeError('Verrou de migration indisponible')
+        elif engine.dialect.name == 'postgresql':
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': PG_LOCK_KEY})
+        try:
+            yield
+        finally:
+            if engine.dialect.name == 'mysql':
+                conn.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': LOCK_NAME})
+            elif engine.dialect.name == 'postgresql':
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': PG_LOCK_KEY})
+
+def applied_versions(conn):
+    SchemaMigration.__table__.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(db.select(SchemaMigration.version))}
+
+def upgrade(target=None):
+    engine = db.engine
+    applied = []
+    with migration_lock(engine):
+        with engine.begin() as conn:
+            done = applied_versions(conn)
+        for version, name, transactional, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in done or (target is not None and version > target):
+                continue
+            if transactional:
+                with engine.begin() as conn:
+                    fn(conn)
+            else:
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    fn(conn)
+            with engine.begin() as conn:
+                conn.execute(db.insert(SchemaMigration.__table__),
+                             {'version': version, 'name': name, 'applied_at': datetime.utcnow()})
+            applied.append(version)
+    return applied
+
+def status():
+    with db.engine.begin() as conn:
+        rows = {row.version: row.applied_at for row in conn.execute(
+            db.select(SchemaMigration.version, SchemaMigration.applied_at))} \
+            if inspect(conn).has_table(SchemaMigration.__tablename__) else {}
+    return [{'version': version, 'name': name,
+             'applied_at': rows[version].isoformat() if version in rows else None}
+            for version, name, _, _ in sorted(MIGRATIONS, key=lambda m: m[0])]
+
+# Requêtes fréquentes et index attendu ; check() vérifie avec EXPLAIN qu'elles n'entraînent
+# pas de parcours complet de la table
+def hot_queries():
+    since = datetime(2000, 1, 1)
+    return [
+        ('sensor_data(sensor_id, saved_at)',
+         db.select(SensorData.id).where(SensorData.sensor_id == 1, SensorData.saved_at >= since)
+         .order_by(SensorData.saved_at)),
+        ('alerts(status, created_at)',
+         db.select(Alert.id).where(Alert.status == 'open').order_by(Alert.created_at.desc())),
+        ('orders(product_id, created_at)',
+         db.select(Order.id).where(Order.product_id == 1, Order.created_at >= since)),
+        ('products(category_id)',
+         db.select(Product.id).where(Product.category_id == 1)),
+        ('products(rfid_tag)',
+         db.select(Product.id).where(Product.rfid_tag == 'TAG')),
+        ('users(rfid_card)',
+         db.select(User.id).where(User.rfid_card == 'CARD')),
+        ('inventory_movements(product_id, zone_id, id)',
+         db.select(InventoryMovement.delta).where(InventoryMovement.product_id == 1,
+                                                  InventoryMovement.zone_id == 1, InventoryMovement.id > 0)),
+    ]
+
+def explain(conn, statement):
+    # Renvoie le plan et un booléen : accès par index ou parcours complet
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    name = conn.dialect.name
+    if name == 'sqlite':
+        plan = [row.detail for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+        return plan, all('INDEX' in line or not line.startswith('SCAN') for line in plan)
+    if name == 'mysql':
+        rows = [row._asdict() for row in conn.execute(text('EXPLAIN ' + sql))]
+        return rows, all(row.get('type') != 'ALL' for row in rows)
+    if name == 'postgresql':
+        # Sur une petite table le planificateur préfère le parcours séquentiel : on l'écarte
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = [row[0] for row in conn.execute(text('EXPLAIN ' + sql))]
+        return plan, not any('Seq Scan' in line for line in plan)
+    raise ValueError(f'Dialecte non pris en charge : {name}')
+
+def check():
+    results = []
+    with db.engine.begin() as conn:
+        for label, statement in hot_queries():
+            plan, uses_index = explain(conn, statement)
+            results.append({'query': label, 'uses_index': uses_index, 'plan': plan})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrations du schéma de la base de données')
+    parser.add_argument('command', choices=['upgrade', 'status', 'check'])
+    parser.add_argument('--target', type=int, help='Dernière version à appliquer')
+    args = parser.parse_args()
+
+    from factory import create_base_app
+    with create_base_app().app_context():
+        if args.command == 'upgrade':
+            print('Migrations appliquées :', upgrade(args.target) or 'aucune')
+        elif args.command == 'status':
+            for entry in status():
+                print(f"{entry['version']:>4}  {entry['name']:<40} {entry['applied_at'] or 'en attente'}")
+        else:
+            results = check()
+            for result in results:
+                print(f"{'OK ' if result['uses_index'] else 'KO '} {result['query']}")
+                for line in result['plan']:
+                    print('      ', line)
+            sys.exit(0 if all(result['uses_index'] for result in results) else 1)
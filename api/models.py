@@ -1,7 +1,8 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from passwords import hash_password
 
 
 # Initialisation de SQLAlchemy
@@ -15,7 +16,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)  # Renommer pour clarifier que c'est un hash
     email = db.Column(db.String(255), nullable=False, unique=True)
     role = db.Column(db.String(50), nullable=False)
-    rfid_card = db.Column(db.String(100))
+    rfid_card = db.Column(db.String(100), index=True)  # Identification par badge
     # Pas besoin de stocker le token JWT dans la base de données
     
     # Relations
@@ -28,7 +29,7 @@ class User(db.Model):
         
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)  # Méthode configurable (PASSWORD_HASH_METHOD)
         
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -36,6 +37,27 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    # Migrations appliquées (voir migrations.py)
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.name}>'
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    
+    # Compteur incrémenté à chaque modification d'une table de référence (categories, zones)
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
 class Category(db.Model):
     __tablename__ = 'categories'
     
@@ -55,10 +77,10 @@ class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     designation = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(255))
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False, index=True)
     min_threshold = db.Column(db.Float, nullable=False)
     max_threshold = db.Column(db.Float, nullable=False)
-    rfid_tag = db.Column(db.String(100))
+    rfid_tag = db.Column(db.String(100), index=True)  # Résolution des lectures RFID
     
     # Relations
     inventories = db.relationship('Inventory', backref='product', lazy=True)
@@ -97,6 +119,61 @@ class Inventory(db.Model):
     def __repr__(self):
         return f'<Inventory product_id={self.product_id}, zone_id={self.zone_id}>'
 
+class InventoryMovement(db.Model):
+    __tablename__ = 'inventory_movements'
+    __table_args__ = (
+        db.Index('ix_inventory_movements_product_id_zone_id_id', 'product_id', 'zone_id', 'id'),  # Historique d'une ligne
+        db.Index('ix_inventory_movements_created_at', 'created_at'),
+    )
+    
+    # Journal des variations d'inventaire, en ajout seul (voir ledger.py)
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    zone_id = db.Column(db.Integer, db.ForeignKey('zones.id'), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # adjustment, count, rfid, order, cancelled, returned
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
+    source = db.Column(db.String(100))  # Lecteur RFID, etc.
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<InventoryMovement {self.id} product_id={self.product_id} delta={self.delta}>'
+
+class InventorySnapshot(db.Model):
+    __tablename__ = 'inventory_snapshots'
+    
+    # État complet de l'inventaire après le mouvement last_movement_id (daté taken_at)
+    id = db.Column(db.Integer, primary_key=True)
+    last_movement_id = db.Column(db.Integer, nullable=False, unique=True)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<InventorySnapshot {self.id} last_movement_id={self.last_movement_id}>'
+
+class InventorySnapshotLine(db.Model):
+    __tablename__ = 'inventory_snapshot_lines'
+    
+    # Lignes de quantité non nulle seulement
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('inventory_snapshots.id'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    zone_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+class ProductStock(db.Model):
+    __tablename__ = 'product_stock'
+    
+    # Totaux par produit, tenus à jour dans la transaction de chaque écriture d'inventaire
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    zone_count = db.Column(db.Integer, nullable=False, default=0)  # Zones avec une quantité > 0
+    last_update_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ProductStock product_id={self.product_id} total={self.total_quantity}>'
+
 class Sensor(db.Model):
     __tablename__ = 'sensors'
     
@@ -107,6 +184,8 @@ class Sensor(db.Model):
     last_reading = db.Column(db.DateTime)
     
     # Relations
+    # Pas de ON DELETE CASCADE dans le schéma : l'historique est supprimé par retention.purge_sensor,
+    # par paquets (une suppression par l'ORM chargerait toutes les mesures)
     sensor_data = db.relationship('SensorData', backref='sensor', lazy=True, cascade="all, delete-orphan")
     
     def __repr__(self):
@@ -114,21 +193,48 @@ class Sensor(db.Model):
 
 class SensorData(db.Model):
     __tablename__ = 'sensor_data'
+    __table_args__ = (
+        db.Index('ix_sensor_data_sensor_id_saved_at', 'sensor_id', 'saved_at'),  # Historique d'un capteur
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), nullable=False)
     value = db.Column(db.String(255), nullable=False)
+    numeric_value = db.Column(db.Float)  # Valeur convertie, NULL si la lecture n'est pas numérique
     saved_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
         return f'<SensorData {self.id} sensor_id={self.sensor_id}>'
 
+class SensorRollup(db.Model):
+    __tablename__ = 'sensor_rollups'
+    
+    # Agrégats par capteur et par intervalle (minute, hour, day)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), primary_key=True)
+    resolution = db.Column(db.String(10), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)  # Début de l'intervalle
+    
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    sum_value = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<SensorRollup sensor_id={self.sensor_id} {self.resolution} {self.bucket}>'
+
 class Alert(db.Model):
     __tablename__ = 'alerts'
+    __table_args__ = (
+        db.Index('ix_alerts_status_created_at', 'status', 'created_at'),  # Alertes ouvertes, les plus récentes
+        db.Index('ix_alerts_sensor_id_status', 'sensor_id', 'status'),  # Alertes ouvertes d'un capteur
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    # Alerte de stock (product_id) ou de capteur (sensor_id)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'))
     type = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.String(255))
     status = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # La personne assignée à l'alerte
@@ -138,6 +244,9 @@ class Alert(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_product_id_created_at', 'product_id', 'created_at'),  # Historique d'un produit
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
@@ -147,6 +256,7 @@ class Order(db.Model):
     delivered_at = db.Column(db.DateTime)
     returned_at = db.Column(db.DateTime)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # L'utilisateur qui a créé la commande
+    zone_id = db.Column(db.Integer, db.ForeignKey('zones.id'))  # Zone dont le stock a été prélevé
     
     def __repr__(self):
         return f'<Order {self.id} product_id={self.product_id}>'
@@ -168,6 +278,32 @@ class OrderPrediction(db.Model):
     def __repr__(self):
         return f'<OrderPrediction {self.id} product_id={self.product_id}>'
 
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_id', 'status', 'id'),  # File d'attente des tâches
+    )
+    
+    # Tâches longues exécutées en arrière-plan (voir jobs.py)
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # queued, running, succeeded, failed, cancelled
+    params = db.Column(db.Text)  # JSON
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    progress = db.Column(db.Float, nullable=False, default=0)  # Entre 0 et 1
+    message = db.Column(db.String(255))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100))  # hôte:pid du processus qui l'exécute
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.type} {self.status}>'
+
 # Table d'association entre prédictions et commandes (relation many-to-many)
 prediction_orders = db.Table('prediction_orders',
     db.Column('prediction_id', db.Integer, db.ForeignKey('order_predictions.id'), primary_key=True),
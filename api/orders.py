@@ -0,0 +1,177 @@
+# orders.py
+# Cycle de vie des commandes : réservation du stock par UPDATE atomique, livraison, retour,
+# annulation, avec nouvelle tentative en cas d'interblocage ou de verrou expiré
+import random
+import time
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from models import db, Inventory, Order
+from inventory import after_inventory_write, add_quantities, queue_inventory_lines
+from ledger import movement, record
+from events import queue_event
+
+STATUS_RESERVED = 'reserved'
+STATUS_DELIVERED = 'delivered'
+STATUS_RETURNED = 'returned'
+STATUS_CANCELLED = 'cancelled'
+
+# Statut cible -> statut de départ autorisé
+TRANSITIONS = {
+    STATUS_DELIVERED: STATUS_RESERVED,
+    STATUS_CANCELLED: STATUS_RESERVED,
+    STATUS_RETURNED: STATUS_DELIVERED
+}
+# Transitions qui remettent la quantité en stock
+RESTOCK = (STATUS_CANCELLED, STATUS_RETURNED)
+
+MAX_ATTEMPTS = 5
+MYSQL_RETRYABLE = (1205, 1213)  # Lock wait timeout, deadlock
+
+class OrderError(Exception):
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+# Erreurs par commande d'une transition : code renvoyé dans les résultats et statut HTTP associé
+ERROR_NOT_FOUND = 'not_found'
+ERROR_INVALID_TRANSITION = 'invalid_transition'
+ERROR_STATUS = {ERROR_NOT_FOUND: 404, ERROR_INVALID_TRANSITION: 409}
+
+def is_retryable(error):
+    code = error.orig.args[0] if error.orig is not None and error.orig.args else None
+    return code in MYSQL_RETRYABLE or 'database is locked' in str(error.orig)
+
+def with_retry(fn, *args):
+    # Rejoue toute la transaction ; attente exponentielle avec gigue
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return fn(*args)
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == MAX_ATTEMPTS or not is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+        except Exception:
+            db.session.rollback()
+            raise
+
+def take_stock(product_id, zone_id, quantity):
+    # Décrément conditionnel : jamais de stock négatif, pas de mise à jour perdue
+    inventory = Inventory.__table__
+    result = db.session.execute(
+        db.update(inventory)
+        .where(inventory.c.product_id == product_id,
+               inventory.c.zone_id == zone_id,
+               inventory.c.quantity >= quantity)
+        .values(quantity=inventory.c.quantity - quantity, last_update_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+def create_order(product_id, quantity, user_id, zone_id=None):
+    return with_retry(_create_order, product_id, quantity, user_id, zone_id)
+
+def _create_order(product_id, quantity, user_id, zone_id):
+    if zone_id is not None:
+        candidates = [zone_id]
+    else:
+        # Zones ayant assez de stock, toujours essayées dans le même ordre
+        candidates = db.session.execute(
+            db.select(Inventory.zone_id)
+            .where(Inventory.product_id == product_id, Inventory.quantity >= quantity)
+            .order_by(Inventory.zone_id)
+        ).scalars().all()
+
+    taken_from = None
+    for candidate in candidates:
+        if take_stock(product_id, candidate, quantity):
+            taken_from = candidate
+            break
+    if taken_from is None:
+        raise OrderError('Stock insuffisant')
+
+    order = Order(product_id=product_id, zone_id=taken_from, quantity=quantity,
+                  status=STATUS_RESERVED, user_id=user_id)
+    db.session.add(order)
+    db.session.flush()
+    record([movement(product_id, taken_from, -int(quantity), 'order', user_id, order.id)])
+    after_inventory_write({(product_id, taken_from): -int(quantity)})
+    queue_inventory_lines([(product_id, taken_from)])
+    queue_event('order', order_data(order))
+    db.session.commit()
+    return order
+
+def transition(order_ids, status, user_id=None):
+    if status not in TRANSITIONS:
+        raise OrderError('Statut cible invalide', 400)
+    return with_retry(_transition, sorted(set(order_ids)), status, user_id)
+
+def _transition(order_ids, status, user_id):
+    # Commandes verrouillées dans l'ordre des identifiants (FOR UPDATE, ignoré par SQLite)
+    orders = db.session.execute(
+        db.select(Order.id, Order.product_id, Order.zone_id, Order.quantity, Order.status)
+        .where(Order.id.in_(order_ids))
+        .order_by(Order.id)
+        .with_for_update()
+    ).all()
+    found = {order.id: order for order in orders}
+
+    results = []
+    eligible = []
+    for order_id in order_ids:
+        order = found.get(order_id)
+        if order is None:
+            results.append({'id': order_id, 'status': 'error', 'code': ERROR_NOT_FOUND,
+                            'error': 'Commande non trouvée'})
+        elif order.status != TRANSITIONS[status]:
+            results.append({'id': order_id, 'status': 'error', 'code': ERROR_INVALID_TRANSITION,
+                            'error': f'Transition impossible depuis le statut {order.status}'})
+        else:
+            results.append({'id': order_id, 'status': status})
+            eligible.append(order)
+
+    if eligible:
+        now = datetime.utcnow()
+        values = {'status': status}
+        if status == STATUS_DELIVERED:
+            values['delivered_at'] = now
+        elif status == STATUS_RETURNED:
+            values['returned_at'] = now
+        orders_table = Order.__table__
+        db.session.execute(
+            db.update(orders_table)
+            .where(orders_table.c.id.in_([order.id for order in eligible]),
+                   orders_table.c.status == TRANSITIONS[status])
+            .values(**values)
+        )
+
+        if status in RESTOCK:
+            lines = {}
+            for order in eligible:
+                if order.zone_id is not None:
+                    key = (order.product_id, order.zone_id)
+                    lines[key] = lines.get(key, 0) + int(order.quantity)
+            applied = add_quantities(lines)
+            # Un mouvement par commande remise en stock
+            record([movement(order.product_id, order.zone_id, int(order.quantity), status, user_id, order.id)
+                    for order in eligible if order.zone_id is not None])
+            after_inventory_write(applied)
+            queue_inventory_lines(sorted(lines))
+        for order in eligible:
+            queue_event('order', {'id': order.id, 'product_id': order.product_id, 'status': status})
+
+    db.session.commit()
+    return results
+
+def order_data(order):
+    return {
+        'id': order.id,
+        'product_id': order.product_id,
+        'zone_id': order.zone_id,
+        'quantity': order.quantity,
+        'status': order.status,
+        'created_at': order.created_at,
+        'delivered_at': order.delivered_at,
+        'returned_at': order.returned_at,
+        'user_id': order.user_id
+    }
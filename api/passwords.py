@@ -0,0 +1,65 @@
+# passwords.py
+# Hachage des mots de passe : méthode et coût configurables (PASSWORD_HASH_METHOD),
+# calcul déporté sur un pool de threads borné
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingPoolBusy(Exception):
+    pass
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+_prefixes = {}
+
+def configured_method():
+    # None = méthode par défaut de werkzeug ; sinon ex. "pbkdf2:sha256:600000" ou "scrypt:16384:8:1"
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD')
+    return None
+
+def hash_password(password, method=None):
+    method = method or configured_method()
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+def method_prefix(method):
+    # Préfixe "méthode:paramètres" normalisé tel que produit par werkzeug
+    if method not in _prefixes:
+        _prefixes[method] = hash_password('', method).split('$', 1)[0]
+    return _prefixes[method]
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != method_prefix(configured_method())
+
+def get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = current_app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1
+            queue = current_app.config.get('PASSWORD_HASH_QUEUE', workers * 8)
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(workers + queue)
+        return _pool, _slots
+
+def run_in_pool(fn, *args):
+    # hashlib relâche le GIL pendant PBKDF2/scrypt : les calculs s'exécutent en parallèle
+    # sur le pool, et la file d'attente est bornée pour ne pas accumuler les connexions
+    pool, slots = get_pool()
+    timeout = current_app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5)
+    if not slots.acquire(timeout=timeout):
+        raise HashingPoolBusy()
+    try:
+        return pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+def hash_password_pooled(password):
+    return run_in_pool(hash_password, password, configured_method())
+
+def verify_password_pooled(password_hash, password):
+    return run_in_pool(check_password_hash, password_hash, password)
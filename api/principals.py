@@ -0,0 +1,87 @@
+# principals.py
+# Utilisateur authentifié courant sans requête SQL à chaque appel :
+# cache par requête (flask.g) + cache LRU avec TTL partagé par le processus
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, User
+
+Principal = namedtuple('Principal', ['id', 'username', 'email', 'role', 'rfid_card'])
+
+DEFAULT_TTL = 300  # secondes
+DEFAULT_SIZE = 4096
+
+class PrincipalCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        ttl = current_app.config.get('PRINCIPAL_CACHE_TTL', DEFAULT_TTL)
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            principal, stored_at = item
+            if time.monotonic() - stored_at > ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal):
+        size = current_app.config.get('PRINCIPAL_CACHE_SIZE', DEFAULT_SIZE)
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic())
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache()
+
+def load_principal(user_id):
+    row = db.session.execute(
+        db.select(User.id, User.username, User.email, User.role, User.rfid_card)
+        .where(User.id == user_id)
+    ).first()
+    return Principal(*row) if row else None
+
+def current_principal():
+    # À appeler après la vérification du JWT (jwt_required / role_required)
+    if 'principal' in g:
+        return g.principal
+    user_id = int(get_jwt_identity())
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = load_principal(user_id)
+        if principal is not None:
+            principal_cache.put(principal)
+    g.principal = principal
+    return principal
+
+# Invalidation après le commit de toute modification ou suppression d'un utilisateur
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def remember_changed_user(mapper, connection, target):
+    db.session.info.setdefault('changed_users', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        principal_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_users', None)
@@ -0,0 +1,180 @@
+# retention.py
+# Conservation des mesures de capteurs : les lignes de sensor_data plus anciennes que la durée
+# prévue pour le type de capteur sont archivées (Parquet, ou CSV gzip sans pyarrow) puis
+# supprimées par plages de clés primaires, un paquet par transaction
+import argparse
+import csv
+import gzip
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, Sensor, SensorData, SensorRollup, Alert
+from export import ExportError, load_pyarrow, arrow_schema
+
+CHUNK_SIZE = 10000   # Lignes par transaction (et par fichier d'archive)
+PAUSE = 0.05         # Secondes entre deux paquets, pour laisser passer les écritures courantes
+
+ARCHIVE_COLUMNS = [SensorData.id, SensorData.sensor_id, SensorData.value,
+                   SensorData.numeric_value, SensorData.saved_at]
+
+def policies():
+    # {type de capteur: jours} ; None pour "default" si absent (pas de suppression)
+    configured = current_app.config.get('SENSOR_RETENTION_DAYS') or {}
+    types = db.session.execute(db.select(Sensor.type).distinct()).scalars().all()
+    return {sensor_type: configured.get(sensor_type, configured.get('default')) for sensor_type in types}
+
+def archive_path(sensor_type, first_id, last_id, extension):
+    directory = os.path.join(current_app.config['SENSOR_ARCHIVE_DIR'], 'sensor_data',
+                             re.sub(r'[^A-Za-z0-9_-]+', '_', sensor_type) or '_')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{first_id:012d}-{last_id:012d}.{extension}')
+
+def write_archive(query, rows, sensor_type):
+    # Fichier écrit sous un nom temporaire, synchronisé sur disque puis renommé :
+    # les lignes ne sont supprimées qu'une fois l'archive complète
+    try:
+        pa = load_pyarrow()
+    except ExportError:
+        pa = None
+    extension = 'parquet' if pa else 'csv.gz'
+    path = archive_path(sensor_type, rows[0].id, rows[-1].id, extension)
+    partial = path + '.partial'
+    if pa:
+        schema = arrow_schema(pa, query)
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)], schema=schema)
+        with open(partial, 'wb') as f:
+            pa.parquet.write_table(table, f, compression='zstd')
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        with open(partial, 'wb') as raw:
+            with gzip.open(raw, 'wt', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([column.name for column in query.selected_columns])
+                writer.writerows(rows)
+            raw.flush()
+            os.fsync(raw.fileno())
+    os.replace(partial, path)
+    return path
+
+def expire_type(sensor_type, days, now=None, archive=True, dry_run=False, chunk_size=CHUNK_SIZE, pause=PAUSE,
+                on_chunk=None):
+    # on_chunk(stats) est appelé après chaque paquet validé (progression, annulation)
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=days)
+    sensor_ids = db.session.execute(
+        db.select(Sensor.id).where(Sensor.type == sensor_type)
+    ).scalars().all()
+    stats = {'type': sensor_type, 'days': days, 'cutoff': cutoff.isoformat(),
+             'rows': 0, 'files': [], 'chunks': 0}
+    if not sensor_ids:
+        return stats
+
+    expired = [SensorData.sensor_id.in_(sensor_ids), SensorData.saved_at < cutoff]
+    if dry_run:
+        stats['rows'] = db.session.execute(
+            db.select(db.func.count()).select_from(SensorData).where(*expired)
+        ).scalar()
+        return stats
+
+    after = 0
+    while True:
+        # Paquet suivant dans l'ordre de la clé primaire
+        query = db.select(*ARCHIVE_COLUMNS).where(*expired, SensorData.id > after) \
+            .order_by(SensorData.id).limit(chunk_size)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        if archive:
+            stats['files'].append(write_archive(query, rows, sensor_type))
+
+        # Même condition que la lecture, bornée à la plage de clés du paquet
+        db.session.execute(
+            db.delete(SensorData.__table__).where(
+                SensorData.id.between(rows[0].id, rows[-1].id), *expired)
+        )
+        db.session.commit()
+        stats['rows'] += len(rows)
+        stats['chunks'] += 1
+        after = rows[-1].id
+        if on_chunk:
+            on_chunk(stats)
+        if len(rows) < chunk_size:
+            break
+        time.sleep(pause)
+    return stats
+
+def run(now=None, archive=True, dry_run=False, chunk_size=CHUNK_SIZE):
+    results = []
+    for sensor_type, days in sorted(policies().items()):
+        if days is None:
+            continue
+        results.append(expire_type(sensor_type, days, now, archive, dry_run, chunk_size))
+    return results
+
+def count_readings(sensor_id):
+    return db.session.execute(
+        db.select(db.func.count()).select_from(SensorData).where(SensorData.sensor_id == sensor_id)
+    ).scalar()
+
+def fits_in_chunk(sensor_id, chunk_size=CHUNK_SIZE):
+    # True si l'historique tient en un paquet (suppression immédiate), sans tout compter
+    return db.session.execute(
+        db.select(SensorData.id).where(SensorData.sensor_id == sensor_id).limit(1).offset(chunk_size)
+    ).first() is None
+
+def purge_sensor(sensor_id, chunk_size=CHUNK_SIZE, pause=PAUSE, on_chunk=None):
+    # Suppression d'un capteur et de tout son historique en requêtes ensemblistes,
+    # par paquets de clés primaires plutôt qu'objet par objet via la cascade de l'ORM ;
+    # on_chunk(deleted) est appelé après chaque paquet validé (progression, annulation)
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            db.select(SensorData.id).where(SensorData.sensor_id == sensor_id)
+            .order_by(SensorData.id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(
+            db.delete(SensorData.__table__).where(
+                SensorData.sensor_id == sensor_id, SensorData.id.between(ids[0], ids[-1]))
+        )
+        db.session.commit()
+        deleted += len(ids)
+        if on_chunk:
+            on_chunk(deleted)
+        if len(ids) < chunk_size:
+            break
+        time.sleep(pause)
+
+    db.session.execute(db.delete(SensorRollup.__table__).where(SensorRollup.sensor_id == sensor_id))
+    db.session.execute(db.delete(Alert.__table__).where(Alert.sensor_id == sensor_id))
+    db.session.execute(db.delete(Sensor.__table__).where(Sensor.id == sensor_id))
+    db.session.commit()
+
+    from anomalies import detector
+    detector.forget(sensor_id)
+    return deleted
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archivage et suppression des mesures expirées')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='Applique les durées de conservation')
+    run_parser.add_argument('--dry-run', action='store_true', help='Compte les lignes sans rien supprimer')
+    run_parser.add_argument('--no-archive', action='store_true', help='Supprime sans archiver')
+    run_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    purge_parser = sub.add_parser('purge', help="Supprime un capteur et son historique")
+    purge_parser.add_argument('sensor_id', type=int)
+    args = parser.parse_args()
+
+    from factory import create_base_app
+    with create_base_app().app_context():
+        if args.command == 'run':
+            for result in run(archive=not args.no_archive, dry_run=args.dry_run, chunk_size=args.chunk_size):
+                print(f"{result['type']}: {result['rows']} lignes avant {result['cutoff']}, "
+                      f"{len(result['files'])} fichiers")
+        else:
+            print(f'{purge_sensor(args.sensor_id)} mesures supprimées')
@@ -0,0 +1,190 @@
+# rfid.py
+# Lectures RFID des portiques : index tag -> produit en mémoire, dédoublonnage des lectures
+# dans une fenêtre de temps et application des variations d'inventaire en un seul lot
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Product, Zone
+from inventory import after_inventory_write, add_quantities, queue_inventory_lines
+from cache import VersionedIndex
+from writebehind import buffer
+from ledger import movement, record
+from orders import with_retry
+from sensors import parse_timestamp
+
+DEFAULT_DEDUP_WINDOW = 5.0      # secondes
+DIRECTIONS = {'in': 1, 'out': -1}
+MAX_UNKNOWN_REPORTED = 100
+
+class TagIndex(VersionedIndex):
+    def __init__(self):
+        super().__init__('products', 'RFID_INDEX_CHECK_INTERVAL')
+        self._tags = {}          # tag -> product_id
+        self._product_tags = {}  # product_id -> tag
+
+    def build(self):
+        rows = db.session.execute(
+            db.select(Product.id, Product.rfid_tag).where(Product.rfid_tag.isnot(None))
+        ).all()
+        with self._lock:
+            self._tags = {tag: product_id for product_id, tag in rows}
+            self._product_tags = {product_id: tag for product_id, tag in rows}
+
+    def resolve(self, tag):
+        return self._tags.get(tag)
+
+    def update(self, product_id, tag):
+        # Après le commit d'une création/modification de produit dans ce worker
+        with self._lock:
+            old = self._product_tags.pop(product_id, None)
+            if old is not None and self._tags.get(old) == product_id:
+                del self._tags[old]
+            if tag:
+                self._tags[tag] = product_id
+                self._product_tags[product_id] = tag
+        self.adopt_version()
+
+    def remove(self, product_id):
+        self.update(product_id, None)
+
+tag_index = TagIndex()
+
+class ScanDeduplicator:
+    # Dernière lecture comptée par (tag, zone, sens) ; une lecture plus proche que la fenêtre est ignorée.
+    # Seules les lectures qui ont produit un mouvement sont retenues (stage), dans la session, et ne
+    # deviennent « vues » qu'après le commit : un lot annulé (erreur, interblocage) ou une lecture
+    # écartée (zone inconnue) sera comptée quand le lecteur la renverra
+    def __init__(self):
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.time()
+
+    def accept(self, key, timestamp, window, batch):
+        # batch : lectures acceptées du lot en cours {clé: horodatage}, complété ici
+        pending = db.session.info.get('rfid_scans', {})
+        with self._lock:
+            for last in (batch.get(key), pending.get(key), self._seen.get(key)):
+                if last is not None and abs(timestamp - last) < window:
+                    return False
+        batch[key] = timestamp
+        return True
+
+    def stage(self, scans):
+        pending = db.session.info.setdefault('rfid_scans', {})
+        for key, timestamp in scans:
+            if key not in pending or timestamp > pending[key]:
+                pending[key] = timestamp
+
+    def commit(self, pending, window):
+        with self._lock:
+            self._seen.update(pending)
+            latest = max(pending.values())
+            if latest - self._pruned_at > window * 10:
+                self._prune(latest - window)
+
+    def _prune(self, threshold):
+        self._seen = {key: ts for key, ts in self._seen.items() if ts >= threshold}
+        self._pruned_at = time.time()
+
+deduplicator = ScanDeduplicator()
+
+@event.listens_for(Session, 'after_commit')
+def remember_scans(session):
+    pending = session.info.pop('rfid_scans', None)
+    if pending:
+        deduplicator.commit(pending, current_app.config.get('RFID_DEDUP_WINDOW', DEFAULT_DEDUP_WINDOW))
+
+@event.listens_for(Session, 'after_rollback')
+def forget_scans(session):
+    session.info.pop('rfid_scans', None)
+
+def parse_scans(data):
+    # {"zone_id": 1, "direction": "in", "scans": [{"tag": ..., "read_at": ...}]} ou tableau de lectures
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = {key: data[key] for key in ('zone_id', 'direction', 'reader') if key in data}
+        data = data.get('scans')
+    if not isinstance(data, list):
+        raise ValueError('Un tableau de lectures est attendu')
+    return defaults, data
+
+def process_scans(defaults, scans, user_id=None):
+    # Transaction rejouée en cas d'interblocage ou d'attente de verrou dépassée (comme les commandes)
+    return with_retry(_process_scans, defaults, scans, user_id)
+
+def _process_scans(defaults, scans, user_id):
+    window = current_app.config.get('RFID_DEDUP_WINDOW', DEFAULT_DEDUP_WINDOW)
+    tag_index.ensure_current()
+
+    deltas = {}
+    accepted = {}  # (product_id, zone_id) -> lectures comptées [(clé de dédoublonnage, horodatage)]
+    batch = {}
+    duplicates = invalid = 0
+    unknown = set()
+    for scan in scans:
+        if not isinstance(scan, dict) or not scan.get('tag'):
+            invalid += 1
+            continue
+        direction = scan.get('direction', defaults.get('direction', 'in'))
+        try:
+            zone_id = int(scan.get('zone_id', defaults.get('zone_id')))
+            timestamp = parse_timestamp(scan['read_at']).replace(tzinfo=timezone.utc).timestamp() \
+                if scan.get('read_at') is not None else time.time()
+        except (TypeError, ValueError, OverflowError):
+            invalid += 1
+            continue
+        if direction not in DIRECTIONS:
+            invalid += 1
+            continue
+
+        product_id = tag_index.resolve(scan['tag'])
+        if product_id is None:
+            unknown.add(scan['tag'])
+            continue
+        dedup_key = (scan['tag'], zone_id, direction)
+        if not deduplicator.accept(dedup_key, timestamp, window, batch):
+            duplicates += 1
+            continue
+        key = (product_id, zone_id)
+        deltas[key] = deltas.get(key, 0) + DIRECTIONS[direction]
+        accepted.setdefault(key, []).append((dedup_key, timestamp))
+
+    # Zones inconnues écartées en une seule requête
+    zone_ids = {zone_id for _, zone_id in deltas}
+    known_zones = set(db.session.execute(
+        db.select(Zone.id).where(Zone.id.in_(zone_ids))
+    ).scalars()) if zone_ids else set()
+    rejected_zones = sorted(zone_ids - known_zones)
+    # Entrées et sorties qui s'annulent : l'article a été vu, seule la date de la ligne change
+    seen = [key for key, delta in deltas.items() if key[1] in known_zones and not delta]
+    deltas = {key: delta for key, delta in deltas.items() if key[1] in known_zones and delta}
+
+    applied = {}
+    if deltas:
+        applied = {key: delta for key, delta in add_quantities(deltas).items() if delta}
+        reader = defaults.get('reader')
+        record([movement(product_id, zone_id, delta, 'rfid', user_id,
+                         source=f'rfid:{reader}'[:100] if reader else 'rfid')
+                for (product_id, zone_id), delta in sorted(applied.items())])
+        after_inventory_write(applied)
+        queue_inventory_lines(sorted(deltas))
+    if seen:
+        now = datetime.utcnow()
+        for product_id, zone_id in seen:
+            buffer.touch_inventory(product_id, zone_id, now)
+    # Lectures retenues par le dédoublonnage : celles des lignes réellement modifiées
+    for key in applied:
+        deduplicator.stage(accepted[key])
+    db.session.commit()
+
+    return {
+        'received': len(scans),
+        'duplicates': duplicates,
+        'invalid': invalid,
+        'unknown_tags': sorted(unknown)[:MAX_UNKNOWN_REPORTED],
+        'unknown_zones': rejected_zones,
+        'deltas': [{'product_id': p, 'zone_id': z, 'delta': d} for (p, z), d in sorted(applied.items())]
+    }
@@ -0,0 +1,215 @@
+# search.py
+# Recherche de produits en mémoire : vocabulaire des mots (désignation, catégorie, description)
+# avec listes de produits par mot, trigrammes sur le vocabulaire pour les sous-chaînes et
+# vocabulaire trié pour les préfixes courts (saisie semi-automatique)
+import bisect
+import heapq
+import itertools
+import re
+import unicodedata
+from models import db, Product, Category
+from cache import VersionedIndex
+
+# Poids des champs dans le score
+FIELDS = (('designation', 3.0), ('category', 1.5), ('description', 1.0))
+EXACT_BONUS = 2.0
+PREFIX_BONUS = 1.5
+MAX_TERMS = 8
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_COMBINATIONS = 64   # Au-delà, score calculé produit par produit
+RANKED_SCAN_RATIO = 50  # Parcours de la liste triée si l'ensemble dépasse 1/50 du catalogue
+TERM_CACHE_SIZE = 512   # Paliers des termes récents (les préfixes de saisie se répètent)
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+def normalize(text):
+    # Minuscules sans accents : "Écrou" et "ecrou" se retrouvent
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text):
+    return WORD_RE.findall(normalize(text))
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+class SearchIndex(VersionedIndex):
+    # Plusieurs secondes de construction pour 100 000 produits : reconstruit en arrière-plan
+    background_refresh = True
+
+    def __init__(self):
+        super().__init__('products', 'SEARCH_INDEX_CHECK_INTERVAL')
+        self._reset()
+
+    def _reset(self):
+        self._docs = {}                          # product_id -> (designation, catégorie, mots par champ)
+        self._postings = [{} for _ in FIELDS]    # mot -> ensemble de product_id, par champ
+        self._refs = {}                          # mot -> nombre de références (tous champs)
+        self._grams = {}                         # trigramme -> ensemble de mots
+        self._vocabulary = []                    # mots triés, pour les préfixes
+        self._ranked = []                        # product_id par désignation la plus courte (départage)
+        self._term_cache = {}                    # terme -> paliers, vidé à chaque modification
+
+    def rank_key(self, product_id):
+        return (len(self._docs[product_id][0]), product_id)
+
+    def build(self):
+        rows = db.session.execute(
+            db.select(Product.id, Product.designation, Product.description, Category.name)
+            .join(Category, Product.category_id == Category.id)
+        ).all()
+        fresh = SearchIndex.__new__(SearchIndex)
+        fresh._reset()
+        for row in rows:
+            fresh._add(row.id, row.designation, row.name, row.description, sort=False)
+        fresh._vocabulary = sorted(fresh._refs)
+        fresh._ranked = sorted(fresh._docs, key=fresh.rank_key)
+        with self._lock:
+            self._docs, self._postings, self._refs = fresh._docs, fresh._postings, fresh._refs
+            self._grams, self._vocabulary, self._ranked = fresh._grams, fresh._vocabulary, fresh._ranked
+            self._term_cache = {}
+
+    def _add(self, product_id, designation, category, description, sort=True):
+        words = tuple(frozenset(tokenize(text)) for text in (designation, category, description))
+        self._term_cache = {}
+        self._docs[product_id] = (designation or '', category, words)
+        if sort:
+            bisect.insort(self._ranked, product_id, key=self.rank_key)
+        for postings, field_words in zip(self._postings, words):
+            for word in field_words:
+                postings.setdefault(word, set()).add(product_id)
+                count = self._refs.get(word, 0)
+                self._refs[word] = count + 1
+                if count:
+                    continue
+                for gram in trigrams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+                if sort:
+                    bisect.insort(self._vocabulary, word)
+
+    def _remove(self, product_id):
+        if product_id not in self._docs:
+            return
+        del self._ranked[bisect.bisect_left(self._ranked, self.rank_key(product_id), key=self.rank_key)]
+        doc = self._docs.pop(product_id)
+        self._term_cache = {}
+        for postings, field_words in zip(self._postings, doc[2]):
+            for word in field_words:
+                ids = postings[word]
+                ids.discard(product_id)
+                if not ids:
+                    del postings[word]
+                self._refs[word] -= 1
+                if self._refs[word]:
+                    continue
+                del self._refs[word]
+                for gram in trigrams(word):
+                    self._grams[gram].discard(word)
+                    if not self._grams[gram]:
+                        del self._grams[gram]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+
+    def update(self, product_id, designation, category, description):
+        # Après le commit d'une création/modification de produit dans ce worker
+        with self._lock:
+            self._remove(product_id)
+            self._add(product_id, designation, category, description)
+        self.adopt_version()
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+        self.adopt_version()
+
+    def matching_words(self, term):
+        # Préfixe via le vocabulaire trié pour 1-2 caractères, sinon sous-chaîne via les trigrammes
+        if len(term) < 3:
+            start = bisect.bisect_left(self._vocabulary, term)
+            end = bisect.bisect_left(self._vocabulary, term + '\uffff', start)
+            return self._vocabulary[start:end]
+        sets = sorted((self._grams.get(gram, ()) for gram in trigrams(term)), key=len)
+        if not sets[0]:
+            return []
+        candidates = set(sets[0]).intersection(*sets[1:])
+        return [word for word in candidates if term in word]
+
+    def term_tiers(self, term):
+        # Produits correspondant au terme, regroupés par score (champ x exact/préfixe/sous-chaîne),
+        # du meilleur au moins bon ; un produit peut figurer dans plusieurs paliers
+        cached = self._term_cache.get(term)
+        if cached is not None:
+            return cached
+        tiers = {}
+        for word in self.matching_words(term):
+            bonus = EXACT_BONUS if word == term else PREFIX_BONUS if word.startswith(term) else 1.0
+            for (_, weight), postings in zip(FIELDS, self._postings):
+                ids = postings.get(word)
+                if ids:
+                    tiers.setdefault(weight * bonus, []).append(ids)
+        tiers = [(value, set().union(*sets)) for value, sets in sorted(tiers.items(), reverse=True)]
+        if len(self._term_cache) >= TERM_CACHE_SIZE:
+            self._term_cache.clear()
+        self._term_cache[term] = tiers
+        return tiers
+
+    def score_groups(self, per_term):
+        # Ensembles de produits par score total décroissant ; un produit est compté à son meilleur
+        # score car il est retiré des groupes suivants une fois retenu
+        if len(per_term) == 1:
+            return per_term[0]
+        combinations = 1
+        for tiers in per_term:
+            combinations *= len(tiers)
+        if combinations <= MAX_COMBINATIONS:
+            groups = {}
+            for combination in itertools.product(*per_term):
+                sets = sorted((ids for _, ids in combination), key=len)
+                ids = sets[0].intersection(*sets[1:])
+                if ids:
+                    groups.setdefault(sum(value for value, _ in combination), []).append(ids)
+            return [(value, set().union(*sets)) for value, sets in sorted(groups.items(), reverse=True)]
+        # Trop de combinaisons : score calculé produit par produit sur l'intersection
+        candidates = set.intersection(*(set().union(*(ids for _, ids in tiers)) for tiers in per_term))
+        groups = {}
+        for product_id in candidates:
+            total = sum(next(value for value, ids in tiers if product_id in ids) for tiers in per_term)
+            groups.setdefault(total, set()).add(product_id)
+        return sorted(groups.items(), key=lambda group: group[0], reverse=True)
+
+    def take_ranked(self, ids, count, exclude):
+        # Les `count` premiers produits de l'ensemble dans l'ordre de départage : parcours de la
+        # liste triée si l'ensemble est grand (arrêt rapide), tri partiel sinon
+        if len(ids) * RANKED_SCAN_RATIO >= len(self._ranked):
+            taken = []
+            for product_id in self._ranked:
+                if product_id in ids and product_id not in exclude:
+                    taken.append(product_id)
+                    if len(taken) == count:
+                        break
+            return taken
+        return heapq.nsmallest(count, ids - exclude if exclude else ids, key=self.rank_key)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+        if not terms:
+            return []
+        results, taken = [], set()
+        with self._lock:
+            per_term = []
+            for term in terms:
+                tiers = self.term_tiers(term)
+                if not tiers:
+                    return []
+                per_term.append(tiers)
+            for score, ids in self.score_groups(per_term):
+                for product_id in self.take_ranked(ids, limit - len(results), taken):
+                    taken.add(product_id)
+                    designation, category, _ = self._docs[product_id]
+                    results.append({'id': product_id, 'designation': designation,
+                                    'category': category, 'score': round(score, 2)})
+                if len(results) >= limit:
+                    break
+        return results
+
+search_index = SearchIndex()
@@ -0,0 +1,211 @@
+# sensors.py
+# Ingestion en masse des lectures de capteurs
+import json
+import math
+from datetime import datetime, timezone
+from models import db, Sensor, SensorData, SensorRollup
+from upsert import upsert, least, greatest
+from events import queue_event
+from writebehind import buffer
+
+# Nombre de lectures par INSERT multi-lignes
+BATCH_SIZE = 1000
+STATUS_LENGTH = 50
+
+# Résolutions des agrégats, de la plus fine à la plus grossière
+RESOLUTIONS = [
+    ('minute', 60),
+    ('hour', 3600),
+    ('day', 86400)
+]
+
+def parse_readings(body, mimetype):
+    # Accepte un tableau JSON, un objet {"readings": [...]} ou du NDJSON
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if mimetype in ('application/x-ndjson', 'application/ndjson'):
+        try:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        except json.JSONDecodeError:
+            raise ValueError('NDJSON invalide')
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        raise ValueError('JSON invalide')
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if not isinstance(data, list):
+        raise ValueError('Un tableau de lectures est attendu')
+    return data
+
+def to_number(value):
+    # Valeur numérique de la mesure, None si elle n'en a pas : texte, mais aussi "nan" et "inf",
+    # que float() accepte et que ni les agrégats ni MySQL (DOUBLE) ne supportent
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if math.isfinite(number) else None
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def ingest_readings(readings, batch_size=BATCH_SIZE):
+    now = datetime.utcnow()
+    errors = []
+    rows = []
+    statuses = {}  # Statut le plus récent signalé par chaque capteur
+    for index, reading in enumerate(readings):
+        if not isinstance(reading, dict) or 'sensor_id' not in reading or reading.get('value') is None:
+            errors.append({'index': index, 'error': 'sensor_id et value sont requis'})
+            continue
+        try:
+            sensor_id = int(reading['sensor_id'])
+            saved_at = parse_timestamp(reading['saved_at']) if reading.get('saved_at') is not None else now
+        except (TypeError, ValueError, OverflowError):
+            errors.append({'index': index, 'error': 'sensor_id ou saved_at invalide'})
+            continue
+        status = reading.get('status')
+        if status is not None and (not isinstance(status, str) or len(status) > STATUS_LENGTH):
+            errors.append({'index': index, 'error': f'status doit être un texte de {STATUS_LENGTH} caractères au plus'})
+            continue
+        value = reading['value']
+        rows.append((index, {
+            'sensor_id': sensor_id,
+            'value': str(value),
+            'numeric_value': to_number(value),
+            'saved_at': saved_at
+        }))
+
+    # Vérifier tous les capteurs référencés en une seule requête
+    sensor_ids = {row['sensor_id'] for _, row in rows}
+    known = set()
+    if sensor_ids:
+        known = set(db.session.execute(
+            db.select(Sensor.id).where(Sensor.id.in_(sensor_ids))
+        ).scalars())
+    valid = []
+    for index, row in rows:
+        if row['sensor_id'] in known:
+            valid.append(row)
+            status = readings[index].get('status')
+            if status is not None and (row['sensor_id'] not in statuses
+                                       or row['saved_at'] >= statuses[row['sensor_id']][0]):
+                statuses[row['sensor_id']] = (row['saved_at'], status)
+        else:
+            errors.append({'index': index, 'error': 'Capteur non trouvé'})
+
+    for start in range(0, len(valid), batch_size):
+        write_batch(valid[start:start + batch_size])
+    for sensor_id, (saved_at, status) in statuses.items():
+        buffer.touch_sensor(sensor_id, saved_at, status)
+    db.session.commit()
+
+    return {'inserted': len(valid), 'rejected': len(errors), 'errors': errors}
+
+def write_batch(batch):
+    # INSERT exécuté en executemany : l'instruction compilée reste en cache et
+    # le pilote MySQL le réécrit en un seul INSERT multi-lignes par lot
+    db.session.execute(db.insert(SensorData.__table__), batch)
+
+    # last_reading : dernière mesure de chaque capteur du lot, écrite en différé
+    latest = {}
+    for row in batch:
+        current = latest.get(row['sensor_id'])
+        if current is None or row['saved_at'] > current['saved_at']:
+            latest[row['sensor_id']] = row
+    for sensor_id, row in latest.items():
+        buffer.touch_sensor(sensor_id, row['saved_at'])
+    # Flux SSE : dernière lecture de chaque capteur du lot
+    queue_event('sensor_readings', {'readings': list(latest.values())})
+
+    update_rollups(batch)
+
+    # Import local : NumPy n'est chargé qu'à la première réception de mesures
+    from anomalies import detector
+    detector.observe(batch)
+
+def truncate(ts, resolution):
+    if resolution == 'minute':
+        return ts.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def update_rollups(batch):
+    # Agrège le lot en mémoire puis fusionne avec les agrégats existants
+    buckets = {}
+    for row in batch:
+        value = row['numeric_value']
+        if value is None:
+            continue
+        for resolution, _ in RESOLUTIONS:
+            key = (row['sensor_id'], resolution, truncate(row['saved_at'], resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                if value < agg[0]:
+                    agg[0] = value
+                if value > agg[1]:
+                    agg[1] = value
+                agg[2] += value
+                agg[3] += 1
+
+    rows = [{
+        'sensor_id': sensor_id,
+        'resolution': resolution,
+        'bucket': bucket,
+        'min_value': agg[0],
+        'max_value': agg[1],
+        'sum_value': agg[2],
+        'count': agg[3]
+    } for (sensor_id, resolution, bucket), agg in buckets.items()]
+
+    upsert(SensorRollup.__table__, rows, ['sensor_id', 'resolution', 'bucket'],
+           lambda table, new: {
+               'min_value': least(table.c.min_value, new.min_value),
+               'max_value': greatest(table.c.max_value, new.max_value),
+               'sum_value': table.c.sum_value + new.sum_value,
+               'count': table.c.count + new.count
+           })
+
+def choose_resolution(start, end, points):
+    # Résolution la plus fine dont le nombre d'intervalles tient dans le budget de points
+    window = (end - start).total_seconds()
+    for resolution, seconds in RESOLUTIONS:
+        if window / seconds <= points:
+            return resolution
+    return RESOLUTIONS[-1][0]
+
+def get_series(sensor_id, start, end, points):
+    resolution = choose_resolution(start, end, points)
+    rows = db.session.execute(
+        db.select(SensorRollup.bucket, SensorRollup.min_value, SensorRollup.max_value,
+                  SensorRollup.sum_value, SensorRollup.count)
+        .where(SensorRollup.sensor_id == sensor_id,
+               SensorRollup.resolution == resolution,
+               SensorRollup.bucket >= truncate(start, resolution),
+               SensorRollup.bucket < end)
+        .order_by(SensorRollup.bucket)
+    ).all()
+
+    # Fenêtre trop longue même en journalier : regroupement des intervalles consécutifs
+    step = max(1, math.ceil(len(rows) / points))
+    series = []
+    for i in range(0, len(rows), step):
+        group = rows[i:i + step]
+        total = sum(r.sum_value for r in group)
+        count = sum(r.count for r in group)
+        series.append({
+            'bucket': group[0].bucket.isoformat(),
+            'min': min(r.min_value for r in group),
+            'max': max(r.max_value for r in group),
+            'avg': total / count,
+            'count': count
+        })
+    return resolution, series
@@ -0,0 +1,72 @@
+# stock.py
+# Totaux de stock par produit (table product_stock) : mise à jour incrémentale et vérification
+from datetime import datetime
+from models import db, Inventory, ProductStock
+from upsert import upsert, greatest
+
+def aggregate(product_ids=None):
+    query = db.select(
+        Inventory.product_id,
+        db.func.coalesce(db.func.sum(Inventory.quantity), 0).label('total_quantity'),
+        db.func.count(db.case((Inventory.quantity > 0, 1))).label('zone_count'),
+        db.func.max(Inventory.last_update_at).label('last_update_at')
+    ).group_by(Inventory.product_id)
+    if product_ids is not None:
+        query = query.where(Inventory.product_id.in_(product_ids))
+    return query
+
+def refresh_products(lines):
+    # lines : {(product_id, zone_id): (ancienne quantité, nouvelle quantité)} des lignes écrites par la
+    # transaction en cours. Totaux incrémentés (total_quantity = total_quantity + variation) sous le
+    # verrou de la ligne product_stock, pris dans l'ordre de product_id : deux écritures concurrentes
+    # sur des zones différentes d'un même produit s'additionnent, sans relire un agrégat que
+    # l'instantané REPEATABLE READ de MySQL peut rendre périmé. Ne fait pas de commit
+    now = datetime.utcnow()
+    totals = {}
+    for (product_id, zone_id), (old, new) in lines.items():
+        total = totals.setdefault(product_id, {'product_id': product_id, 'total_quantity': 0,
+                                               'zone_count': 0, 'last_update_at': now})
+        total['total_quantity'] += new - old
+        total['zone_count'] += (new > 0) - (old > 0)
+    upsert(ProductStock.__table__, [totals[product_id] for product_id in sorted(totals)], ['product_id'],
+           lambda table, new: {
+               'total_quantity': table.c.total_quantity + new.total_quantity,
+               'zone_count': table.c.zone_count + new.zone_count,
+               'last_update_at': greatest(table.c.last_update_at, new.last_update_at)
+           })
+
+def check(repair=False):
+    # Compare la table de synthèse avec un agrégat complet de l'inventaire
+    expected = {row.product_id: (row.total_quantity, row.zone_count)
+                for row in db.session.execute(aggregate())}
+    stored = {row.product_id: (row.total_quantity, row.zone_count)
+              for row in db.session.execute(
+                  db.select(ProductStock.product_id, ProductStock.total_quantity, ProductStock.zone_count))}
+
+    mismatches = []
+    for product_id in sorted(set(expected) | set(stored)):
+        want = expected.get(product_id, (0, 0))
+        have = stored.get(product_id)
+        if have != want and not (have is None and want == (0, 0)):
+            mismatches.append({
+                'product_id': product_id,
+                'expected': {'total_quantity': want[0], 'zone_count': want[1]},
+                'stored': {'total_quantity': have[0], 'zone_count': have[1]} if have else None
+            })
+
+    if repair and mismatches:
+        rebuild()
+    return mismatches
+
+def rebuild():
+    # Reconstruction complète en une passe ensembliste
+    db.session.execute(db.delete(ProductStock.__table__))
+    summary = aggregate().subquery()
+    db.session.execute(
+        db.insert(ProductStock.__table__).from_select(
+            ['product_id', 'total_quantity', 'zone_count', 'last_update_at'],
+            db.select(summary.c.product_id, summary.c.total_quantity,
+                      summary.c.zone_count, summary.c.last_update_at)
+        )
+    )
+    db.session.commit()
@@ -0,0 +1,30 @@
+# upsert.py
+# INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE selon le moteur utilisé
+from models import db
+
+def upsert(table, rows, keys, update):
+    # update(table, nouvelles_valeurs) -> {colonne: expression} appliqué en cas de conflit
+    # sur les colonnes de keys ; rows est exécuté en un seul executemany
+    if not rows:
+        return
+    # Seul le dialecte utilisé est importé (démarrage plus rapide)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(update(table, stmt.inserted))
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_=update(table, stmt.excluded))
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_=update(table, stmt.excluded))
+    db.session.execute(stmt, rows)
+
+def least(a, b):
+    return db.case((a <= b, a), else_=b)
+
+def greatest(a, b):
+    return db.case((a >= b, a), else_=b)
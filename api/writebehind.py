@@ -0,0 +1,168 @@
+# writebehind.py
+# Écriture différée des colonnes mises à jour à chaque mesure ou lecture RFID
+# (sensors.last_reading / status, inventory.last_update_at) : les valeurs sont fusionnées en
+# mémoire, une entrée par ligne, puis écrites par UPDATE groupés au plus WRITE_BEHIND_INTERVAL
+# secondes plus tard. Les transactions d'ingestion ne verrouillent plus ces lignes très disputées.
+import atexit
+import os
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Sensor, Inventory
+
+DEFAULT_INTERVAL = 1.0    # Retard maximal des colonnes différées (secondes) ; 0 : écriture immédiate
+MAX_PENDING = 10000       # Au-delà, écriture anticipée sans attendre l'intervalle
+
+def sensor_update():
+    # Horodatage jamais reculé (lots arrivant dans le désordre, plusieurs workers) ;
+    # statut inchangé si aucun n'est fourni
+    sensors = Sensor.__table__
+    return db.update(sensors).where(sensors.c.id == db.bindparam('sid')).values(
+        last_reading=db.case(
+            (db.or_(sensors.c.last_reading.is_(None),
+                    sensors.c.last_reading < db.bindparam('ts')), db.bindparam('ts')),
+            else_=sensors.c.last_reading
+        ),
+        status=db.func.coalesce(db.bindparam('st'), sensors.c.status)
+    )
+
+def inventory_update():
+    inventory = Inventory.__table__
+    return db.update(inventory).where(
+        inventory.c.product_id == db.bindparam('pid'), inventory.c.zone_id == db.bindparam('zid')
+    ).values(last_update_at=db.case(
+        (db.or_(inventory.c.last_update_at.is_(None),
+                inventory.c.last_update_at < db.bindparam('ts')), db.bindparam('ts')),
+        else_=inventory.c.last_update_at
+    ))
+
+def merge_sensor(entries, sensor_id, ts, status):
+    current = entries.get(sensor_id)
+    if current is None:
+        entries[sensor_id] = [ts, status]
+        return
+    if ts is not None and (current[0] is None or ts > current[0]):
+        current[0] = ts
+    if status is not None:
+        current[1] = status
+
+def merge_inventory(entries, key, ts):
+    current = entries.get(key)
+    if current is None or ts > current:
+        entries[key] = ts
+
+def write(connection, sensors, inventory):
+    # Lignes écrites dans l'ordre de la clé : deux écritures concurrentes ne s'interbloquent pas
+    if sensors:
+        connection.execute(sensor_update(), [
+            {'sid': sensor_id, 'ts': ts, 'st': status}
+            for sensor_id, (ts, status) in sorted(sensors.items())
+        ])
+    if inventory:
+        connection.execute(inventory_update(), [
+            {'pid': product_id, 'zid': zone_id, 'ts': ts}
+            for (product_id, zone_id), ts in sorted(inventory.items())
+        ])
+
+class WriteBehind:
+    def __init__(self):
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sensors = {}     # sensor_id -> [last_reading, status]
+        self._inventory = {}   # (product_id, zone_id) -> last_update_at
+        self.flushes = 0
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    @property
+    def interval(self):
+        if self.app is None:
+            return 0
+        return self.app.config.get('WRITE_BEHIND_INTERVAL', DEFAULT_INTERVAL)
+
+    def touch_sensor(self, sensor_id, ts, status=None):
+        if self.interval <= 0:
+            db.session.execute(sensor_update(), [{'sid': sensor_id, 'ts': ts, 'st': status}])
+            return
+        # Retenu jusqu'au commit de la transaction en cours, abandonné en cas d'annulation
+        merge_sensor(db.session.info.setdefault('write_behind_sensors', {}), sensor_id, ts, status)
+
+    def touch_inventory(self, product_id, zone_id, ts):
+        if self.interval <= 0:
+            db.session.execute(inventory_update(), [{'pid': product_id, 'zid': zone_id, 'ts': ts}])
+            return
+        merge_inventory(db.session.info.setdefault('write_behind_inventory', {}), (product_id, zone_id), ts)
+
+    def add(self, sensors, inventory):
+        self._ensure_started()
+        with self._lock:
+            for sensor_id, (ts, status) in sensors.items():
+                merge_sensor(self._sensors, sensor_id, ts, status)
+            for key, ts in inventory.items():
+                merge_inventory(self._inventory, key, ts)
+            pending = len(self._sensors) + len(self._inventory)
+        if pending >= self.app.config.get('WRITE_BEHIND_MAX_PENDING', MAX_PENDING):
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._sensors) + len(self._inventory)
+
+    def flush(self):
+        # Une transaction courte, hors de la session de la requête ; en cas d'échec les
+        # valeurs sont remises dans le tampon pour l'écriture suivante
+        with self._lock:
+            sensors, self._sensors = self._sensors, {}
+            inventory, self._inventory = self._inventory, {}
+        if not sensors and not inventory:
+            return 0
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    write(connection, sensors, inventory)
+        except Exception:
+            self.add(sensors, inventory)
+            raise
+        self.flushes += 1
+        return len(sensors) + len(inventory)
+
+    def _ensure_started(self):
+        # Un thread d'écriture par processus, démarré après le fork des workers
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._sensors, self._inventory = {}, {}
+            threading.Thread(target=self._flush_loop, name='write-behind', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Écriture différée en échec')
+
+buffer = WriteBehind()
+
+def init_write_behind(app):
+    buffer.init_app(app)
+
+@event.listens_for(Session, 'after_commit')
+def buffer_committed(session):
+    sensors = session.info.pop('write_behind_sensors', None)
+    inventory = session.info.pop('write_behind_inventory', None)
+    if sensors or inventory:
+        buffer.add(sensors or {}, inventory or {})
+
+@event.listens_for(Session, 'after_rollback')
+def discard_uncommitted(session):
+    session.info.pop('write_behind_sensors', None)
+    session.info.pop('write_behind_inventory', None)
@@ -0,0 +1,48 @@
+# bench_auth.py
+# Surcoût par requête du chemin d'authentification : lecture de l'utilisateur en base
+# à chaque appel (ancien comportement) contre cache des principaux
+import argparse
+from common import load_app, QueryCounter, summarize, timed, report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du chemin d'authentification")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    app = load_app()
+    from flask import jsonify
+    from flask_jwt_extended import jwt_required, get_jwt_identity
+    from models import db, User
+
+    # Reproduction de l'ancienne route /api/protected pour comparaison
+    @app.route('/bench/protected-uncached')
+    @jwt_required()
+    def protected_uncached():
+        user = User.query.get(get_jwt_identity())
+        return jsonify({'user_id': user.id, 'role': user.role})
+
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', role='admin')
+        user.password = 'bench'
+        db.session.add(user)
+        db.session.commit()
+        counter = QueryCounter(db.engine)
+
+    client = app.test_client()
+    token = client.post('/api/auth/login', json={'username': 'bench', 'password': 'bench'}).json['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    results = {}
+    for name, url in (('before', '/bench/protected-uncached'), ('after', '/api/protected')):
+        client.get(url, headers=headers)  # Préchauffage
+        counter.count = 0
+        samples = timed(lambda: client.get(url, headers=headers), args.iterations)
+        stats = summarize(samples)
+        stats['queries_per_request'] = counter.count / args.iterations
+        results[name] = stats
+
+    report({'benchmark': 'auth', 'iterations': args.iterations, 'results': results}, args.output)
+
+if __name__ == '__main__':
+    main()
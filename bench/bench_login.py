@@ -0,0 +1,76 @@
+# bench_login.py
+# Débit de connexion (/api/auth/login) par méthode de hachage, en logins/s et logins/s par cœur
+import argparse
+import os
+import threading
+import time
+from common import load_app, summarize, report
+
+def run(app, users, concurrency, duration):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        client = app.test_client()
+        i = offset
+        local = []
+        while time.perf_counter() < deadline:
+            name = f'operator{i % users}'
+            start = time.perf_counter()
+            response = client.post('/api/auth/login', json={'username': name, 'password': 'secret'})
+            local.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.json
+            i += concurrency
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des connexions')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count() * 2)
+    parser.add_argument('--duration', type=float, default=5.0, help='Durée par méthode (s)')
+    parser.add_argument('--methods', default='pbkdf2:sha256:600000,pbkdf2:sha256:100000,scrypt:16384:8:1',
+                        help='Méthodes de hachage à comparer, séparées par des virgules')
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    app = load_app()
+    from models import db, User
+    from passwords import hash_password
+
+    cores = os.cpu_count()
+    results = {}
+    for method in args.methods.split(','):
+        app.config['PASSWORD_HASH_METHOD'] = method
+        with app.app_context():
+            User.query.delete()
+            password_hash = hash_password('secret', method)
+            db.session.execute(db.insert(User.__table__), [{
+                'username': f'operator{i}',
+                'email': f'operator{i}@example.com',
+                'role': 'user',
+                'password_hash': password_hash
+            } for i in range(args.users)])
+            db.session.commit()
+        stats = run(app, args.users, args.concurrency, args.duration)
+        stats['logins_per_core'] = stats['throughput'] / cores
+        results[method] = stats
+
+    report({
+        'benchmark': 'login',
+        'cores': cores,
+        'concurrency': args.concurrency,
+        'results': results
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# bench_orders.py
+# Commandes concurrentes sur un même produit : débit, nouvelles tentatives et contrôle
+# qu'aucune mise à jour n'est perdue (stock final = stock initial - quantités réservées)
+import argparse
+import threading
+import time
+from common import load_app, summarize, report
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des commandes concurrentes')
+    parser.add_argument('--database-url', help='Base cible (SQLite temporaire par défaut)')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--orders', type=int, default=100, help='Commandes par thread')
+    parser.add_argument('--stock', type=int, default=1000, help='Stock initial (volontairement insuffisant)')
+    parser.add_argument('--zones', type=int, default=2)
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    from flask_jwt_extended import create_access_token
+    from models import db, User, Category, Product, Zone, Inventory, Order
+    import orders
+
+    with app.app_context():
+        user = User(username='picker', email='picker@example.com', role='user', password_hash='-')
+        db.session.add(user)
+        db.session.add(Category(name='Bench'))
+        db.session.flush()
+        db.session.add(Product(designation='Produit disputé', category_id=1, min_threshold=0, max_threshold=10 ** 9))
+        for z in range(args.zones):
+            db.session.add(Zone(name=f'Zone {z}'))
+        db.session.flush()
+        for z in range(1, args.zones + 1):
+            db.session.add(Inventory(product_id=1, zone_id=z, quantity=args.stock // args.zones))
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+    initial = args.stock // args.zones * args.zones
+
+    # Compte les nouvelles tentatives effectuées par orders.with_retry
+    retries = [0]
+    original_is_retryable = orders.is_retryable
+    def counting_is_retryable(error):
+        retryable = original_is_retryable(error)
+        retries[0] += retryable
+        return retryable
+    orders.is_retryable = counting_is_retryable
+
+    samples, statuses = [], {}
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        local = []
+        for _ in range(args.orders):
+            start = time.perf_counter()
+            response = client.post('/api/orders', json={'product_id': 1, 'quantity': 1}, headers=headers)
+            local.append(time.perf_counter() - start)
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = summarize(samples, time.perf_counter() - started)
+
+    with app.app_context():
+        remaining = db.session.execute(
+            db.select(db.func.sum(Inventory.quantity)).where(Inventory.product_id == 1)
+        ).scalar()
+        reserved = db.session.execute(
+            db.select(db.func.coalesce(db.func.sum(Order.quantity), 0))
+            .where(Order.status == orders.STATUS_RESERVED)
+        ).scalar()
+
+    report({
+        'benchmark': 'orders',
+        'threads': args.threads,
+        'initial_stock': initial,
+        'final_stock': remaining,
+        'reserved': reserved,
+        'consistent': remaining == initial - reserved and remaining >= 0,
+        'retries': retries[0],
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'results': stats
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# bench_search.py
+# Recherche de produits : temps de construction de l'index et latence des requêtes de saisie
+# semi-automatique (préfixes de 1 à 6 caractères, mots multiples) sur un catalogue synthétique
+import argparse
+import random
+import time
+from common import load_app, summarize, report
+
+NAMES = ['vis', 'ecrou', 'boulon', 'rondelle', 'cheville', 'clou', 'tige', 'equerre', 'charniere',
+         'serrure', 'cable', 'gaine', 'tube', 'raccord', 'joint', 'collier', 'ruban', 'colle']
+QUALIFIERS = ['inox', 'acier', 'laiton', 'zingue', 'galvanise', 'nylon', 'cuivre', 'alu', 'pvc',
+              'noir', 'blanc', 'renforce', 'filete', 'autobloquant', 'tete', 'plate', 'ronde']
+CATEGORIES = ['Visserie', 'Quincaillerie', 'Plomberie', 'Electricite', 'Fixation', 'Outillage']
+
+def designation(rng):
+    return ' '.join([rng.choice(NAMES).capitalize()] + rng.sample(QUALIFIERS, 2)
+                    + [f'M{rng.randint(2, 20)}', f'{rng.randint(5, 200)}mm'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la recherche de produits')
+    parser.add_argument('--database-url', help='Base cible (SQLite temporaire par défaut)')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    from models import db, Category, Product
+    from search import search_index
+
+    rng = random.Random(42)
+    with app.app_context():
+        db.session.execute(db.insert(Category.__table__),
+                           [{'name': name} for name in CATEGORIES])
+        db.session.execute(db.insert(Product.__table__), [{
+            'designation': designation(rng),
+            'description': ' '.join(rng.sample(QUALIFIERS, 6)),
+            'category_id': rng.randint(1, len(CATEGORIES)),
+            'min_threshold': 0,
+            'max_threshold': 100
+        } for _ in range(args.products)])
+        db.session.commit()
+
+        start = time.perf_counter()
+        search_index.load()
+        build_seconds = time.perf_counter() - start
+
+        # Frappe progressive d'un mot puis requêtes à deux mots
+        queries = []
+        for _ in range(args.queries):
+            word = rng.choice(NAMES + QUALIFIERS)
+            queries.append(word[:rng.randint(1, 6)])
+            queries.append(f'{rng.choice(NAMES)} {rng.choice(QUALIFIERS)[:rng.randint(2, 5)]}')
+
+        results = {}
+        for label, selected in (('single', queries[0::2]), ('two_terms', queries[1::2])):
+            samples = []
+            for query in selected:
+                start = time.perf_counter()
+                search_index.search(query)
+                samples.append(time.perf_counter() - start)
+            results[label] = summarize(samples)
+
+        client = app.test_client()
+        samples = []
+        for query in queries[:args.queries]:
+            start = time.perf_counter()
+            client.get('/api/products/search', query_string={'q': query})
+            samples.append(time.perf_counter() - start)
+        results['http'] = summarize(samples)
+
+    report({
+        'benchmark': 'search',
+        'products': args.products,
+        'build_seconds': build_seconds,
+        'results': results
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
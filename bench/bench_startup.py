@@ -0,0 +1,47 @@
+# bench_startup.py
+# Temps de démarrage d'un worker : import + create_app, puis première requête,
+# mesurés dans des processus neufs
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from common import API_DIR, report
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+created = time.perf_counter()
+with app.app_context():
+    from models import db
+    db.create_all()
+response = app.test_client().get('/api/zones')
+assert response.status_code == 200
+first = time.perf_counter()
+heavy = [name for name in ('numpy', 'pyarrow') if name in sys.modules]
+print(json.dumps({'create_app': created - start, 'first_request': first - created, 'heavy_modules': heavy}))
+'''
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage d'un worker")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=API_DIR)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    results = {}
+    for key in ('create_app', 'first_request'):
+        values = [run[key] * 1000 for run in runs]
+        results[key] = {'min_ms': min(values), 'median_ms': statistics.median(values), 'max_ms': max(values)}
+    results['heavy_modules_loaded'] = sorted({name for run in runs for name in run['heavy_modules']})
+
+    report({'benchmark': 'startup', 'runs': args.runs, 'results': results}, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# bench_writebehind.py
+# Ingestion concurrente de mesures sur quelques capteurs (lignes sensors très disputées) :
+# last_reading écrit dans chaque transaction (WRITE_BEHIND_INTERVAL=0) puis en différé,
+# débit, latences, attentes de verrous (MySQL) et contrôle de la valeur finale
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+from common import load_app, summarize, report
+
+def row_lock_waits(db):
+    # Compteurs InnoDB ; non disponibles hors MySQL
+    if db.engine.dialect.name not in ('mysql', 'mariadb'):
+        return None
+    with db.engine.connect() as conn:
+        rows = dict(conn.exec_driver_sql(
+            "SHOW GLOBAL STATUS WHERE Variable_name IN ('Innodb_row_lock_waits', 'Innodb_row_lock_time')").all())
+    return {name: int(value) for name, value in rows.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'écriture différée de last_reading")
+    parser.add_argument('--database-url', help='Base cible (SQLite temporaire par défaut)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--batches', type=int, default=100, help='Lots envoyés par thread')
+    parser.add_argument('--batch-size', type=int, default=20, help='Mesures par lot')
+    parser.add_argument('--sensors', type=int, default=4, help='Capteurs partagés par tous les threads')
+    parser.add_argument('--interval', type=float, default=1.0, help='WRITE_BEHIND_INTERVAL du second passage')
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    from models import db, Zone, Sensor
+    from writebehind import buffer
+
+    with app.app_context():
+        db.session.add(Zone(name='Zone bench'))
+        db.session.flush()
+        for i in range(args.sensors):
+            db.session.add(Sensor(type='temperature', zone_id=1, status='ok'))
+        db.session.commit()
+
+    def run(label, interval, origin):
+        app.config['WRITE_BEHIND_INTERVAL'] = interval
+        samples, statuses = [], {}
+        lock = threading.Lock()
+
+        def worker(offset):
+            client = app.test_client()
+            local = []
+            for b in range(args.batches):
+                base = origin + timedelta(seconds=(b * args.threads + offset) * args.batch_size)
+                readings = [{'sensor_id': i % args.sensors + 1, 'value': 20.0,
+                             'saved_at': (base + timedelta(seconds=i)).isoformat()}
+                            for i in range(args.batch_size)]
+                start = time.perf_counter()
+                response = client.post('/api/sensors/readings', json=readings)
+                local.append(time.perf_counter() - start)
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            with lock:
+                samples.extend(local)
+
+        with app.app_context():
+            waits_before = row_lock_waits(db)
+        flushes = buffer.flushes
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = summarize(samples, time.perf_counter() - started)
+        buffer.flush()
+
+        # La dernière mesure envoyée doit se retrouver dans last_reading de chaque capteur
+        expected = origin + timedelta(seconds=args.batches * args.threads * args.batch_size - 1)
+        with app.app_context():
+            latest = db.session.execute(db.select(db.func.max(Sensor.last_reading))).scalar()
+            waits_after = row_lock_waits(db)
+        result = {
+            'interval': interval,
+            'statuses': {str(k): v for k, v in sorted(statuses.items())},
+            'flushes': buffer.flushes - flushes,
+            'consistent': latest == expected,
+            'results': stats
+        }
+        if waits_before is not None:
+            result['row_lock_waits'] = {name: waits_after[name] - waits_before[name] for name in waits_after}
+        return label, result
+
+    results = dict([
+        run('per_transaction', 0, datetime(2026, 1, 1)),
+        run('write_behind', args.interval, datetime(2026, 6, 1))
+    ])
+    report({
+        'benchmark': 'writebehind',
+        'threads': args.threads,
+        'sensors': args.sensors,
+        'batch_size': args.batch_size,
+        'results': results
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
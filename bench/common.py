@@ -0,0 +1,72 @@
+# common.py
+# Outils partagés par les benchmarks : base SQLite temporaire, chronométrage, comptage SQL
+import json
+import os
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+def load_app(database_url=None):
+    # Base SQLite jetable par défaut
+    if database_url is None:
+        fd, path = tempfile.mkstemp(prefix='stockgenius-bench-', suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    from app import create_app
+    from factory import create_base_app
+    from models import db
+    config = {'SQLALCHEMY_DATABASE_URI': database_url}
+    # Schéma créé avant create_app, qui charge les index en mémoire au démarrage
+    base = create_base_app(config)
+    with base.app_context():
+        db.drop_all()
+        db.create_all()
+        db.engine.dispose()
+    return create_app(config)
+
+class QueryCounter:
+    # Compte les requêtes SQL émises sur le moteur de db
+    def __init__(self, engine):
+        self.count = 0
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples, elapsed=None):
+    # Latences en millisecondes
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    return {
+        'requests': len(samples),
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000
+    }
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def report(results, output=None):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
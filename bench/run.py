@@ -0,0 +1,219 @@
+# run.py
+# Banc de charge de bout en bout : alimente une base locale puis sollicite chaque route
+# de l'API avec une concurrence donnée (débit, latences p50/p95/p99, requêtes SQL par appel)
+import argparse
+import itertools
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from common import load_app, percentile, report
+
+def seed(db, models, args):
+    # Insertions en masse : quelques secondes même pour des volumes importants
+    from passwords import hash_password
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    insert = lambda model, rows: db.session.execute(db.insert(model.__table__), rows) if rows else None
+
+    password_hash = hash_password('secret')
+    insert(models.User, [{
+        'username': f'user{i}', 'email': f'user{i}@example.com', 'role': 'admin' if i == 0 else 'user',
+        'password_hash': password_hash, 'rfid_card': f'CARD{i:06d}'
+    } for i in range(args.users)])
+    insert(models.Category, [{'name': f'Catégorie {i}', 'description': f'Description {i}'}
+                             for i in range(args.categories)])
+    insert(models.Zone, [{'name': f'Zone {i}', 'description': f'Description {i}'} for i in range(args.zones)])
+    insert(models.Product, [{
+        'designation': f'Produit {i}', 'description': f'Référence {i:07d}',
+        'category_id': rng.randint(1, args.categories), 'min_threshold': 10, 'max_threshold': 500,
+        'rfid_tag': f'TAG{i:08d}'
+    } for i in range(args.products + args.requests)])  # Produits supplémentaires pour DELETE
+
+    zones_per_product = min(args.zones, args.inventory_zones)
+    insert(models.Inventory, [{
+        'product_id': p, 'zone_id': z, 'quantity': rng.randint(0, 300), 'last_update_at': now
+    } for p in range(1, args.products + 1) for z in range(1, zones_per_product + 1)])
+
+    insert(models.Sensor, [{
+        'type': rng.choice(['temperature', 'humidity', 'weight']), 'zone_id': rng.randint(1, args.zones),
+        'status': 'online', 'last_reading': now
+    } for _ in range(args.sensors)])
+    if args.sensors:
+        from sensors import ingest_readings
+        ingest_readings([{
+            'sensor_id': i % args.sensors + 1,
+            'value': f'{rng.uniform(0, 30):.2f}',
+            'saved_at': (now - timedelta(seconds=30 * i)).isoformat()
+        } for i in range(args.readings)])
+
+    insert(models.Order, [{
+        'product_id': rng.randint(1, args.products), 'quantity': rng.randint(1, 20), 'status': 'delivered',
+        'created_at': now - timedelta(days=rng.randint(0, 90)), 'user_id': rng.randint(1, args.users)
+    } for _ in range(args.orders)])
+    db.session.commit()
+
+def scenarios(args, token):
+    auth = {'Authorization': f'Bearer {token}'}
+    counter = itertools.count()
+    deletable = itertools.count(args.products + 1)
+    returnable = itertools.count(1)  # Commandes livrées du jeu de données, retournées une seule fois
+    rng = random.Random(7)
+    product = lambda: rng.randint(1, args.products)
+    zone = lambda: rng.randint(1, args.zones)
+    tag = lambda: f'TAG{product() - 1:08d}'
+
+    # nom -> (méthode, fonction renvoyant (url, json, en-têtes))
+    return {
+        'login': ('POST', lambda: ('/api/auth/login', {'username': f'user{rng.randrange(args.users)}', 'password': 'secret'}, None)),
+        'register': ('POST', lambda: ('/api/auth/register', {'username': f'bench{next(counter)}', 'email': f'bench{next(counter)}@example.com', 'password': 'secret'}, None)),
+        'protected': ('GET', lambda: ('/api/protected', None, auth)),
+        'users.list': ('GET', lambda: ('/api/users', None, None)),
+        'users.create': ('POST', lambda: ('/api/users', {'username': f'created{next(counter)}', 'email': f'created{next(counter)}@example.com', 'password': 'secret', 'role': 'user'}, None)),
+        'products.list': ('GET', lambda: ('/api/products?limit=500', None, None)),
+        'products.stream': ('GET', lambda: ('/api/products?stream=ndjson&fields=id,designation,rfid_tag', None, None)),
+        'products.create': ('POST', lambda: ('/api/products', {'designation': f'Nouveau {next(counter)}', 'category_id': 1, 'min_threshold': 1, 'max_threshold': 100}, None)),
+        'products.update': ('PUT', lambda: (f'/api/products/{product()}', {'max_threshold': 600}, auth)),
+        'products.delete': ('DELETE', lambda: (f'/api/products/{next(deletable)}', None, auth)),
+        'categories.list': ('GET', lambda: ('/api/categories', None, None)),
+        'categories.create': ('POST', lambda: ('/api/categories', {'name': f'Bench {next(counter)}'}, None)),
+        'zones.list': ('GET', lambda: ('/api/zones', None, None)),
+        'zones.create': ('POST', lambda: ('/api/zones', {'name': f'Bench {next(counter)}'}, None)),
+        'inventory.list': ('GET', lambda: ('/api/inventory?limit=500', None, None)),
+        'inventory.filtered': ('GET', lambda: (f'/api/inventory?zone_id={zone()}&below_min=1&limit=500', None, None)),
+        'inventory.create': ('POST', lambda: ('/api/inventory', {'product_id': product(), 'zone_id': zone(), 'quantity': rng.randint(0, 300)}, None)),
+        'inventory.batch': ('POST', lambda: ('/api/inventory/batch', [{'product_id': product(), 'zone_id': zone(), 'quantity': rng.randint(0, 300)} for _ in range(100)], None)),
+        'alerts.list': ('GET', lambda: ('/api/alerts?status=open', None, None)),
+        'sensors.readings': ('POST', lambda: ('/api/sensors/readings', [{'sensor_id': rng.randint(1, args.sensors), 'value': rng.uniform(0, 30)} for _ in range(100)], None)),
+        'sensors.series': ('GET', lambda: (f'/api/sensors/{rng.randint(1, args.sensors)}/series', None, None)),
+        'predictions': ('GET', lambda: ('/api/predictions?period=daily', None, None)),
+        'products.search': ('GET', lambda: (f'/api/products/search?q=produit {rng.randint(1, 999)}', None, None)),
+        'cache.versions': ('GET', lambda: ('/api/cache/versions', None, None)),
+        'inventory.as_of': ('GET', lambda: (f'/api/inventory?as_of={datetime.utcnow().isoformat()}&zone_id={zone()}&limit=500', None, None)),
+        'stock.summary': ('GET', lambda: ('/api/stock/summary?limit=500', None, None)),
+        'stock.check': ('POST', lambda: ('/api/stock/check', None, auth)),
+        'orders.list': ('GET', lambda: (f'/api/orders?product_id={product()}', None, None)),
+        'orders.create': ('POST', lambda: ('/api/orders', {'product_id': product(), 'quantity': 1}, auth)),
+        'orders.transition': ('POST', lambda: ('/api/orders/transition', {'order_ids': [next(returnable) for _ in range(10)], 'status': 'returned'}, auth)),
+        'alerts.reconcile': ('POST', lambda: ('/api/alerts/reconcile', None, auth)),
+        'rfid.scans': ('POST', lambda: ('/api/rfid/scans', {'zone_id': zone(), 'scans': [{'tag': tag(), 'direction': rng.choice(['in', 'out'])} for _ in range(100)]}, None)),
+        'sensors.stats': ('GET', lambda: (f'/api/sensors/{rng.randint(1, args.sensors)}/stats', None, None)),
+        'export.inventory': ('GET', lambda: (f'/api/export/inventory?format=csv&zone_id={zone()}', None, auth)),
+        'jobs.submit': ('POST', lambda: ('/api/jobs', {'type': 'stock.check'}, auth)),
+        'jobs.list': ('GET', lambda: ('/api/jobs?limit=100', None, auth)),
+    }
+
+def drive(app, method, build, requests, concurrency, queries):
+    latencies = []
+    statuses = {}
+    query_counts = []
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        client = app.test_client()
+        local_latencies, local_statuses, local_queries = [], {}, []
+        while next(remaining) < requests:
+            with lock:
+                url, body, headers = build()
+            before = getattr(queries, 'count', 0)
+            start = time.perf_counter()
+            response = client.open(url, method=method, json=body, headers=headers)
+            response.get_data()  # Consommer les réponses en flux
+            local_latencies.append(time.perf_counter() - start)
+            local_queries.append(getattr(queries, 'count', 0) - before)
+            local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            query_counts.extend(local_queries)
+            for status, n in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + n
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries_per_request': sum(query_counts) / len(query_counts) if query_counts else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())}
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge de l'API StockGenius")
+    parser.add_argument('--database-url', help='Base cible (SQLite temporaire par défaut)')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--inventory-zones', type=int, default=4, help='Zones stockées par produit')
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--readings', type=int, default=50000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200, help='Requêtes par route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--routes', help='Routes à exécuter, séparées par des virgules (toutes par défaut)')
+    parser.add_argument('--password-hash-method', default='pbkdf2:sha256:100000')
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    app.config['PASSWORD_HASH_METHOD'] = args.password_hash_method
+    import models
+    from models import db
+    from sqlalchemy import event
+
+    started = time.perf_counter()
+    with app.app_context():
+        seed(db, models, args)
+        # Compteur de requêtes SQL par thread (un thread = un client)
+        queries = threading.local()
+        def count_query(*_):
+            queries.count = getattr(queries, 'count', 0) + 1
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+    seed_seconds = time.perf_counter() - started
+
+    client = app.test_client()
+    token = client.post('/api/auth/login', json={'username': 'user0', 'password': 'secret'}).json['access_token']
+    available = scenarios(args, token)
+    selected = args.routes.split(',') if args.routes else list(available)
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        parser.error(f"Routes inconnues : {', '.join(unknown)}")
+
+    results = {}
+    for name in selected:
+        method, build = available[name]
+        results[name] = drive(app, method, build, args.requests, args.concurrency, queries)
+
+    report({
+        'benchmark': 'api',
+        'started_at': datetime.utcnow().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'database_url')},
+        'seed_seconds': seed_seconds,
+        'results': results
+    }, args.output)
+
+if __name__ == '__main__':
+    main()
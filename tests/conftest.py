@@ -0,0 +1,58 @@
+# conftest.py
+# Application de test sur une base SQLite temporaire, schéma créé par les migrations
+import os
+import sys
+
+import pytest
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api'))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    from app import create_app
+    from models import db, Category, Product, Zone, Inventory, Sensor, User
+    from rfid import tag_index
+    import migrations
+
+    tmp = tmp_path_factory.mktemp('stockgenius')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp / 'test.db'}",
+        # Pas de threads : tâches et écritures différées désactivées
+        'JOBS_ENABLED': False,
+        'WRITE_BEHIND_INTERVAL': 0,
+        'ANOMALY_CHECKPOINT': '',
+        'EXPORT_DIR': str(tmp / 'exports'),
+        'SENSOR_ARCHIVE_DIR': str(tmp / 'archives')
+    })
+    with app.app_context():
+        migrations.upgrade()
+        category = Category(name='Cat', description='d')
+        db.session.add(category)
+        db.session.flush()
+        for i in range(1, 4):
+            db.session.add(Product(designation=f'Produit {i}', category_id=category.id,
+                                   min_threshold=1, max_threshold=100, rfid_tag=f'TAG{i}'))
+            db.session.add(Zone(name=f'Z{i}'))
+        db.session.flush()
+        for i in range(1, 4):
+            db.session.add(Inventory(product_id=i, zone_id=1, quantity=2))
+        db.session.add(Sensor(type='temperature', zone_id=1, status='ok'))
+        user = User(username='admin', email='admin@example.com', role='admin')
+        user.password = 'pw'
+        db.session.add(user)
+        db.session.commit()
+        tag_index.load()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture(scope='module')
+def client(app):
+    return app.test_client()
+
+@pytest.fixture(scope='module')
+def admin(client):
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'pw'})
+    return {'Authorization': 'Bearer ' + response.json['access_token']}
@@ -0,0 +1,117 @@
+# test_api.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, SensorData
+
+def test_migrations_index_plans(app):
+    import migrations
+    with app.app_context():
+        assert all(entry['applied_at'] for entry in migrations.status())
+        results = migrations.check()
+    assert results
+    for result in results:
+        assert result['uses_index'], (result['query'], result['plan'])
+
+def test_non_finite_sensor_values(app, client):
+    readings = [{'sensor_id': 1, 'value': value} for value in ('nan', '1.5', 'inf', '-Infinity', '2.5')]
+    response = client.post('/api/sensors/readings', json=readings)
+    assert response.status_code == 201
+    with app.app_context():
+        rows = db.session.execute(db.select(SensorData.value, SensorData.numeric_value)).all()
+    assert {value: numeric for value, numeric in rows} == {
+        'nan': None, '1.5': 1.5, 'inf': None, '-Infinity': None, '2.5': 2.5}
+    # Le détecteur (moyenne glissante) ne voit que les valeurs finies
+    stats = client.get('/api/sensors/1/stats').json['stats']
+    assert stats['count'] == 2
+    assert 1.5 <= stats['mean'] <= 2.5
+
+@pytest.mark.parametrize('job_type, params', [
+    ('export', {'dataset': 'nope'}),
+    ('export', {'dataset': 'inventory', 'bogus': 1}),
+    ('export', {'dataset': 'inventory', 'format': 'xml'}),
+    ('export', {'dataset': 'inventory', 'start': 'hier'}),
+    ('export', {'dataset': 'inventory', 'sensor_id': 1}),
+    ('forecast', {'period': 'weird'}),
+    ('forecast', {'horizon': 0}),
+    ('forecast', {'history': 'x'}),
+    ('nope', {})
+])
+def test_job_params_rejected_at_submit(client, admin, job_type, params):
+    response = client.post('/api/jobs', json={'type': job_type, 'params': params}, headers=admin)
+    assert response.status_code == 400, response.json
+    assert response.json['error']
+
+def test_job_valid_params_accepted(client, admin):
+    response = client.post('/api/jobs', json={'type': 'export', 'params': {'dataset': 'inventory'}},
+                           headers=admin)
+    assert response.status_code == 202, response.json
+    assert response.json['status'] == 'queued'
+
+def scan_batch(zone_id, read_at, scans, direction='in'):
+    return {'zone_id': zone_id, 'direction': direction, 'read_at': read_at.isoformat(), 'scans': scans}
+
+def zone_quantity(client, product_id, zone_id):
+    lines = client.get(f'/api/inventory?product_id={product_id}').json
+    return sum(line['quantity'] for line in lines if line['zone_id'] == zone_id)
+
+def test_rfid_reports_applied_quantities(client):
+    # Sortie plus grande que le stock : la quantité est bornée à 0 et la réponse l'indique
+    read_at = datetime(2026, 1, 1)
+    scans = [{'tag': 'TAG2', 'read_at': (read_at + timedelta(minutes=i)).isoformat()} for i in range(5)]
+    response = client.post('/api/rfid/scans', json=scan_batch(1, read_at, scans, 'out'))
+    assert response.status_code == 200, response.json
+    assert response.json['deltas'] == [{'product_id': 2, 'zone_id': 1, 'delta': -2}]
+    assert zone_quantity(client, 2, 1) == 0
+
+def test_rfid_unknown_zone_retry_is_counted(client):
+    read_at = datetime(2026, 2, 1)
+    response = client.post('/api/rfid/scans', json=scan_batch(99, read_at, [{'tag': 'TAG3'}]))
+    assert response.json['unknown_zones'] == [99]
+    assert response.json['deltas'] == []
+    # Même lecture renvoyée avec la bonne zone dans la fenêtre de dédoublonnage
+    response = client.post('/api/rfid/scans', json=scan_batch(2, read_at + timedelta(seconds=1), [{'tag': 'TAG3'}]))
+    assert response.json['duplicates'] == 0
+    assert response.json['deltas'] == [{'product_id': 3, 'zone_id': 2, 'delta': 1}]
+    # Puis la même lecture une seconde fois : doublon
+    response = client.post('/api/rfid/scans', json=scan_batch(2, read_at + timedelta(seconds=2), [{'tag': 'TAG3'}]))
+    assert response.json['duplicates'] == 1
+    assert response.json['deltas'] == []
+
+def test_order_transition_status_codes(client, admin):
+    response = client.post('/api/orders', json={'product_id': 1, 'quantity': 1, 'zone_id': 1}, headers=admin)
+    assert response.status_code == 201, response.json
+    order_id = response.json['order']['id']
+    assert client.post(f'/api/orders/{order_id}/deliver', headers=admin).status_code == 200
+    assert client.post(f'/api/orders/{order_id}/cancel', headers=admin).status_code == 409
+    assert client.post('/api/orders/9999/deliver', headers=admin).status_code == 404
+    results = client.post('/api/orders/transition', json={'order_ids': [order_id, 9999], 'status': 'returned'},
+                          headers=admin).json['results']
+    assert [result.get('code') for result in results] == [None, 'not_found']
+
+def test_delete_sensor_with_large_history_runs_as_job(app, client, admin):
+    import retention
+    from models import Sensor
+    with app.app_context():
+        small = Sensor(type='humidity', zone_id=1, status='ok')
+        large = Sensor(type='humidity', zone_id=1, status='ok')
+        db.session.add_all([small, large])
+        db.session.flush()
+        small_id, large_id = small.id, large.id
+        saved_at = datetime(2026, 1, 1)
+        db.session.execute(db.insert(SensorData.__table__), [
+            {'sensor_id': large_id, 'value': '1', 'numeric_value': 1.0, 'saved_at': saved_at + timedelta(seconds=i)}
+            for i in range(retention.CHUNK_SIZE + 1)])
+        db.session.add(SensorData(sensor_id=small_id, value='1', numeric_value=1.0, saved_at=saved_at))
+        db.session.commit()
+
+    response = client.delete(f'/api/sensors/{small_id}', headers=admin)
+    assert response.status_code == 200
+    assert response.json['readings_deleted'] == 1
+
+    response = client.delete(f'/api/sensors/{large_id}', headers=admin)
+    assert response.status_code == 202
+    assert response.json['type'] == 'sensor.purge'
+    with app.app_context():
+        assert retention.count_readings(large_id) == retention.CHUNK_SIZE + 1